@@ -0,0 +1,272 @@
+"""
+Crop Recommendation Model - Bulk Scoring CLI
+Stream large CSV/Parquet soil surveys through the crop model in bounded
+chunks across a process pool, appending results as they complete
+
+Usage:
+    python bulk_predict.py survey.csv scored.csv [--workers 4] [--chunk-size 50000] [--top-k 3]
+    python bulk_predict.py survey.parquet scored.parquet
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from crop_engine import CropInferenceEngine, FEATURES
+from crop_versions import resolve_model
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), 'models')
+
+# Same setting the API serves by ("best" or "compact")
+CROP_MODEL_VARIANT = os.getenv("CROP_MODEL_VARIANT", "best")
+
+# Per-worker engine, created once by the pool initializer
+_engine = None
+
+
+def load_engine(models_dir=MODELS_DIR, backend='auto', n_jobs=None, variant=None):
+    """
+    Load the crop model behind a CropInferenceEngine
+
+    The model is resolved like the API does: the CURRENT version (else the
+    flat models/ directory) and CROP_MODEL_VARIANT, falling back to best.
+    Its compiled trees and joblib model give the same answers (see
+    tree_ensemble.py). 'auto' prefers XGBoost when it is installed, since
+    its native batch predict has the higher rows/s; otherwise it uses the
+    compiled trees the API serves.
+    """
+    _, _, files = resolve_model(models_dir, variant or CROP_MODEL_VARIANT)
+    if backend == 'auto':
+        try:
+            import xgboost  # noqa: F401
+            backend = 'joblib'
+        except ImportError:
+            backend = 'compiled'
+
+    if backend == 'compiled' and os.path.exists(files['compiled']):
+        from tree_ensemble import CompiledTreeEnsemble
+        model = CompiledTreeEnsemble.load(files['compiled'])
+        return CropInferenceEngine(model, model.classes_, FEATURES)
+
+    import joblib
+    model = joblib.load(files['joblib'])
+    if n_jobs is not None and hasattr(model, 'set_params'):
+        model.set_params(n_jobs=n_jobs)
+    label_encoder = joblib.load(files['label_encoder'])
+    return CropInferenceEngine(model, label_encoder.classes_, FEATURES)
+
+
+def _init_worker(models_dir, backend, variant):
+    global _engine
+    # Parallelism comes from the pool; one model thread per worker
+    _engine = load_engine(models_dir, backend, n_jobs=1, variant=variant)
+
+
+def score_chunk(X, top_k=1):
+    """
+    Score one feature matrix in the worker
+
+    Returns:
+        dict: column name -> array; rows with missing values get empty labels
+    """
+    X = np.asarray(X, dtype=np.float64)
+    valid = np.isfinite(X).all(axis=1)
+
+    top_k = max(1, min(top_k, len(_engine.crops)))
+    crops = np.asarray(_engine.crops, dtype=object)
+    columns = {}
+
+    probabilities = _engine.predict_proba(X[valid]) if valid.any() else np.empty((0, len(crops)))
+    ranked = np.argsort(-probabilities, axis=1)[:, :top_k]
+
+    for k in range(top_k):
+        suffix = '' if k == 0 else f'_{k + 1}'
+        labels = np.full(len(X), '', dtype=object)
+        confidence = np.full(len(X), np.nan)
+        labels[valid] = crops[ranked[:, k]]
+        confidence[valid] = np.round(probabilities[np.arange(len(ranked)), ranked[:, k]].astype(np.float64) * 100, 2)
+        columns[f'predicted_crop{suffix}'] = labels
+        columns[f'confidence{suffix}'] = confidence
+    return columns
+
+
+def iter_chunks(input_path, chunk_size):
+    """Yield DataFrames of at most chunk_size rows from CSV or Parquet"""
+    if input_path.lower().endswith(('.parquet', '.pq')):
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(input_path)
+        for batch in parquet.iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(input_path, chunksize=chunk_size)
+
+
+class ChunkWriter:
+    """Append scored chunks to CSV or Parquet without holding them in memory"""
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.is_parquet = output_path.lower().endswith(('.parquet', '.pq'))
+        self._parquet_writer = None
+        self._schema = None
+        self._wrote_header = False
+
+    def write(self, df):
+        if self.is_parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            # Features as the model saw them (non-numeric -> NaN), whatever a chunk inferred
+            df = df.copy()
+            for name in FEATURES:
+                if name in df.columns:
+                    df[name] = pd.to_numeric(df[name], errors='coerce').astype(np.float64)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._schema = self._writer_schema(table.schema)
+                self._parquet_writer = pq.ParquetWriter(self.output_path, self._schema)
+            self._parquet_writer.write_table(self._conform(df, table))
+        else:
+            df.to_csv(self.output_path, mode='a' if self._wrote_header else 'w',
+                      header=not self._wrote_header, index=False)
+            self._wrote_header = True
+
+    def _conform(self, df, table):
+        """
+        Cast a chunk to the writer schema column by column
+
+        A passthrough column that no longer fits (e.g. text in a column the
+        first chunk inferred as numbers) is coerced: unparseable numbers
+        become null, string columns take the values' string form, and other
+        types are written as null for that chunk.
+        """
+        import pyarrow as pa
+
+        columns = []
+        for field in self._schema:
+            column = table.column(field.name)
+            try:
+                columns.append(column.cast(field.type))
+                continue
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+                pass
+            print(f"\n  [WARN] column '{field.name}' does not match its first-chunk type; coercing",
+                  file=sys.stderr)
+            if pa.types.is_floating(field.type):
+                values = pd.to_numeric(df[field.name], errors='coerce')
+                columns.append(pa.array(values, type=field.type, from_pandas=True))
+            elif pa.types.is_string(field.type):
+                values = df[field.name].map(lambda v: None if pd.isna(v) else str(v))
+                columns.append(pa.array(values, type=field.type, from_pandas=True))
+            else:
+                columns.append(pa.nulls(len(df), field.type))
+        return pa.Table.from_arrays(columns, schema=self._schema)
+
+    @staticmethod
+    def _writer_schema(schema):
+        """
+        Widen the first chunk's inferred schema so later chunks cast into it
+
+        CSV chunks infer dtypes independently: an int column turns float once
+        a later chunk has a blank, and an all-empty column infers null. Ints
+        and nulls are written as float64 and string respectively.
+        """
+        import pyarrow as pa
+
+        fields = []
+        for field in schema:
+            if pa.types.is_integer(field.type):
+                field = field.with_type(pa.float64())
+            elif pa.types.is_null(field.type):
+                field = field.with_type(pa.string())
+            fields.append(field)
+        return pa.schema(fields)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def bulk_predict(input_path, output_path, workers=None, chunk_size=50000, top_k=1,
+                 models_dir=MODELS_DIR, backend='auto', max_pending=None, variant=None):
+    """
+    Score a file chunk by chunk; output rows keep input order
+
+    At most max_pending chunks are in flight, so memory stays bounded
+    regardless of input size.
+
+    Returns:
+        dict: rows scored, elapsed seconds and rows/s
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+    writer = ChunkWriter(output_path)
+    pending = deque()
+    total_rows = 0
+    start = time.perf_counter()
+
+    def _drain_one():
+        nonlocal total_rows
+        frame, future = pending.popleft()
+        for name, values in future.result().items():
+            frame[name] = values
+        writer.write(frame)
+        total_rows += len(frame)
+        elapsed = time.perf_counter() - start
+        print(f"\r  {total_rows:,} rows | {total_rows / max(elapsed, 1e-9):,.0f} rows/s",
+              end='', file=sys.stderr, flush=True)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(models_dir, backend, variant)) as pool:
+            for frame in iter_chunks(input_path, chunk_size):
+                missing = [c for c in FEATURES if c not in frame.columns]
+                if missing:
+                    raise ValueError(f"Input missing columns: {', '.join(missing)}")
+
+                X = frame[FEATURES].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+                pending.append((frame, pool.submit(score_chunk, X, top_k)))
+
+                while len(pending) >= max_pending:
+                    _drain_one()
+            while pending:
+                _drain_one()
+    finally:
+        writer.close()
+        print(file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    return {
+        'rows': total_rows,
+        'seconds': round(elapsed, 2),
+        'rows_per_second': round(total_rows / max(elapsed, 1e-9), 1)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-score soil survey files with the crop model")
+    parser.add_argument("input",                                     help="Input .csv or .parquet")
+    parser.add_argument("output",                                    help="Output .csv or .parquet")
+    parser.add_argument("--workers",    type=int, default=None,      help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=50000,     help="Rows per chunk")
+    parser.add_argument("--top-k",      type=int, default=1,         help="Ranked crops per row")
+    parser.add_argument("--models-dir", type=str, default=MODELS_DIR, help="Directory with the trained model")
+    parser.add_argument("--backend",    type=str, default="auto",    choices=["auto", "compiled", "joblib"],
+                        help="Model backend (auto: XGBoost if installed, else compiled trees)")
+    parser.add_argument("--variant",    type=str, default=CROP_MODEL_VARIANT, choices=["best", "compact"],
+                        help="Model variant (default: CROP_MODEL_VARIANT, as the API)")
+    args = parser.parse_args()
+
+    version, model_dir, files = resolve_model(args.models_dir, args.variant)
+    print(f"Scoring {args.input} -> {args.output} with the '{files['variant']}' model "
+          f"of version {version or 'unversioned'} ({model_dir})")
+    stats = bulk_predict(args.input, args.output, workers=args.workers, chunk_size=args.chunk_size,
+                         top_k=args.top_k, models_dir=args.models_dir, backend=args.backend,
+                         variant=args.variant)
+    print(f"Done: {stats['rows']:,} rows in {stats['seconds']}s ({stats['rows_per_second']:,.0f} rows/s)")
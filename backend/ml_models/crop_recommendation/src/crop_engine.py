@@ -0,0 +1,181 @@
+"""
+Crop Recommendation Model - Inference Engine
+Single-pass top-k recommendations shared by CropRecommender and the API
+"""
+
+import numpy as np
+
+FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Simplified yield estimates (quintals/acre)
+YIELD_MAP = {
+    'rice': '45-55 quintals/acre',
+    'maize': '28-35 quintals/acre',
+    'chickpea': '12-15 quintals/acre',
+    'kidneybeans': '8-12 quintals/acre',
+    'pigeonpeas': '10-14 quintals/acre',
+    'mothbeans': '6-10 quintals/acre',
+    'mungbean': '8-12 quintals/acre',
+    'blackgram': '8-12 quintals/acre',
+    'lentil': '10-14 quintals/acre',
+    'pomegranate': '80-120 quintals/acre',
+    'banana': '200-300 quintals/acre',
+    'mango': '40-60 quintals/acre',
+    'grapes': '80-120 quintals/acre',
+    'watermelon': '150-200 quintals/acre',
+    'muskmelon': '100-150 quintals/acre',
+    'apple': '60-100 quintals/acre',
+    'orange': '80-120 quintals/acre',
+    'papaya': '150-200 quintals/acre',
+    'coconut': '60-80 nuts/tree/year',
+    'cotton': '18-22 quintals/acre',
+    'jute': '20-25 quintals/acre',
+    'coffee': '8-12 quintals/acre'
+}
+
+
+class CropInferenceEngine:
+    def __init__(self, model, crops, features=None):
+        """
+        Wrap a loaded crop model for top-k recommendation
+
+        Args:
+            model: Any object exposing predict_proba (XGBoost, sklearn,
+                   or CompiledTreeEnsemble)
+            crops: Crop names in the model's class order
+            features: Feature names in the model's column order
+        """
+        self.model = model
+        self.crops = [str(c) for c in crops]
+        self.features = list(features or FEATURES)
+        self._col = {name: i for i, name in enumerate(self.features)}
+
+    def predict_proba(self, X):
+        """
+        Run one predict_proba pass over a feature matrix
+
+        Args:
+            X: (n_rows, n_features) array-like in self.features order
+
+        Returns:
+            np.ndarray: (n_rows, n_crops) probabilities
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(self.features))
+        return np.asarray(self.model.predict_proba(X))
+
+    def recommend(self, row, top_k=3):
+        """Top-k recommendations for one feature row (single model pass)"""
+        row = np.asarray(row, dtype=np.float64).ravel()
+        return self.recommend_from_proba(row, self.predict_proba(row)[0], top_k)
+
+    def recommend_from_proba(self, row, probabilities, top_k=3):
+        """
+        Build the recommendation payload from an already computed row
+
+        Args:
+            row: Feature values in self.features order
+            probabilities: Class probabilities for that row
+            top_k: Number of top recommendations
+
+        Returns:
+            Dictionary with recommendations
+        """
+        top_k = max(1, min(int(top_k), len(self.crops)))
+
+        # argpartition keeps top-k selection O(n_crops)
+        top_indices = np.argpartition(probabilities, -top_k)[-top_k:]
+        top_indices = top_indices[np.argsort(probabilities[top_indices])[::-1]]
+
+        recommendations = []
+        for idx in top_indices:
+            crop_name = self.crops[idx]
+            confidence = float(probabilities[idx])
+
+            recommendations.append({
+                'crop_name': crop_name,
+                'confidence': confidence,
+                'expected_yield': self.get_yield_info(crop_name),
+                'market_potential': self.get_market_potential(confidence),
+                'reasons': self.get_reasons(crop_name, row, confidence)
+            })
+
+        return {
+            'recommended_crops': recommendations,
+            'confidence_score': float(probabilities[top_indices[0]]),
+            'reasoning': self.generate_reasoning(row, recommendations),
+            'sources': ["ML Model Prediction", "Agricultural Guidelines", "Historical Data"],
+            'assumptions': [
+                "Based on provided soil and climate parameters",
+                "Assuming standard farming practices",
+                "Market conditions may vary by region",
+                "Consult local agricultural experts for final decision"
+            ]
+        }
+
+    def _value(self, row, name):
+        return float(row[self._col[name]])
+
+    def get_yield_info(self, crop_name):
+        """Get expected yield information"""
+        return YIELD_MAP.get(crop_name.lower(), '10-15 quintals/acre')
+
+    def get_market_potential(self, confidence):
+        """Determine market potential based on confidence"""
+        if confidence > 0.8:
+            return "Very High"
+        elif confidence > 0.6:
+            return "High"
+        elif confidence > 0.4:
+            return "Good"
+        else:
+            return "Moderate"
+
+    def get_reasons(self, crop_name, row, confidence):
+        """Generate reasons for recommendation"""
+        reasons = []
+
+        # Confidence-based reason
+        if confidence > 0.7:
+            reasons.append(f"Excellent match for your soil and climate conditions")
+        elif confidence > 0.5:
+            reasons.append(f"Good compatibility with your parameters")
+        else:
+            reasons.append(f"Suitable option for your conditions")
+
+        # NPK-based reasons
+        N, P, K = self._value(row, 'N'), self._value(row, 'P'), self._value(row, 'K')
+        if N > 70:
+            reasons.append(f"High nitrogen content supports {crop_name} growth")
+        if P > 50:
+            reasons.append(f"Good phosphorus levels for root development")
+        if K > 40:
+            reasons.append(f"Adequate potassium for disease resistance")
+
+        # Climate-based reasons
+        temp = self._value(row, 'temperature')
+        if 20 <= temp <= 30:
+            reasons.append(f"Optimal temperature range for {crop_name}")
+
+        rainfall = self._value(row, 'rainfall')
+        if rainfall > 200:
+            reasons.append(f"High rainfall suitable for water-intensive crop")
+        elif rainfall < 100:
+            reasons.append(f"Low water requirement matches rainfall pattern")
+
+        return reasons[:3]  # Return top 3 reasons
+
+    def generate_reasoning(self, row, recommendations):
+        """Generate overall reasoning"""
+        top_crop = recommendations[0]['crop_name']
+        confidence = recommendations[0]['confidence']
+
+        N, P, K = self._value(row, 'N'), self._value(row, 'P'), self._value(row, 'K')
+        temp = self._value(row, 'temperature')
+        rainfall = self._value(row, 'rainfall')
+
+        reasoning = f"Based on your soil parameters (N:{N:.0f}, P:{P:.0f}, K:{K:.0f}, pH:{self._value(row, 'ph'):.1f}) "
+        reasoning += f"and climate conditions (Temp:{temp:.1f}°C, Humidity:{self._value(row, 'humidity'):.0f}%, "
+        reasoning += f"Rainfall:{rainfall:.0f}mm), {top_crop} is the most suitable crop with {confidence*100:.1f}% confidence. "
+        reasoning += f"The soil nutrient levels and climate parameters align well with {top_crop} requirements."
+
+        return reasoning
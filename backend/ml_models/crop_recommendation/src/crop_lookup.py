@@ -0,0 +1,234 @@
+"""
+Crop Recommendation Model - Precomputed Lookup Table
+Evaluate the trained model once over a grid of the 7 input features and
+serve answers from a memory-mapped .npy table in O(1)
+
+The table belongs to one model file: train.py --lookup builds it from the
+best model of the version it publishes, and this script (re)builds it
+inside the current version directory (or --version) from that version's
+--variant. The backend serves it only when its recorded file name and
+checksum match the model variant being served.
+A running server picks it up on its next version load.
+
+Usage:
+    python crop_lookup.py [--points 8] [--grid "rainfall=16,ph=12"] [--version 20260130_000329] [--variant compact]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+TABLE_DTYPE = np.dtype([('crop', 'u1'), ('confidence', 'f4')])
+
+# Rows evaluated per model call while building
+BUILD_CHUNK = 65536
+
+# Files that make up a table, published alongside the model files
+TABLE_FILE = 'crop_lookup_table.npy'
+META_FILE = 'crop_lookup_meta.json'
+LOOKUP_FILES = [TABLE_FILE, META_FILE]
+
+
+def file_checksum(path):
+    """SHA-256 of a model file; ties a table to the exact model it was computed from"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_lookup_table(model, classes, lows, highs, points, table_path, meta_path,
+                       features=None, source_model=None, source_sha256=None):
+    """
+    Evaluate a model on a regular grid and write the lookup table
+
+    Args:
+        model: Object exposing predict_proba
+        classes: Crop names in the model's class order
+        lows, highs: Per-feature grid bounds
+        points: Per-feature number of grid points
+        table_path: Output .npy (structured: crop index + confidence)
+        meta_path: Output JSON with grid axes and class names
+        source_model, source_sha256: File name and checksum of the model
+            file, checked by the backend before it serves the table
+
+    Returns:
+        dict: Table metadata
+    """
+    features = list(features or FEATURES)
+    if len(classes) > np.iinfo(TABLE_DTYPE['crop']).max + 1:
+        raise ValueError(f"Too many classes for lookup table: {len(classes)}")
+
+    shape = tuple(int(n) for n in points)
+    axes = [np.linspace(lo, hi, n) for lo, hi, n in zip(lows, highs, shape)]
+    n_cells = int(np.prod(shape))
+
+    # open_memmap writes straight to disk; memory stays at one chunk
+    table = np.lib.format.open_memmap(table_path, mode='w+', dtype=TABLE_DTYPE, shape=shape)
+    flat = table.reshape(-1)
+
+    for start in range(0, n_cells, BUILD_CHUNK):
+        cells = np.arange(start, min(start + BUILD_CHUNK, n_cells))
+        coords = np.unravel_index(cells, shape)
+        X = np.column_stack([axis[c] for axis, c in zip(axes, coords)])
+
+        probabilities = np.asarray(model.predict_proba(X))
+        best = probabilities.argmax(axis=1)
+        flat['crop'][start:start + len(cells)] = best
+        flat['confidence'][start:start + len(cells)] = probabilities[np.arange(len(best)), best]
+
+    table.flush()
+    del table
+
+    meta = {
+        'features': features,
+        'lows': [float(v) for v in lows],
+        'highs': [float(v) for v in highs],
+        'points': list(shape),
+        'classes': [str(c) for c in classes],
+        'table': os.path.basename(table_path),
+        'source_model': source_model,
+        'source_sha256': source_sha256,
+        'timestamp': datetime.now().strftime("%Y%m%d_%H%M%S"),
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class CropLookupTable:
+    """Nearest-grid-point lookup over a memory-mapped table"""
+
+    def __init__(self, meta_path):
+        with open(meta_path, 'r') as f:
+            self.meta = json.load(f)
+
+        table_path = os.path.join(os.path.dirname(meta_path), self.meta['table'])
+        self.table = np.load(table_path, mmap_mode='r')
+        self.flat = self.table.reshape(-1)
+
+        self.features = self.meta['features']
+        self.classes = np.asarray(self.meta['classes'])
+        self.lows = np.asarray(self.meta['lows'], dtype=np.float64)
+        self.highs = np.asarray(self.meta['highs'], dtype=np.float64)
+        self.points = np.asarray(self.meta['points'], dtype=np.int64)
+        self.steps = np.where(self.points > 1, (self.highs - self.lows) / np.maximum(self.points - 1, 1), 1.0)
+        self.strides = np.asarray([int(np.prod(self.points[i + 1:])) for i in range(len(self.points))],
+                                  dtype=np.int64)
+
+    def matches(self, model_path):
+        """True when the table was computed from exactly this model file"""
+        return (self.meta.get('source_model') == os.path.basename(model_path)
+                and self.meta.get('source_sha256') is not None
+                and os.path.exists(model_path)
+                and file_checksum(model_path) == self.meta['source_sha256'])
+
+    def lookup(self, X):
+        """
+        Look up rows in the table
+
+        Args:
+            X: (n_rows, 7) features in self.features order
+
+        Returns:
+            tuple: (crop index, confidence, in-grid mask); entries outside
+                   the grid are left at 0 and must be answered by the model
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(self.features))
+        in_grid = np.all((X >= self.lows) & (X <= self.highs), axis=1)
+
+        cell = np.rint((np.where(in_grid[:, None], X, self.lows) - self.lows) / self.steps).astype(np.int64)
+        cell = np.clip(cell, 0, self.points - 1)
+        entries = self.flat[cell @ self.strides]
+
+        crop_idx = np.where(in_grid, entries['crop'], 0)
+        confidence = np.where(in_grid, entries['confidence'], 0.0)
+        return crop_idx, confidence, in_grid
+
+
+def build_for_model_dir(model_dir, model, classes, df, points, margin=0.0, source_model=None):
+    """
+    Build the table for `model` into model_dir, with grid bounds from the
+    training data ranges (widened by `margin` of the span)
+
+    Returns:
+        tuple: (table path, meta path)
+    """
+    lows = df[FEATURES].min().to_numpy(dtype=np.float64)
+    highs = df[FEATURES].max().to_numpy(dtype=np.float64)
+    span = highs - lows
+    lows, highs = lows - span * margin, highs + span * margin
+
+    table_path = os.path.join(model_dir, TABLE_FILE)
+    meta_path = os.path.join(model_dir, META_FILE)
+    source_path = os.path.join(model_dir, source_model) if source_model else None
+    source_sha256 = file_checksum(source_path) if source_path and os.path.exists(source_path) else None
+    build_lookup_table(model, classes, lows, highs, points, table_path, meta_path,
+                       source_model=source_model, source_sha256=source_sha256)
+    return table_path, meta_path
+
+
+def _parse_grid(spec, default_points):
+    points = {name: default_points for name in FEATURES}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            name, n = part.split("=", 1)
+            if name.strip() in points:
+                points[name.strip()] = max(1, int(n))
+    return [points[name] for name in FEATURES]
+
+
+if __name__ == "__main__":
+    import pandas as pd
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Build the precomputed crop lookup table")
+    parser.add_argument("--points", type=int, default=8,   help="Grid points per feature")
+    parser.add_argument("--grid",   type=str, default="",  help="Per-feature overrides, e.g. 'rainfall=16,ph=12'")
+    parser.add_argument("--margin", type=float, default=0.0, help="Extend data ranges by this fraction")
+    parser.add_argument("--version", type=str, default=None, help="Model version to build for (default: CURRENT)")
+    parser.add_argument("--variant", type=str, default=os.getenv("CROP_MODEL_VARIANT", "best"),
+                        choices=["best", "compact"], help="Model the backend serves (CROP_MODEL_VARIANT)")
+    args = parser.parse_args()
+
+    from crop_versions import read_current, VERSIONS_DIR
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    models_dir = os.path.join(os.path.dirname(script_dir), 'models')
+    data_path = os.path.join(os.path.dirname(script_dir), 'data', 'crop_data.csv')
+
+    # The table lives next to the model it was computed from
+    if args.version:
+        model_dir = os.path.join(models_dir, VERSIONS_DIR, args.version)
+        if not os.path.isdir(model_dir):
+            raise SystemExit(f"Unknown model version: {args.version}")
+    else:
+        _, model_dir = read_current(models_dir)
+    model_path = os.path.join(model_dir, f'crop_model_{args.variant}.joblib')
+
+    model = joblib.load(model_path)
+    label_encoder = joblib.load(os.path.join(model_dir, 'label_encoder.joblib'))
+
+    df = pd.read_csv(data_path)
+    points = _parse_grid(args.grid, args.points)
+
+    print(f"Building {' x '.join(map(str, points))} = {int(np.prod(points)):,} cells in {model_dir}...")
+    t0 = time.perf_counter()
+    table_path, meta_path = build_for_model_dir(model_dir, model, label_encoder.classes_, df, points,
+                                                args.margin, source_model=os.path.basename(model_path))
+    print(f"Built in {time.perf_counter() - t0:.1f}s -> {table_path} "
+          f"({os.path.getsize(table_path) / 1e6:.1f} MB)")
+
+    # How often the nearest grid point agrees with the live model on real rows
+    lookup = CropLookupTable(meta_path)
+    X = df[FEATURES].to_numpy(dtype=np.float64)
+    crop_idx, _, in_grid = lookup.lookup(X)
+    agreement = float((crop_idx[in_grid] == np.asarray(model.predict_proba(X[in_grid])).argmax(axis=1)).mean())
+    print(f"Agreement with live model on crop_data.csv: {agreement*100:.2f}%")
@@ -0,0 +1,152 @@
+"""
+Crop Recommendation Model - Versioned Model Directory
+Each training run is published to models/versions/<version>/ and the
+models/CURRENT pointer file is flipped atomically, so a running server
+can pick up the new version without a restart
+
+Layout:
+    models/
+      CURRENT                  <- text file holding the active version name
+      versions/
+        20260130_000329/
+          crop_model_best.joblib, label_encoder.joblib,
+          crop_model_compiled.npz, model_metadata.json, ...
+"""
+
+import os
+import shutil
+from datetime import datetime
+
+POINTER_FILE = 'CURRENT'
+VERSIONS_DIR = 'versions'
+
+
+def publish_version(models_dir, filenames, version=None):
+    """
+    Copy model files into a new version directory and make it current
+
+    Both steps are atomic renames: readers see either the old or the new
+    version, never a half-written one.
+
+    Args:
+        models_dir: Base models directory
+        filenames: Files (relative to models_dir) that make up the model
+        version: Version name (default: timestamp)
+
+    Returns:
+        str: Published version name
+    """
+    version = version or datetime.now().strftime("%Y%m%d_%H%M%S")
+    versions_dir = os.path.join(models_dir, VERSIONS_DIR)
+    final_dir = os.path.join(versions_dir, version)
+    staging_dir = final_dir + '.tmp'
+
+    os.makedirs(versions_dir, exist_ok=True)
+    if os.path.exists(final_dir):
+        raise FileExistsError(f"Model version already exists: {version}")
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    for name in filenames:
+        src = os.path.join(models_dir, name)
+        if os.path.exists(src):
+            shutil.copy2(src, os.path.join(staging_dir, name))
+    os.rename(staging_dir, final_dir)
+
+    set_current(models_dir, version)
+    return version
+
+
+def set_current(models_dir, version):
+    """Atomically point CURRENT at an existing version (also used for rollback)"""
+    if not os.path.isdir(os.path.join(models_dir, VERSIONS_DIR, version)):
+        raise FileNotFoundError(f"Unknown model version: {version}")
+
+    pointer = os.path.join(models_dir, POINTER_FILE)
+    tmp = pointer + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(version + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+
+
+def read_current(models_dir):
+    """
+    Resolve the active model directory
+
+    Returns:
+        tuple: (version, directory); (None, models_dir) when no version
+               has been published yet (flat legacy layout)
+    """
+    try:
+        with open(os.path.join(models_dir, POINTER_FILE), 'r') as f:
+            version = f.read().strip()
+    except OSError:
+        return None, models_dir
+
+    version_dir = os.path.join(models_dir, VERSIONS_DIR, version)
+    if not version or not os.path.isdir(version_dir):
+        return None, models_dir
+    return version, version_dir
+
+
+def model_files(model_dir, variant='best'):
+    """File paths of a crop model variant ('best' or 'compact') inside a model directory"""
+    return {
+        'variant': variant,
+        'joblib': os.path.join(model_dir, f'crop_model_{variant}.joblib'),
+        'label_encoder': os.path.join(model_dir, 'label_encoder.joblib'),
+        'compiled': os.path.join(
+            model_dir,
+            'crop_model_compiled.npz' if variant == 'best' else f'crop_model_{variant}_compiled.npz'
+        ),
+        'lookup_meta': os.path.join(model_dir, 'crop_lookup_meta.json'),
+        'similar_farms': os.path.join(model_dir, 'similar_farms_index.joblib'),
+    }
+
+
+def resolve_model(models_dir, variant='best'):
+    """
+    Active version and the files of the model variant to serve; the API
+    and the offline tools both resolve their model through here
+
+    A missing variant (e.g. compact when train.py ran without --compress)
+    falls back to best; files['variant'] is the one actually resolved.
+
+    Returns:
+        tuple: (version or None, model directory, files dict)
+    """
+    version, model_dir = read_current(models_dir)
+    files = model_files(model_dir, variant)
+    if variant != 'best' and not any(os.path.exists(files[k]) for k in ('compiled', 'joblib')):
+        files = model_files(model_dir, 'best')
+    return version, model_dir, files
+
+
+def list_versions(models_dir):
+    """Published versions, oldest first"""
+    versions_dir = os.path.join(models_dir, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(d for d in os.listdir(versions_dir)
+                  if not d.endswith('.tmp') and os.path.isdir(os.path.join(versions_dir, d)))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    models_dir = os.path.join(os.path.dirname(script_dir), 'models')
+
+    parser = argparse.ArgumentParser(description="Inspect or switch crop model versions")
+    parser.add_argument("--use", type=str, default=None, help="Make this version current (rollback)")
+    args = parser.parse_args()
+
+    if args.use:
+        set_current(models_dir, args.use)
+    current, _ = read_current(models_dir)
+    for v in list_versions(models_dir):
+        print(f"{'*' if v == current else ' '} {v}")
+    if current is None:
+        print("No published version; serving the flat models/ directory")
@@ -0,0 +1,154 @@
+"""
+Crop Recommendation Model - Similar Farms Index
+KD-tree over standardized soil/climate features of crop_data.csv (plus
+any farmer-submitted record files) for k-nearest-neighbour queries
+
+train.py builds the index and publishes it with each model version; the
+backend only loads it. This script rebuilds it for an existing version,
+e.g. after new field records arrive.
+
+Usage:
+    python similar_farms.py [--extra data/field_records.csv ...] [--version V]
+"""
+
+import argparse
+import csv
+import hashlib
+import os
+
+import numpy as np
+
+FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Published next to the model files of each version
+INDEX_FILE = 'similar_farms_index.joblib'
+
+
+def source_signature(paths):
+    """Content hash of the source files the index was built from"""
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(os.path.abspath(path).encode())
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_records(paths, features):
+    rows, labels = [], []
+    for path in paths:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for record in csv.DictReader(f):
+                try:
+                    rows.append([float(record[name]) for name in features])
+                except (KeyError, TypeError, ValueError):
+                    continue  # skip incomplete records
+                labels.append(record.get('label', ''))
+    return np.asarray(rows, dtype=np.float64).reshape(-1, len(features)), np.asarray(labels, dtype=object)
+
+
+class SimilarFarmsIndex:
+    """k-NN over standardized features backed by sklearn's KDTree"""
+
+    def __init__(self, tree, records, labels, mean, std, features, signature=None):
+        self.tree = tree
+        self.records = records
+        self.labels = labels
+        self.mean = mean
+        self.std = std
+        self.features = list(features)
+        self.signature = signature
+
+    @classmethod
+    def build(cls, paths, features=None, leaf_size=40):
+        from sklearn.neighbors import KDTree
+
+        features = list(features or FEATURES)
+        records, labels = _read_records(paths, features)
+        if len(records) == 0:
+            raise ValueError("No usable records to index")
+
+        # Standardize so rainfall (mm) doesn't drown out pH
+        mean = records.mean(axis=0)
+        std = records.std(axis=0)
+        std[std == 0] = 1.0
+        tree = KDTree((records - mean) / std, leaf_size=leaf_size)
+        return cls(tree, records, labels, mean, std, features, source_signature(paths))
+
+    def save(self, path):
+        import joblib
+        tmp = path + '.tmp'
+        joblib.dump(self, tmp)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path):
+        import joblib
+        return joblib.load(path)
+
+    def __len__(self):
+        return len(self.records)
+
+    def query(self, row, k=5):
+        """
+        k most similar records to one feature row
+
+        Returns:
+            list: dicts with the record's features, label and standardized distance
+        """
+        k = max(1, min(int(k), len(self.records)))
+        point = (np.asarray(row, dtype=np.float64).reshape(1, -1) - self.mean) / self.std
+        distances, indices = self.tree.query(point, k=k)
+
+        similar = []
+        for distance, idx in zip(distances[0], indices[0]):
+            entry = {name: float(value) for name, value in zip(self.features, self.records[idx])}
+            entry['label'] = self.labels[idx]
+            entry['distance'] = round(float(distance), 4)
+            similar.append(entry)
+        return similar
+
+
+def build_for_model_dir(model_dir, paths, features=None):
+    """
+    Build the index over the existing source files and save it into a model directory
+
+    Returns:
+        SimilarFarmsIndex
+    """
+    index = SimilarFarmsIndex.build([p for p in paths if os.path.exists(p)], features)
+    index.save(os.path.join(model_dir, INDEX_FILE))
+    return index
+
+
+if __name__ == "__main__":
+    import time
+    from crop_versions import read_current, VERSIONS_DIR
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(os.path.dirname(script_dir), 'data')
+    models_dir = os.path.join(os.path.dirname(script_dir), 'models')
+
+    parser = argparse.ArgumentParser(description="Build the similar-farms KD-tree index")
+    parser.add_argument("--extra",   nargs="*", default=[],   help="Additional record CSVs (same columns as crop_data.csv)")
+    parser.add_argument("--version", type=str,  default=None, help="Model version to build for (default: CURRENT)")
+    args = parser.parse_args()
+
+    # The index is served from the model version directory
+    if args.version:
+        model_dir = os.path.join(models_dir, VERSIONS_DIR, args.version)
+        if not os.path.isdir(model_dir):
+            raise SystemExit(f"Unknown model version: {args.version}")
+    else:
+        _, model_dir = read_current(models_dir)
+
+    t0 = time.perf_counter()
+    index = build_for_model_dir(model_dir, [os.path.join(data_dir, 'crop_data.csv')] + args.extra)
+    print(f"Built index over {len(index):,} records in {time.perf_counter() - t0:.3f}s -> "
+          f"{os.path.join(model_dir, INDEX_FILE)}")
+
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        index.query([90, 42, 43, 20.8, 82, 6.5, 202], k=5)
+    print(f"Query latency: {(time.perf_counter() - t0):.3f} ms")
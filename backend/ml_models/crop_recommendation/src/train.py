@@ -1,35 +1,216 @@
 """
 Crop Recommendation Model - Training Script
-Train XGBoost classifier on crop recommendation dataset
+Train XGBoost classifier on crop recommendation dataset, optionally
+selecting the model family under a serving-latency budget
 """
 
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split, cross_val_score, StratifiedKFold
+from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
 from xgboost import XGBClassifier
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import copy
 import joblib
 import json
 import os
+import tempfile
+import time
 from datetime import datetime
+from tree_ensemble import export_xgboost, CompiledTreeEnsemble
+from crop_versions import publish_version
+from crop_lookup import build_for_model_dir, LOOKUP_FILES, FEATURES as LOOKUP_FEATURES
+import similar_farms
+
+# Candidates for model selection: (family, params)
+SEARCH_SPACE = [
+    ('xgboost', {'n_estimators': 200, 'max_depth': 10, 'learning_rate': 0.1}),
+    ('xgboost', {'n_estimators': 100, 'max_depth': 6, 'learning_rate': 0.1}),
+    ('xgboost', {'n_estimators': 50, 'max_depth': 4, 'learning_rate': 0.2}),
+    ('random_forest', {'n_estimators': 100, 'max_depth': None}),
+    ('random_forest', {'n_estimators': 50, 'max_depth': 12}),
+    ('logistic_regression', {'C': 1.0}),
+    ('logistic_regression', {'C': 10.0}),
+]
+
+
+def build_estimator(family, params):
+    """Create an unfitted estimator for a SEARCH_SPACE entry"""
+    if family == 'xgboost':
+        return XGBClassifier(random_state=42, eval_metric='mlogloss', n_jobs=1, **params)
+    if family == 'random_forest':
+        return RandomForestClassifier(random_state=42, n_jobs=1, **params)
+    if family == 'logistic_regression':
+        # Shallow linear baseline; features have very different scales
+        return make_pipeline(StandardScaler(), LogisticRegression(max_iter=2000, **params))
+    raise ValueError(f"Unknown model family: {family}")
+
+
+def measure_latency(predict_proba, X, single_row_calls=200):
+    """
+    Measure single-row p50/p99 latency (ms) and batch throughput (rows/s)
+    """
+    X = np.asarray(X, dtype=np.float64)
+    predict_proba(X[:1])  # warm-up
+
+    timings = []
+    for i in range(single_row_calls):
+        row = X[i % len(X)].reshape(1, -1)
+        t0 = time.perf_counter()
+        predict_proba(row)
+        timings.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    predict_proba(X)
+    batch_seconds = time.perf_counter() - t0
+
+    return {
+        'single_row_p50_ms': round(float(np.percentile(timings, 50)), 4),
+        'single_row_p99_ms': round(float(np.percentile(timings, 99)), 4),
+        'batch_rows_per_s': round(len(X) / max(batch_seconds, 1e-9), 1),
+    }
+
+
+def evaluate_candidate(family, params, X_train, y_train, X_test, y_test, cv_folds=5):
+    """
+    Cross-validate and fit one candidate (runs in a worker process)
+
+    Returns:
+        tuple: (report dict without latency, fitted estimator); latency is
+               measured afterwards by time_candidate, outside the pool
+    """
+    estimator = build_estimator(family, params)
+    cv = StratifiedKFold(n_splits=cv_folds, shuffle=True, random_state=42)
+    cv_scores = cross_val_score(estimator, X_train, y_train, cv=cv, scoring='accuracy', n_jobs=1)
+
+    estimator.fit(X_train, y_train)
+    X_test = np.asarray(X_test, dtype=np.float64)
+    test_accuracy = accuracy_score(y_test, estimator.predict(X_test))
+
+    return {
+        'family': family,
+        'params': params,
+        'cv_accuracy_mean': round(float(cv_scores.mean()), 4),
+        'cv_accuracy_std': round(float(cv_scores.std()), 4),
+        'test_accuracy': round(float(test_accuracy), 4),
+    }, estimator
+
+
+def time_candidate(family, estimator, classes, X):
+    """
+    Single-row and batch latency of a fitted candidate, run serially in the
+    parent so every candidate is timed on an otherwise idle CPU
+
+    XGBoost candidates are timed through the compiled NumPy trees as
+    well, since that is what the backend serves.
+    """
+    latency = measure_latency(estimator.predict_proba, X)
+    serving_backend = 'joblib'
+    if family == 'xgboost':
+        with tempfile.TemporaryDirectory() as tmp:
+            compiled_path = os.path.join(tmp, 'compiled.npz')
+            export_xgboost(estimator, classes, compiled_path)
+            compiled_latency = measure_latency(CompiledTreeEnsemble.load(compiled_path).predict_proba, X)
+        if compiled_latency['single_row_p50_ms'] < latency['single_row_p50_ms']:
+            latency, serving_backend = compiled_latency, 'compiled'
+    return {'serving_backend': serving_backend, **latency}
+
+def slice_rounds(model, rounds):
+    """Copy of a fitted XGBClassifier keeping only its first `rounds` boosting rounds."""
+    pruned = copy.deepcopy(model)
+    pruned._Booster = model.get_booster()[:rounds]
+    pruned.set_params(n_estimators=rounds)
+    return pruned
+
+
+def distill_student(teacher, X, y, params, n_synthetic, seed=42):
+    """Shallow XGBoost fit on X plus jittered synthetic points labelled by teacher."""
+    rng = np.random.default_rng(seed)
+    scale = X.std(axis=0) * 0.1
+    X_syn = X[rng.integers(0, len(X), n_synthetic)] + rng.normal(0, 1, (n_synthetic, X.shape[1])) * scale
+    X_syn = np.clip(X_syn, X.min(axis=0), X.max(axis=0))
+    student = XGBClassifier(**params, learning_rate=0.3, random_state=seed, eval_metric='mlogloss')
+    student.fit(np.vstack([X, X_syn]), np.concatenate([y, teacher.predict(X_syn)]))
+    return student
+
+
+def _n_nodes(model):
+    return int(model.get_booster().trees_to_dataframe().shape[0])
+
+
+def serving_profile(model, classes, X_test):
+    """
+    Size, load time and single-row latency of a model as the backend
+    would serve it (compiled trees for XGBoost, joblib otherwise)
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        joblib_path = os.path.join(tmp, 'model.joblib')
+        joblib.dump(model, joblib_path)
+        t0 = time.perf_counter()
+        joblib.load(joblib_path)
+        profile = {
+            'joblib_bytes': os.path.getsize(joblib_path),
+            'joblib_load_ms': round((time.perf_counter() - t0) * 1000, 2),
+        }
+        predict_proba = model.predict_proba
+
+        if isinstance(model, XGBClassifier):
+            compiled_path = os.path.join(tmp, 'model.npz')
+            export_xgboost(model, classes, compiled_path)
+            t0 = time.perf_counter()
+            compiled = CompiledTreeEnsemble.load(compiled_path)
+            profile['compiled_bytes'] = os.path.getsize(compiled_path)
+            profile['compiled_load_ms'] = round((time.perf_counter() - t0) * 1000, 2)
+            profile['n_trees'] = len(compiled.roots)
+            profile['n_nodes'] = len(compiled.feature)
+            predict_proba = compiled.predict_proba
+
+    profile.update(measure_latency(predict_proba, X_test))
+    return profile
+
 
 class CropRecommendationTrainer:
-    def __init__(self, data_path='data/crop_data.csv', output_dir='models'):
+    def __init__(self, data_path='data/crop_data.csv', output_dir='models',
+                 search=False, latency_budget_ms=5.0, n_workers=None,
+                 compress=False, accuracy_tolerance=0.01, lookup_points=0, similar_extra=()):
         """
         Initialize crop recommendation trainer
         
         Args:
             data_path: Path to CSV dataset
             output_dir: Directory to save models
+            search: Run parallel model selection instead of the fixed XGBoost
+            latency_budget_ms: Max single-row p50 latency for the selected model
+            n_workers: Processes for model selection (default: CPU count)
+            compress: Also build a compact serving model (crop_model_compact.joblib)
+            accuracy_tolerance: Max test-accuracy drop allowed for the compact model
+            lookup_points: Grid points per feature for the lookup table
+                           published with the model (0 = no table)
+            similar_extra: Farmer record CSVs added to the similar-farms index
         """
         self.data_path = data_path
         self.output_dir = output_dir
+        self.search = search
+        self.latency_budget_ms = latency_budget_ms
+        self.n_workers = n_workers
         self.model = None
         self.label_encoder = None
         self.feature_names = None
+        self.selection_report = None
+        self.compress = compress
+        self.accuracy_tolerance = accuracy_tolerance
+        self.compact_model = None
+        self.compression_report = None
+        self.lookup_points = lookup_points
+        self.similar_extra = list(similar_extra)
         
         os.makedirs(output_dir, exist_ok=True)
     
@@ -105,6 +286,133 @@ class CropRecommendationTrainer:
         print("Training complete!")
         return self.model
     
+    def select_model(self, X_train, y_train, X_test, y_test):
+        """Cross-validate SEARCH_SPACE in a process pool, time the fitted
+        candidates serially, and pick the most accurate model whose
+        single-row latency fits the budget"""
+        print(f"\n[3/6] Selecting model ({len(SEARCH_SPACE)} candidates, "
+              f"budget {self.latency_budget_ms} ms/row)...")
+        
+        with ProcessPoolExecutor(max_workers=self.n_workers) as pool:
+            futures = [
+                pool.submit(evaluate_candidate, family, params, X_train, y_train, X_test, y_test)
+                for family, params in SEARCH_SPACE
+            ]
+            fitted = [f.result() for f in futures]
+        
+        # Timed one at a time after the pool is done, so no candidate is
+        # measured while others are still fitting
+        X_test = np.asarray(X_test, dtype=np.float64)
+        classes = np.unique(y_train)
+        candidates, estimators = [], []
+        for report, estimator in fitted:
+            candidates.append({**report, **time_candidate(report['family'], estimator, classes, X_test)})
+            estimators.append(estimator)
+        
+        for c in candidates:
+            print(f"  {c['family']:<20} {str(c['params']):<55} "
+                  f"cv={c['cv_accuracy_mean']:.4f} test={c['test_accuracy']:.4f} "
+                  f"p50={c['single_row_p50_ms']:.3f}ms batch={c['batch_rows_per_s']:,.0f} rows/s")
+        
+        within_budget = [c for c in candidates if c['single_row_p50_ms'] <= self.latency_budget_ms]
+        if within_budget:
+            best = max(within_budget, key=lambda c: (c['cv_accuracy_mean'], -c['single_row_p50_ms']))
+        else:
+            print("  No candidate meets the latency budget; choosing the fastest")
+            best = min(candidates, key=lambda c: c['single_row_p50_ms'])
+        
+        print(f"Selected: {best['family']} {best['params']}")
+        self.selection_report = {
+            'latency_budget_ms': self.latency_budget_ms,
+            'selected': best,
+            'candidates': candidates,
+        }
+        
+        # Already fit on X_train in its worker
+        self.model = estimators[candidates.index(best)]
+        return self.model
+    
+    def compress_model(self, X_train, y_train, X_test, y_test, n_synthetic=20000, val_size=0.2):
+        """
+        Build the smallest model within accuracy_tolerance of the full one
+        
+        Two kinds of candidates are tried:
+          - round pruning: the trained XGBoost booster truncated to fewer
+            boosting rounds (a prefix of the same trees, nothing is refit)
+          - distillation: shallow XGBoost students fit on the training set
+            plus jittered synthetic points labelled by the full model
+        
+        Candidates are compared on a validation split of the training set,
+        against a reference copy of the full model fit without it; X_test
+        is only used to report the chosen model's held-out accuracy.
+        """
+        print(f"\n[5/6] Compressing model (tolerance {self.accuracy_tolerance*100:.1f}% accuracy)...")
+        
+        X_train = np.asarray(X_train, dtype=np.float64)
+        y_train = np.asarray(y_train)
+        X_test = np.asarray(X_test, dtype=np.float64)
+        X_fit, X_val, y_fit, y_val = train_test_split(
+            X_train, y_train, test_size=val_size, random_state=42, stratify=y_train
+        )
+        reference = clone(self.model).fit(X_fit, y_fit)
+        reference_accuracy = accuracy_score(y_val, reference.predict(X_val))
+        floor = reference_accuracy - self.accuracy_tolerance
+        results = []
+        
+        # 1) Round pruning: slices of the reference booster, scored on validation
+        if isinstance(self.model, XGBClassifier):
+            for rounds in [10, 20, 30, 50, 75, 100, 150]:
+                if rounds >= self.model.get_booster().num_boosted_rounds():
+                    break
+                pruned = slice_rounds(reference, rounds)
+                results.append(('pruned', {'n_estimators': rounds, 'max_depth': self.model.max_depth},
+                                accuracy_score(y_val, pruned.predict(X_val)), _n_nodes(pruned)))
+        
+        # 2) Distillation onto teacher-labelled synthetic data
+        for n_estimators, max_depth in [(20, 3), (30, 4), (50, 4), (50, 6)]:
+            params = {'n_estimators': n_estimators, 'max_depth': max_depth}
+            student = distill_student(reference, X_fit, y_fit, params, n_synthetic)
+            results.append(('distilled', params, accuracy_score(y_val, student.predict(X_val)), _n_nodes(student)))
+        
+        for kind, params, accuracy, n_nodes in results:
+            print(f"  {kind:<10} rounds={params['n_estimators']:<4} depth={params['max_depth']!s:<4} "
+                  f"nodes={n_nodes:<6} val_accuracy={accuracy:.4f}")
+        
+        eligible = [r for r in results if r[2] >= floor]
+        if not eligible:
+            print("  No candidate within tolerance; keeping the full model only")
+            return None
+        
+        # Apply the chosen setting to the model trained on the full training set
+        kind, params, _, _ = min(eligible, key=lambda r: (r[3], -r[2]))
+        if kind == 'pruned':
+            self.compact_model = slice_rounds(self.model, params['n_estimators'])
+        else:
+            self.compact_model = distill_student(self.model, X_train, y_train, params, n_synthetic)
+        teacher_accuracy = accuracy_score(y_test, self.model.predict(X_test))
+        compact_accuracy = accuracy_score(y_test, self.compact_model.predict(X_test))
+        classes = self.label_encoder.classes_
+        full_profile = serving_profile(self.model, classes, X_test)
+        compact_profile = serving_profile(self.compact_model, classes, X_test)
+        
+        self.compression_report = {
+            'accuracy_tolerance': self.accuracy_tolerance,
+            'method': kind,
+            'params': params,
+            'validation': {'rows': int(len(X_val)), 'reference_accuracy': round(float(reference_accuracy), 4)},
+            'full': {'test_accuracy': round(float(teacher_accuracy), 4), **full_profile},
+            'compact': {'test_accuracy': round(float(compact_accuracy), 4), **compact_profile},
+        }
+        
+        print(f"\n  {'':<22}{'full':>14}{'compact':>14}")
+        for key in ['test_accuracy', 'joblib_bytes', 'joblib_load_ms', 'compiled_bytes',
+                    'compiled_load_ms', 'single_row_p50_ms', 'batch_rows_per_s']:
+            full_val = self.compression_report['full'].get(key, '-')
+            compact_val = self.compression_report['compact'].get(key, '-')
+            print(f"  {key:<22}{full_val!s:>14}{compact_val!s:>14}")
+        
+        return self.compact_model
+    
     def evaluate_model(self, X_test, y_test):
         """Evaluate model performance"""
         print("\n[4/6] Evaluating model...")
@@ -153,6 +461,9 @@ class CropRecommendationTrainer:
     
     def plot_feature_importance(self, timestamp):
         """Plot feature importance"""
+        if not hasattr(self.model, 'feature_importances_'):
+            print("Feature importance not available for this model type")
+            return
         importance = self.model.feature_importances_
         indices = np.argsort(importance)[::-1]
         
@@ -170,7 +481,7 @@ class CropRecommendationTrainer:
     
     def save_model(self):
         """Save model and metadata"""
-        print("\n[5/6] Saving model...")
+        print("\n[6/6] Saving model...")
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
@@ -189,20 +500,71 @@ class CropRecommendationTrainer:
         joblib.dump(self.label_encoder, encoder_path)
         print(f"Label encoder saved to {encoder_path}")
         
+        # Save compiled NumPy trees for xgboost-free serving; other model
+        # families are served from joblib, so drop any stale export
+        compiled_path = os.path.join(self.output_dir, 'crop_model_compiled.npz')
+        if isinstance(self.model, XGBClassifier):
+            export_xgboost(self.model, self.label_encoder.classes_, compiled_path, self.feature_names)
+            print(f"Compiled model saved to {compiled_path}")
+        elif os.path.exists(compiled_path):
+            os.remove(compiled_path)
+        
+        # Save compact serving model (ml_integration: CROP_MODEL_VARIANT=compact)
+        if self.compact_model is not None:
+            compact_path = os.path.join(self.output_dir, 'crop_model_compact.joblib')
+            joblib.dump(self.compact_model, compact_path)
+            export_xgboost(self.compact_model, self.label_encoder.classes_,
+                           os.path.join(self.output_dir, 'crop_model_compact_compiled.npz'), self.feature_names)
+            print(f"Compact model saved to {compact_path}")
+        else:
+            for name in ['crop_model_compact.joblib', 'crop_model_compact_compiled.npz']:
+                if os.path.exists(os.path.join(self.output_dir, name)):
+                    os.remove(os.path.join(self.output_dir, name))
+        
         # Save metadata
         metadata = {
             'crops': list(self.label_encoder.classes_),
             'features': self.feature_names,
             'n_crops': len(self.label_encoder.classes_),
             'n_features': len(self.feature_names),
+            'model_type': type(self.model).__name__ if not hasattr(self.model, 'steps') else type(self.model.steps[-1][1]).__name__,
             'timestamp': timestamp
         }
+        if self.selection_report is not None:
+            metadata['model_selection'] = self.selection_report
+        if self.compression_report is not None:
+            metadata['compression'] = self.compression_report
         
         metadata_path = os.path.join(self.output_dir, 'model_metadata.json')
         with open(metadata_path, 'w') as f:
             json.dump(metadata, f, indent=2)
         print(f"Metadata saved to {metadata_path}")
         
+        # Lookup table for this model (CROP_SERVING_MODE=lookup); a stale one
+        # from an earlier run must not be published with the new model
+        if self.lookup_points > 0:
+            table_path, _ = build_for_model_dir(self.output_dir, self.model, self.label_encoder.classes_,
+                                                self.df, [self.lookup_points] * len(LOOKUP_FEATURES),
+                                                source_model='crop_model_best.joblib')
+            print(f"Lookup table saved to {table_path}")
+        else:
+            for name in LOOKUP_FILES:
+                if os.path.exists(os.path.join(self.output_dir, name)):
+                    os.remove(os.path.join(self.output_dir, name))
+        
+        # Similar-farms index over the training data, served with this version
+        index = similar_farms.build_for_model_dir(self.output_dir, [self.data_path] + self.similar_extra)
+        print(f"Similar-farms index ({len(index):,} records) saved to "
+              f"{os.path.join(self.output_dir, similar_farms.INDEX_FILE)}")
+        
+        # Publish an immutable version and flip models/CURRENT; a running
+        # backend hot-swaps to it without a restart
+        served_files = ['crop_model_best.joblib', 'label_encoder.joblib', 'crop_model_compiled.npz',
+                        'crop_model_compact.joblib', 'crop_model_compact_compiled.npz', 'model_metadata.json',
+                        similar_farms.INDEX_FILE] + LOOKUP_FILES
+        version = publish_version(self.output_dir, served_files, version=timestamp)
+        print(f"Published model version {version}")
+        
         return model_path
     
     def train(self):
@@ -213,12 +575,19 @@ class CropRecommendationTrainer:
         # Preprocess
         X_train, X_test, y_train, y_test = self.preprocess_data()
         
-        # Train
-        self.train_model(X_train, y_train)
+        # Train (or select under the latency budget)
+        if self.search:
+            self.select_model(X_train, y_train, X_test, y_test)
+        else:
+            self.train_model(X_train, y_train)
         
         # Evaluate
         accuracy = self.evaluate_model(X_test, y_test)
         
+        # Compress for serving
+        if self.compress:
+            self.compress_model(X_train, y_train, X_test, y_test)
+        
         # Save
         model_path = self.save_model()
         
@@ -233,15 +602,31 @@ class CropRecommendationTrainer:
         return self.model, accuracy
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the crop recommendation model")
+    parser.add_argument("--search",            action="store_true",        help="Select the model family/params in parallel")
+    parser.add_argument("--latency-budget-ms", type=float, default=5.0,    help="Max single-row p50 latency for --search")
+    parser.add_argument("--workers",           type=int,   default=None,   help="Processes for --search (default: CPU count)")
+    parser.add_argument("--compress",          action="store_true",        help="Also build crop_model_compact.joblib")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.01,  help="Max accuracy drop for --compress")
+    parser.add_argument("--lookup",            type=int,   default=0,      help="Publish a lookup table with N grid points per feature")
+    parser.add_argument("--similar-extra",     nargs="*",  default=[],     help="Farmer record CSVs for the similar-farms index")
+    args = parser.parse_args()
+    
     # Train model
-    import os
     script_dir = os.path.dirname(os.path.abspath(__file__))
     data_path = os.path.join(os.path.dirname(script_dir), 'data', 'crop_data.csv')
     output_dir = os.path.join(os.path.dirname(script_dir), 'models')
     
     trainer = CropRecommendationTrainer(
         data_path=data_path,
-        output_dir=output_dir
+        output_dir=output_dir,
+        search=args.search,
+        latency_budget_ms=args.latency_budget_ms,
+        n_workers=args.workers,
+        compress=args.compress,
+        accuracy_tolerance=args.accuracy_tolerance,
+        lookup_points=args.lookup,
+        similar_extra=args.similar_extra
     )
     
     model, accuracy = trainer.train()
@@ -0,0 +1,222 @@
+"""
+Crop Recommendation Model - Compiled Tree Ensemble
+Flatten the trained XGBoost booster into contiguous NumPy arrays and
+evaluate it without importing xgboost/sklearn at serving time
+"""
+
+import json
+import os
+
+import numpy as np
+
+# Rows evaluated per step; bounds the (rows x trees) index matrix
+CHUNK_ROWS = 2048
+
+
+def export_xgboost(model, classes, output_path, feature_names=None):
+    """
+    Flatten an XGBClassifier (multi:softprob) into a compiled .npz file
+
+    Every tree is stored in one global node table. Leaves point to
+    themselves, so evaluation is a fixed number of vectorized steps
+    (the tree depth) with no per-node branching.
+
+    Args:
+        model: Trained XGBClassifier (or raw Booster)
+        classes: Class labels in encoded order (label_encoder.classes_)
+        output_path: Where to write the .npz file
+        feature_names: Optional feature names (defaults to booster's)
+
+    Returns:
+        str: output_path
+    """
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    raw = json.loads(booster.save_raw('json'))
+    learner = raw['learner']
+
+    gbm = learner['gradient_booster']
+    if gbm.get('name') != 'gbtree':
+        raise TypeError(f"Only gbtree boosters can be compiled, got {gbm.get('name')}")
+
+    trees = gbm['model']['trees']
+    tree_class = np.asarray(gbm['model']['tree_info'], dtype=np.int32)
+    n_classes = len(classes)
+
+    feature, threshold, left, right, value, default_left, roots, tree_depth = [], [], [], [], [], [], [], []
+    offset = 0
+
+    for tree in trees:
+        lc = np.asarray(tree['left_children'], dtype=np.int32)
+        rc = np.asarray(tree['right_children'], dtype=np.int32)
+        n_nodes = len(lc)
+        node_ids = np.arange(n_nodes, dtype=np.int32)
+        is_leaf = lc == -1
+
+        # Leaves loop back to themselves; split nodes index globally
+        feature.append(np.where(is_leaf, 0, tree['split_indices']).astype(np.int32))
+        threshold.append(np.asarray(tree['split_conditions'], dtype=np.float32))
+        left.append(np.where(is_leaf, node_ids, lc) + offset)
+        right.append(np.where(is_leaf, node_ids, rc) + offset)
+        value.append(np.where(is_leaf, tree['split_conditions'], 0.0).astype(np.float32))
+        default_left.append(np.asarray(tree['default_left'], dtype=bool))
+        roots.append(offset)
+
+        depth = np.zeros(n_nodes, dtype=np.int32)
+        for node in range(n_nodes):
+            if not is_leaf[node]:
+                depth[lc[node]] = depth[node] + 1
+                depth[rc[node]] = depth[node] + 1
+        tree_depth.append(int(depth.max()))
+        offset += n_nodes
+
+    # Intercept is stored in probability space for softprob
+    base_score = learner['learner_model_param']['base_score']
+    base_score = np.asarray(json.loads(base_score) if base_score.startswith('[') else [float(base_score)] * n_classes,
+                            dtype=np.float64)
+    base_margin = np.log(np.clip(base_score, 1e-12, None)).astype(np.float32)
+
+    if feature_names is None:
+        feature_names = booster.feature_names or []
+
+    np.savez(
+        output_path,
+        feature=np.concatenate(feature),
+        threshold=np.concatenate(threshold),
+        left=np.concatenate(left).astype(np.int32),
+        right=np.concatenate(right).astype(np.int32),
+        value=np.concatenate(value),
+        default_left=np.concatenate(default_left),
+        roots=np.asarray(roots, dtype=np.int32),
+        tree_class=tree_class,
+        tree_depth=np.asarray(tree_depth, dtype=np.int32),
+        base_margin=base_margin,
+        classes=np.asarray([str(c) for c in classes]),
+        feature_names=np.asarray([str(f) for f in feature_names]),
+    )
+    return output_path
+
+
+class CompiledTreeEnsemble:
+    """NumPy-only evaluator for a booster exported with export_xgboost"""
+
+    def __init__(self, arrays):
+        self.feature = np.ascontiguousarray(arrays['feature'])
+        self.threshold = np.ascontiguousarray(arrays['threshold'])
+        self.left = np.ascontiguousarray(arrays['left'])
+        self.right = np.ascontiguousarray(arrays['right'])
+        self.value = np.ascontiguousarray(arrays['value'])
+        self.default_left = np.ascontiguousarray(arrays['default_left'])
+        self.base_margin = np.ascontiguousarray(arrays['base_margin'])
+
+        # Deepest trees first, so step d only walks the prefix still descending
+        order = np.argsort(-arrays['tree_depth'], kind='stable')
+        self.roots = np.ascontiguousarray(arrays['roots'][order])
+        self.tree_class = np.ascontiguousarray(arrays['tree_class'][order])
+        tree_depth = arrays['tree_depth'][order]
+        self.max_depth = int(tree_depth.max()) if len(tree_depth) else 0
+        self._active_trees = [int((tree_depth > d).sum()) for d in range(self.max_depth)]
+        self.classes_ = np.asarray(arrays['classes'])
+        self.feature_names = [str(f) for f in arrays['feature_names']]
+        self.n_classes = len(self.classes_)
+
+        # Interleaved [left, right] children: next = children[2 * node + go_right]
+        self._children = np.ascontiguousarray(np.stack([self.left, self.right], axis=1).ravel())
+
+        # Sums leaf values per class with one matmul
+        self._class_matrix = np.zeros((len(self.roots), self.n_classes), dtype=np.float32)
+        self._class_matrix[np.arange(len(self.roots)), self.tree_class] = 1.0
+
+    @classmethod
+    def load(cls, path):
+        """Load a compiled ensemble from an .npz file"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def _margins(self, X):
+        n_rows, n_features = X.shape
+        has_missing = bool(np.isnan(X).any())
+        flat_X = X.ravel()
+        row_base = (np.arange(n_rows, dtype=np.int32) * n_features)[:, None]
+        idx = np.broadcast_to(self.roots, (n_rows, len(self.roots))).copy()
+
+        for active in self._active_trees:
+            node = idx[:, :active]
+            x = flat_X[row_base + self.feature[node]]
+            go_right = x >= self.threshold[node]
+            if has_missing:
+                go_right = np.where(np.isnan(x), ~self.default_left[node], go_right)
+            idx[:, :active] = self._children[2 * node + go_right]
+
+        return self.value[idx] @ self._class_matrix + self.base_margin
+
+    def predict_proba(self, X):
+        """
+        Class probabilities for a feature matrix
+
+        Args:
+            X: (n_rows, n_features) array-like, features in training order
+
+        Returns:
+            np.ndarray: (n_rows, n_classes) softmax probabilities
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        out = np.empty((X.shape[0], self.n_classes), dtype=np.float32)
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            margins = self._margins(X[start:start + CHUNK_ROWS])
+            margins -= margins.max(axis=1, keepdims=True)
+            np.exp(margins, out=margins)
+            margins /= margins.sum(axis=1, keepdims=True)
+            out[start:start + CHUNK_ROWS] = margins
+        return out
+
+    def predict(self, X):
+        """Encoded class index for each row"""
+        return self.predict_proba(X).argmax(axis=1)
+
+
+def check_parity(model, compiled, X, atol=1e-4):
+    """
+    Compare compiled probabilities with the original model
+
+    Returns:
+        dict: max absolute probability difference and label agreement
+    """
+    expected = model.predict_proba(X)
+    actual = compiled.predict_proba(X)
+    max_diff = float(np.abs(expected - actual).max())
+    agreement = float((expected.argmax(axis=1) == actual.argmax(axis=1)).mean())
+    return {
+        'max_abs_diff': max_diff,
+        'label_agreement': agreement,
+        'passed': max_diff <= atol and agreement == 1.0
+    }
+
+
+if __name__ == "__main__":
+    # Export crop_model_best.joblib and verify parity on crop_data.csv
+    import sys
+    import pandas as pd
+    import joblib
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    models_dir = os.path.join(os.path.dirname(script_dir), 'models')
+    data_path = os.path.join(os.path.dirname(script_dir), 'data', 'crop_data.csv')
+
+    model = joblib.load(os.path.join(models_dir, 'crop_model_best.joblib'))
+    label_encoder = joblib.load(os.path.join(models_dir, 'label_encoder.joblib'))
+    compiled_path = os.path.join(models_dir, 'crop_model_compiled.npz')
+
+    export_xgboost(model, label_encoder.classes_, compiled_path)
+    compiled = CompiledTreeEnsemble.load(compiled_path)
+    print(f"Compiled model saved to {compiled_path}")
+    print(f"Trees: {len(compiled.roots)}, nodes: {len(compiled.feature)}, depth: {compiled.max_depth}")
+
+    X = pd.read_csv(data_path).drop('label', axis=1)[compiled.feature_names].to_numpy(dtype=np.float32)
+    report = check_parity(model, compiled, X)
+    print(f"Parity on {len(X)} rows: max |dp| = {report['max_abs_diff']:.2e}, "
+          f"label agreement = {report['label_agreement']*100:.2f}%")
+
+    sys.exit(0 if report['passed'] else 1)
@@ -0,0 +1,45 @@
+import os
+
+import pandas as pd
+import pytest
+
+from bulk_predict import bulk_predict, MODELS_DIR
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+DATA_PATH = os.path.join(os.path.dirname(MODELS_DIR), 'data', 'crop_data.csv')
+
+
+def test_parquet_output_survives_bad_value_in_late_chunk(tmp_path):
+    df = pd.read_csv(DATA_PATH)
+    df['ph'] = df['ph'].astype(object)
+    df.loc[1700, 'ph'] = 'abc'
+    input_path = tmp_path / 'survey.csv'
+    df.to_csv(input_path, index=False)
+
+    output_path = tmp_path / 'scored.parquet'
+    summary = bulk_predict(str(input_path), str(output_path), workers=1, chunk_size=500,
+                           backend='compiled')
+
+    scored = pq.read_table(output_path).to_pandas()
+    assert summary['rows'] == len(df) == len(scored)
+    assert pd.isna(scored.loc[1700, 'ph'])
+    assert scored.loc[1700, 'predicted_crop'] == ''
+    assert (scored.drop(index=1700)['predicted_crop'] != '').all()
+
+
+def test_engine_uses_current_version_and_falls_back_to_best(tmp_path):
+    import shutil
+    from bulk_predict import load_engine
+    from crop_versions import publish_version
+
+    for name in ['crop_model_compiled.npz', 'crop_model_best.joblib', 'label_encoder.joblib']:
+        shutil.copy(os.path.join(MODELS_DIR, name), tmp_path / name)
+    publish_version(str(tmp_path), ['crop_model_compiled.npz', 'crop_model_best.joblib', 'label_encoder.joblib'],
+                    version='v1')
+    for name in ['crop_model_compiled.npz', 'crop_model_best.joblib', 'label_encoder.joblib']:
+        os.remove(tmp_path / name)
+
+    # Only the published version exists, and it has no compact model
+    engine = load_engine(str(tmp_path), backend='compiled', variant='compact')
+    assert len(engine.crops) > 0
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tree_ensemble import export_xgboost, CompiledTreeEnsemble, check_parity
+
+xgboost = pytest.importorskip('xgboost')
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'crop_data.csv')
+
+
+@pytest.fixture(scope='module')
+def crop_data():
+    df = pd.read_csv(DATA_PATH)
+    X = df.drop('label', axis=1).to_numpy(dtype=np.float32)
+    labels, y = np.unique(df['label'], return_inverse=True)
+    return X, y, labels
+
+
+def _with_nans(X, fraction, seed):
+    X = X.copy()
+    rng = np.random.default_rng(seed)
+    X[rng.random(X.shape) < fraction] = np.nan
+    return X
+
+
+def _compile(model, classes, tmp_path):
+    path = tmp_path / 'compiled.npz'
+    export_xgboost(model, classes, str(path))
+    return CompiledTreeEnsemble.load(str(path))
+
+
+def test_parity_with_xgboost(crop_data, tmp_path):
+    X, y, labels = crop_data
+    model = xgboost.XGBClassifier(n_estimators=20, max_depth=4, random_state=42, eval_metric='mlogloss')
+    model.fit(X, y)
+    compiled = _compile(model, labels, tmp_path)
+
+    report = check_parity(model, compiled, X)
+    assert report['passed'], report
+
+
+def test_parity_on_missing_values(crop_data, tmp_path):
+    X, y, labels = crop_data
+    # Trained with NaNs so the learned default directions matter
+    model = xgboost.XGBClassifier(n_estimators=20, max_depth=4, random_state=42, eval_metric='mlogloss')
+    model.fit(_with_nans(X, 0.1, seed=0), y)
+    compiled = _compile(model, labels, tmp_path)
+
+    X_eval = _with_nans(X, 0.2, seed=1)
+    X_eval[:5] = np.nan  # rows with every feature missing
+    report = check_parity(model, compiled, X_eval)
+    assert report['passed'], report
+    assert list(compiled.classes_) == list(labels)
@@ -0,0 +1,246 @@
+"""
+MobileNet Distillation (disease cascade stage 1)
+================================================
+Distills the disease ViT into a MobileNetV3 on the ViT's own label set, for
+the confidence-gated cascade in services/disease_cascade.py. The ViT's
+softened probabilities are the training target; images in class folders
+named like a ViT label (e.g. Tomato___Late_blight) also get the hard label.
+
+Teacher logits are computed once up front, so each epoch only runs the
+student. A held-out split reports, per confidence threshold, how many
+images the student would answer alone (coverage) and how often those
+answers match the ViT - pick CASCADE_FAST_THRESHOLD from this table.
+
+Usage:
+    python distill_mobilenet.py --images path/to/leaves [--arch mobilenet_v3_small]
+                                [--epochs 8] [--onnx]
+
+Output (models/):
+    disease_mobilenet.pt, disease_mobilenet.json
+    onnx/disease_mobilenet.onnx, onnx/disease_mobilenet.json   with --onnx
+
+Serve: picked up automatically (CASCADE_MODE=auto); DISEASE_MOBILENET_BACKEND=onnx
+uses the ONNX graph.
+
+Requirements:
+    pip install torch torchvision transformers
+"""
+
+import sys
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+BASE_DIR    = Path(__file__).resolve().parent.parent
+BACKEND_DIR = BASE_DIR.parent.parent
+MODELS_DIR  = BASE_DIR / "models"
+ONNX_DIR    = MODELS_DIR / "onnx"
+
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from services.disease_cascade import (
+    MOBILENET_WEIGHTS_PATH, MOBILENET_META_PATH, DISEASE_MOBILENET_ONNX, DISEASE_MOBILENET,
+)
+from services.image_preprocessing import RESNET_PREPROCESS, ImagePreprocessor
+
+IMAGE_EXTS  = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+THRESHOLDS  = [50, 60, 70, 80, 85, 90, 95, 98]
+
+
+def _norm(label: str) -> str:
+    return "".join(ch for ch in str(label).lower() if ch.isalnum())
+
+
+def collect_images(root: str):
+    """[(path, class folder name or None)] for every image under root."""
+    root = Path(root)
+    paths = sorted(p for p in root.rglob("*") if p.suffix.lower() in IMAGE_EXTS)
+    return [(str(p), p.parent.name if p.parent != root else None) for p in paths]
+
+
+def load_batch(paths, preprocessor, augment: bool = False):
+    from PIL import Image, ImageOps
+
+    images = []
+    for path in paths:
+        img = Image.open(path).convert("RGB")
+        if augment and random.random() < 0.5:
+            img = ImageOps.mirror(img)
+        images.append(img)
+    # Copy out of the preprocessor's reusable buffer (autograd keeps the input)
+    return preprocessor(images).copy()
+
+
+def teacher_logits(paths, batch_size: int):
+    """ViT logits for every image (one pass) and its label list."""
+    import numpy as np
+    import torch
+    from PIL import Image
+    from services.model_registry import load_hf_image_classifier, DISEASE_VIT
+
+    bundle = load_hf_image_classifier(DISEASE_VIT, "fp32")
+    model, preprocessor = bundle["model"], bundle["preprocessor"]
+    labels = [model.config.id2label[i] for i in range(len(model.config.id2label))]
+
+    out = []
+    with torch.inference_mode():
+        for start in range(0, len(paths), batch_size):
+            images = [Image.open(p).convert("RGB") for p in paths[start:start + batch_size]]
+            out.append(model(pixel_values=torch.from_numpy(preprocessor(images))).logits.float().numpy())
+            print(f"\r  teacher {min(start + batch_size, len(paths))}/{len(paths)}", end="", flush=True)
+    print()
+    return np.concatenate(out), labels
+
+
+def build_student(arch: str, num_classes: int):
+    """ImageNet-pretrained MobileNetV3 with a fresh head for the ViT labels."""
+    import torch
+    from torchvision import models
+
+    model = getattr(models, arch)(weights="DEFAULT")
+    head = model.classifier[-1]
+    model.classifier[-1] = torch.nn.Linear(head.in_features, num_classes)
+    return model
+
+
+def distill(student, paths, soft, hard, preprocessor, epochs: int, batch_size: int,
+            lr: float, temperature: float, alpha: float):
+    """alpha * T^2 * KL(teacher || student at T) + (1 - alpha) * CE on hard labels where known."""
+    import torch
+    import torch.nn.functional as F
+
+    optimizer = torch.optim.AdamW(student.parameters(), lr=lr, weight_decay=1e-4)
+    steps = epochs * ((len(paths) + batch_size - 1) // batch_size)
+    scheduler = torch.optim.lr_scheduler.OneCycleLR(optimizer, max_lr=lr, total_steps=steps)
+    soft = torch.from_numpy(soft)
+    hard = torch.tensor(hard, dtype=torch.long)
+
+    student.train()
+    for epoch in range(epochs):
+        order = list(range(len(paths)))
+        random.shuffle(order)
+        total, start_time = 0.0, time.perf_counter()
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            x = torch.from_numpy(load_batch([paths[i] for i in idx], preprocessor, augment=True))
+            logits = student(x)
+            loss = alpha * temperature ** 2 * F.kl_div(
+                F.log_softmax(logits / temperature, dim=-1),
+                F.softmax(soft[idx] / temperature, dim=-1), reduction="batchmean")
+            targets = hard[idx]
+            if alpha < 1.0 and (targets >= 0).any():
+                loss = loss + (1 - alpha) * F.cross_entropy(logits, targets, ignore_index=-1)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+            total += float(loss) * len(idx)
+        print(f"  epoch {epoch + 1}/{epochs}: loss {total / len(order):.4f} "
+              f"({time.perf_counter() - start_time:.0f}s)")
+    student.eval()
+    return student
+
+
+def evaluate(student, paths, teacher, hard, preprocessor, batch_size: int) -> list:
+    """Per threshold: coverage (student answers alone), agreement with the ViT, accuracy where labelled."""
+    import numpy as np
+    import torch
+
+    probs = []
+    with torch.inference_mode():
+        for start in range(0, len(paths), batch_size):
+            x = torch.from_numpy(load_batch(paths[start:start + batch_size], preprocessor))
+            probs.append(torch.softmax(student(x), dim=-1).numpy())
+    probs = np.concatenate(probs)
+    confidence = probs.max(axis=1) * 100
+    predicted = probs.argmax(axis=1)
+    agrees = predicted == teacher.argmax(axis=1)
+    hard = np.asarray(hard)
+
+    rows = []
+    for threshold in THRESHOLDS:
+        answered = confidence >= threshold
+        labelled = answered & (hard >= 0)
+        rows.append({
+            "threshold": threshold,
+            "coverage": float(answered.mean()),
+            "agreement": float(agrees[answered].mean()) if answered.any() else None,
+            "accuracy": float((predicted[labelled] == hard[labelled]).mean()) if labelled.any() else None,
+        })
+    return rows
+
+
+def export_onnx(student, labels, preprocess: dict, opset: int):
+    import torch
+    from export_onnx import export_graph, write_meta
+
+    ONNX_DIR.mkdir(parents=True, exist_ok=True)
+    onnx_path = ONNX_DIR / f"{DISEASE_MOBILENET_ONNX}.onnx"
+    export_graph(student, torch.zeros(1, 3, preprocess["crop"], preprocess["crop"]), onnx_path, "input", opset)
+    write_meta(ONNX_DIR / f"{DISEASE_MOBILENET_ONNX}.json", labels, preprocess, DISEASE_MOBILENET)
+    return onnx_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distill the disease ViT into a MobileNetV3")
+    parser.add_argument("--images",      type=str,   required=True,  help="Leaf images (class subfolders optional)")
+    parser.add_argument("--arch",        type=str,   default="mobilenet_v3_small",
+                        choices=["mobilenet_v3_small", "mobilenet_v3_large"])
+    parser.add_argument("--epochs",      type=int,   default=8)
+    parser.add_argument("--batch",       type=int,   default=32)
+    parser.add_argument("--lr",          type=float, default=1e-3)
+    parser.add_argument("--temperature", type=float, default=4.0,  help="Distillation temperature")
+    parser.add_argument("--alpha",       type=float, default=0.7,  help="Weight of the soft (teacher) loss")
+    parser.add_argument("--holdout",     type=float, default=0.1,  help="Fraction kept for the threshold table")
+    parser.add_argument("--onnx",        action="store_true",      help="Also export an ONNX graph")
+    parser.add_argument("--opset",       type=int,   default=17)
+    args = parser.parse_args()
+
+    random.seed(0)
+    samples = collect_images(args.images)
+    if not samples:
+        print(f"[ERROR] No images under {args.images}")
+        sys.exit(1)
+    paths = [path for path, _ in samples]
+
+    print(f"[INFO] Teacher pass over {len(paths)} images...")
+    soft, labels = teacher_logits(paths, args.batch)
+    by_name = {_norm(label): i for i, label in enumerate(labels)}
+    hard = [by_name.get(_norm(folder), -1) if folder else -1 for _, folder in samples]
+    print(f"  {sum(h >= 0 for h in hard)} images carry a hard label")
+
+    order = list(range(len(paths)))
+    random.shuffle(order)
+    n_holdout = int(len(order) * args.holdout)
+    held, train = order[:n_holdout], order[n_holdout:]
+
+    preprocess = dict(RESNET_PREPROCESS)
+    preprocessor = ImagePreprocessor(preprocess)
+    student = build_student(args.arch, len(labels))
+    print(f"[INFO] Distilling into {args.arch} ({len(train)} train / {len(held)} held out)...")
+    student = distill(student, [paths[i] for i in train], soft[train], [hard[i] for i in train],
+                      preprocessor, args.epochs, args.batch, args.lr, args.temperature, args.alpha)
+
+    import torch
+    MODELS_DIR.mkdir(parents=True, exist_ok=True)
+    torch.save(student.state_dict(), MOBILENET_WEIGHTS_PATH)
+    with open(MOBILENET_META_PATH, "w") as f:
+        json.dump({"arch": args.arch, "labels": labels, "preprocess": preprocess,
+                   "teacher": "disease_vit", "images": len(train)}, f, indent=2)
+
+    if held:
+        print(f"\n  {'threshold':>9}  {'coverage':>8}  {'agrees w/ ViT':>13}  {'accuracy':>8}")
+        for row in evaluate(student, [paths[i] for i in held], soft[held], [hard[i] for i in held],
+                            preprocessor, args.batch):
+            agreement = f"{row['agreement']:.2%}" if row["agreement"] is not None else "-"
+            accuracy = f"{row['accuracy']:.2%}" if row["accuracy"] is not None else "-"
+            print(f"  {row['threshold']:>8}%  {row['coverage']:>8.2%}  {agreement:>13}  {accuracy:>8}")
+
+    if args.onnx:
+        print(f"[INFO] ONNX graph: {export_onnx(student, labels, preprocess, args.opset)}")
+
+    print(f"\n[OK] {MOBILENET_WEIGHTS_PATH}")
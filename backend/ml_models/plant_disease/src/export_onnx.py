@@ -0,0 +1,172 @@
+"""
+ONNX Export (disease ViT / pest ResNet50)
+=========================================
+Writes ONNX graphs plus label maps and preprocessing settings for the
+onnxruntime serving backend (services/onnx_backend.py), then checks that
+onnxruntime's probabilities match the torch path within tolerance.
+
+Usage:
+    python export_onnx.py [--model vit|resnet50|both] [--int8] [--images holdout/] [--tolerance 1e-3]
+
+Output (models/onnx/):
+    disease_vit.onnx,    disease_vit.json
+    pest_resnet50.onnx,  pest_resnet50.json
+    *_int8.onnx          with --int8 (onnxruntime dynamic quantization)
+
+Serve with IMAGE_MODEL_BACKEND=onnx.
+
+Requirements:
+    pip install torch torchvision transformers onnx onnxruntime
+"""
+
+import sys
+import argparse
+import json
+from pathlib import Path
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+BASE_DIR    = Path(__file__).resolve().parent.parent
+BACKEND_DIR = BASE_DIR.parent.parent
+ONNX_DIR    = BASE_DIR / "models" / "onnx"
+
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from services.onnx_backend import OnnxImageClassifier, DISEASE_VIT_ONNX, PEST_RESNET_ONNX
+from services.image_preprocessing import hf_processor_config, RESNET_PREPROCESS
+
+IMAGE_EXTS    = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def export_graph(module, dummy, onnx_path: Path, input_name: str, opset: int):
+    """Trace a module that maps an NCHW batch to logits, with a dynamic batch axis."""
+    import torch
+
+    module.eval()
+    with torch.inference_mode():
+        torch.onnx.export(
+            module, (dummy,), str(onnx_path),
+            input_names=[input_name], output_names=["logits"],
+            dynamic_axes={input_name: {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=opset, dynamo=False,
+        )
+
+
+def write_meta(meta_path: Path, labels, preprocess: dict, source: str):
+    with open(meta_path, "w") as f:
+        json.dump({"source": source, "labels": list(labels), "preprocess": preprocess}, f, indent=2)
+
+
+def quantize_graph(onnx_path: Path) -> Path:
+    """
+    onnxruntime dynamic INT8 on MatMul/Gemm (weights int8, activations quantized
+    at runtime). Dynamic ConvInteger is slower than fp32 conv on CPU, so convs
+    stay fp32, same as the torch dynamic path.
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    int8_path = onnx_path.with_name(onnx_path.stem + "_int8.onnx")
+    quantize_dynamic(str(onnx_path), str(int8_path), weight_type=QuantType.QInt8,
+                     op_types_to_quantize=["MatMul", "Gemm"])
+    return int8_path
+
+
+def export_vit(out_dir: Path, opset: int):
+    from services.model_registry import load_hf_image_classifier, logits_module, DISEASE_VIT
+
+    bundle = load_hf_image_classifier(DISEASE_VIT, "fp32")
+    preprocessor, model = bundle["preprocessor"], bundle["model"]
+    config = hf_processor_config(bundle["processor"])
+    labels = [model.config.id2label[i] for i in range(len(model.config.id2label))]
+
+    import torch
+    onnx_path = out_dir / f"{DISEASE_VIT_ONNX}.onnx"
+    export_graph(logits_module(model), torch.zeros(1, 3, *config["size"]), onnx_path, "pixel_values", opset)
+    write_meta(out_dir / f"{DISEASE_VIT_ONNX}.json", labels, config, DISEASE_VIT)
+
+    def torch_proba(images):
+        with torch.inference_mode():
+            logits = model(pixel_values=torch.from_numpy(preprocessor(images))).logits
+        return torch.softmax(logits, dim=-1).numpy()
+
+    return onnx_path, torch_proba
+
+
+def export_resnet(out_dir: Path, opset: int):
+    from services.ml_integration import _build_pest_resnet
+
+    bundle = _build_pest_resnet("fp32", backend="torch")
+    model, preprocessor = bundle["model"], bundle["preprocessor"]
+
+    import torch
+    onnx_path = out_dir / f"{PEST_RESNET_ONNX}.onnx"
+    export_graph(model, torch.zeros(1, 3, 224, 224), onnx_path, "input", opset)
+    write_meta(out_dir / f"{PEST_RESNET_ONNX}.json", bundle["categories"], RESNET_PREPROCESS,
+               "torchvision ResNet50_Weights.DEFAULT")
+
+    def torch_proba(images):
+        with torch.inference_mode():
+            logits = model(torch.from_numpy(preprocessor(images)))
+        return torch.softmax(logits, dim=-1).numpy()
+
+    return onnx_path, torch_proba
+
+
+def sample_images(image_dir: str = None, limit: int = 16):
+    """Held-out images if given, else seeded random RGB images of mixed sizes."""
+    import numpy as np
+    from PIL import Image
+
+    if image_dir:
+        paths = sorted(p for p in Path(image_dir).rglob("*") if p.suffix.lower() in IMAGE_EXTS)[:limit]
+        return [Image.open(p).convert("RGB") for p in paths]
+    rng = np.random.default_rng(0)
+    sizes = [(320, 240), (240, 320), (256, 256), (500, 375)]
+    return [Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+            for w, h in (sizes[i % len(sizes)] for i in range(limit))]
+
+
+def check_parity(onnx_path: Path, meta_path: Path, torch_proba, images, tolerance: float) -> dict:
+    """Max |Δp| and top-1 agreement between the torch path and onnxruntime."""
+    import numpy as np
+
+    expected = torch_proba(images)
+    actual = OnnxImageClassifier(str(onnx_path), str(meta_path)).predict_proba(images)
+    max_diff = float(np.abs(expected - actual).max())
+    agreement = float((expected.argmax(axis=1) == actual.argmax(axis=1)).mean())
+    return {"graph": onnx_path.name, "max_abs_diff": max_diff, "top1_agreement": agreement,
+            "within_tolerance": max_diff <= tolerance}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the image classifiers to ONNX")
+    parser.add_argument("--model",     type=str,   default="both", choices=["vit", "resnet50", "both"])
+    parser.add_argument("--opset",     type=int,   default=17,     help="ONNX opset version")
+    parser.add_argument("--int8",      action="store_true",        help="Also write a dynamically quantized graph")
+    parser.add_argument("--images",    type=str,   default=None,   help="Images for the parity check (default: random)")
+    parser.add_argument("--tolerance", type=float, default=1e-3,   help="Max allowed |Δprobability| vs torch")
+    args = parser.parse_args()
+
+    ONNX_DIR.mkdir(parents=True, exist_ok=True)
+    images = sample_images(args.images)
+    exporters = {"vit": export_vit, "resnet50": export_resnet}
+    failed = False
+
+    for key in (["vit", "resnet50"] if args.model == "both" else [args.model]):
+        print(f"[INFO] Exporting {key}...")
+        onnx_path, torch_proba = exporters[key](ONNX_DIR, args.opset)
+        meta_path = onnx_path.with_suffix(".json")
+        result = check_parity(onnx_path, meta_path, torch_proba, images, args.tolerance)
+        failed |= not result["within_tolerance"]
+        print(f"  {result['graph']}: max |Δp| {result['max_abs_diff']:.2e}, "
+              f"top-1 agreement {result['top1_agreement']:.2%} "
+              f"[{'OK' if result['within_tolerance'] else 'FAIL'}]")
+
+        if args.int8:
+            int8_path = quantize_graph(onnx_path)
+            result = check_parity(int8_path, meta_path, torch_proba, images, float("inf"))
+            print(f"  {result['graph']}: max |Δp| {result['max_abs_diff']:.2e}, "
+                  f"top-1 agreement {result['top1_agreement']:.2%} (int8, informational)")
+
+    print(f"\n[{'ERROR' if failed else 'OK'}] Graphs in {ONNX_DIR}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,207 @@
+"""
+INT8 Quantization Check (ViT / ResNet50)
+========================================
+Compares fp32 and INT8 serving on a held-out image set before turning on
+MODEL_PRECISION=int8: top-1 accuracy, fp32/INT8 agreement, per-image
+latency (decode + preprocessing + forward pass) and process RSS.
+
+Each precision is profiled in its own fresh process, so the RSS numbers
+are not inflated by the other model.
+
+Usage:
+    python quantization_check.py --images path/to/holdout [--model vit|resnet50|both] [--limit 200]
+
+The held-out set is a folder of images. When images sit in per-class
+subfolders named like the model's labels (e.g. Tomato___Late_blight),
+top-1 accuracy is reported; otherwise only agreement.
+
+Requirements:
+    pip install torch torchvision transformers
+"""
+
+import os
+import sys
+import argparse
+import json
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+BASE_DIR    = Path(__file__).resolve().parent.parent
+BACKEND_DIR = BASE_DIR.parent.parent
+MODELS_DIR  = BASE_DIR / "models"
+
+IMAGE_EXTS  = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+WARMUP_IMAGES = 3   # excluded from latency stats
+
+
+def _norm(label: str) -> str:
+    return "".join(ch for ch in str(label).lower() if ch.isalnum())
+
+
+def collect_images(root: str, limit: int = None):
+    """[(path, class folder name or None)] for every image under root."""
+    root = Path(root)
+    paths = sorted(p for p in root.rglob("*") if p.suffix.lower() in IMAGE_EXTS)
+    if limit:
+        paths = paths[:limit]
+    return [(str(p), p.parent.name if p.parent != root else None) for p in paths]
+
+
+def _load_model(model_key: str, precision: str):
+    """(predict(img) -> logits, id -> label map, precision actually served)"""
+    import torch
+
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+    if model_key == "vit":
+        from services.model_registry import load_hf_image_classifier, DISEASE_VIT
+        bundle = load_hf_image_classifier(DISEASE_VIT, precision)
+        preprocessor, model = bundle["preprocessor"], bundle["model"]
+
+        def predict(img):
+            return model(pixel_values=torch.from_numpy(preprocessor([img]))).logits
+
+        return predict, dict(model.config.id2label), bundle["precision"]
+
+    from services.ml_integration import _build_pest_resnet
+    bundle = _build_pest_resnet(precision, backend="torch")
+    preprocessor, model = bundle["preprocessor"], bundle["model"]
+
+    def predict(img):
+        return model(torch.from_numpy(preprocessor([img])))
+
+    return predict, dict(enumerate(bundle["categories"])), bundle["precision"]
+
+
+def _latency_summary(latencies):
+    if not latencies:
+        return None
+    ordered = sorted(latencies)
+    return {
+        "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50":  round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95":  round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+    }
+
+
+def profile(model_key: str, precision: str, images):
+    """Load one model at one precision and run the image set (worker process)."""
+    import torch
+    sys.path.insert(0, str(BACKEND_DIR))
+    from services.model_registry import _rss_bytes
+    from services.image_preprocessing import load_image
+
+    rss_start = _rss_bytes()
+    start = time.perf_counter()
+    predict, labels, served = _load_model(model_key, precision)
+    load_seconds = time.perf_counter() - start
+    rss_loaded = _rss_bytes()
+
+    predictions, confidences, latencies = [], [], []
+    with torch.inference_mode():
+        for i, (path, _) in enumerate(images):
+            with open(path, "rb") as f:
+                data = f.read()
+            t0 = time.perf_counter()
+            img = load_image(data)
+            logits = predict(img)
+            elapsed = time.perf_counter() - t0
+
+            conf, idx = torch.softmax(logits, dim=-1)[0].max(dim=-1)
+            predictions.append(labels[int(idx)])
+            confidences.append(float(conf))
+            if i >= WARMUP_IMAGES or len(images) <= WARMUP_IMAGES:
+                latencies.append(elapsed)
+
+    return {
+        "precision": served,
+        "load_seconds": round(load_seconds, 2),
+        "model_rss_bytes": (rss_loaded - rss_start) if rss_start and rss_loaded else None,
+        "final_rss_bytes": _rss_bytes(),
+        "latency_ms": _latency_summary(latencies),
+        "labels": list(labels.values()),
+        "predictions": predictions,
+        "confidences": confidences,
+    }
+
+
+def _accuracy(images, result):
+    known = {_norm(label) for label in result["labels"]}
+    scored = [(folder, pred) for (_, folder), pred in zip(images, result["predictions"])
+              if folder and _norm(folder) in known]
+    if not scored:
+        return None, 0
+    correct = sum(_norm(folder) == _norm(pred) for folder, pred in scored)
+    return round(correct / len(scored), 4), len(scored)
+
+
+def run_check(model_key: str, images):
+    """Profile fp32 and INT8 in separate processes and compare them."""
+    ctx = mp.get_context("spawn")
+    results = {}
+    for precision in ("fp32", "int8"):
+        print(f"[INFO] Profiling {model_key} @ {precision} on {len(images)} images...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            results[precision] = pool.submit(profile, model_key, precision, images).result()
+
+    fp32, int8 = results["fp32"], results["int8"]
+    agree = sum(a == b for a, b in zip(fp32["predictions"], int8["predictions"]))
+    report = {"model": model_key, "images": len(images),
+              "agreement": round(agree / len(images), 4) if images else None,
+              "mean_abs_confidence_delta": round(
+                  sum(abs(a - b) for a, b in zip(fp32["confidences"], int8["confidences"])) / len(images), 4)
+              if images else None}
+
+    for precision, result in results.items():
+        accuracy, labeled = _accuracy(images, result)
+        report[precision] = {
+            "served_precision": result["precision"],
+            "top1_accuracy": accuracy,
+            "labeled_images": labeled,
+            "load_seconds": result["load_seconds"],
+            "model_rss_mb": round(result["model_rss_bytes"] / 1e6, 1) if result["model_rss_bytes"] else None,
+            "final_rss_mb": round(result["final_rss_bytes"] / 1e6, 1) if result["final_rss_bytes"] else None,
+            "latency_ms": result["latency_ms"],
+        }
+    return report
+
+
+def print_report(report: dict):
+    print(f"\n── {report['model']} ── {report['images']} images, "
+          f"fp32/int8 agreement {report['agreement']:.2%}, "
+          f"mean |Δconf| {report['mean_abs_confidence_delta']:.4f}")
+    print(f"  {'':6} {'served':>7} {'top-1':>8} {'p50 ms':>8} {'p95 ms':>8} {'model MB':>9} {'RSS MB':>8}")
+    for precision in ("fp32", "int8"):
+        r = report[precision]
+        latency = r["latency_ms"] or {}
+        top1 = f"{r['top1_accuracy']:.2%}" if r["top1_accuracy"] is not None else "n/a"
+        print(f"  {precision:6} {r['served_precision']:>7} {top1:>8} {latency.get('p50', 0):>8} "
+              f"{latency.get('p95', 0):>8} {r['model_rss_mb'] or 0:>9} {r['final_rss_mb'] or 0:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare fp32 vs INT8 serving on a held-out image set")
+    parser.add_argument("--images", type=str, required=True,             help="Held-out image folder")
+    parser.add_argument("--model",  type=str, default="both",            choices=["vit", "resnet50", "both"])
+    parser.add_argument("--limit",  type=int, default=None,              help="Use at most this many images")
+    parser.add_argument("--output", type=str, default=str(MODELS_DIR / "quantization_report.json"),
+                        help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    images = collect_images(args.images, args.limit)
+    if not images:
+        print(f"[ERROR] No images found under {args.images}")
+        sys.exit(1)
+
+    reports = [run_check(key, images) for key in (["vit", "resnet50"] if args.model == "both" else [args.model])]
+    for report in reports:
+        print_report(report)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(reports, f, indent=2)
+    print(f"\n[OK] Report written to {args.output}")
@@ -0,0 +1,294 @@
+"""
+Offline Disease Scan (directory / SD card)
+==========================================
+Runs the /api/v1/ml/detect Tier 1 pipeline (keras_disease_service: YOLO
+leaf localization when available, then the ViT) over every image under a
+directory, without the HTTP server.
+
+- Images are read and draft-decoded by a thread pool ahead of inference;
+  the main thread classifies them in batches.
+- One row per image is appended to the output as each batch finishes
+  (CSV, or Parquet part files in an output directory).
+- An image whose inference raises gets a status=error row; the rest of
+  its batch is retried one by one and the scan carries on.
+- Re-running with the same output skips images already recorded, so an
+  interrupted scan resumes where it stopped.
+
+Usage:
+    python scan_directory.py /media/sdcard/DCIM [--output scan.csv] [--batch 16] [--workers 4] [--limit N]
+    python scan_directory.py photos/ --format parquet --output scan_parquet/
+
+Requirements:
+    pip install torch transformers        (pyarrow for --format parquet)
+"""
+
+import os
+import sys
+import argparse
+import csv
+import importlib.util
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+BASE_DIR    = Path(__file__).resolve().parent.parent
+BACKEND_DIR = BASE_DIR.parent.parent
+
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+IMAGE_EXTS     = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+COLUMNS        = ["path", "status", "crop", "disease", "confidence", "severity", "is_healthy",
+                  "leaves", "detections", "error", "scanned_at"]
+PROGRESS_EVERY = 10   # batches between progress lines
+
+
+def collect_images(root: Path):
+    """Image paths under root, relative and sorted (stable order for resuming)."""
+    return sorted(str(p.relative_to(root)) for p in root.rglob("*")
+                  if p.is_file() and p.suffix.lower() in IMAGE_EXTS)
+
+
+# ── Append-only outputs ───────────────────────────────────────────────────────
+
+class CsvSink:
+    """One CSV file, appended row by row; a torn last line is dropped on resume."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def done(self) -> set:
+        if not self.path.exists():
+            return set()
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                # Interrupted mid-row: cut back to the last complete one
+                f.truncate(data.rfind(b"\n") + 1)
+        with open(self.path, "r", newline="", encoding="utf-8") as f:
+            return {row["path"] for row in csv.DictReader(f) if row.get("path")}
+
+    def open(self):
+        new = not self.path.exists() or self.path.stat().st_size == 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=COLUMNS)
+        if new:
+            self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """Directory of Parquet part files; each written batch becomes a new part."""
+
+    def __init__(self, path: Path):
+        if importlib.util.find_spec("pyarrow") is None:
+            print("[ERROR] --format parquet needs pyarrow. Run:")
+            print("    pip install pyarrow")
+            sys.exit(1)
+        self.path = path
+
+    def done(self) -> set:
+        import pyarrow.parquet as pq
+
+        finished = set()
+        for part in sorted(self.path.glob("part-*.parquet")):
+            try:
+                finished.update(pq.read_table(part, columns=["path"]).column("path").to_pylist())
+            except Exception:
+                # Torn part from an interrupted write; its images are rescanned
+                print(f"[WARN] Ignoring unreadable part {part.name}")
+        return finished
+
+    def open(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._run = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self._parts = 0
+
+    def write(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist(rows, schema=pa.schema([
+            ("path", pa.string()), ("status", pa.string()), ("crop", pa.string()),
+            ("disease", pa.string()), ("confidence", pa.float64()), ("severity", pa.string()),
+            ("is_healthy", pa.bool_()), ("leaves", pa.int32()), ("detections", pa.string()),
+            ("error", pa.string()), ("scanned_at", pa.string()),
+        ]))
+        # Write then rename, so a part is either complete or absent
+        final = self.path / f"part-{self._run}-{self._parts:05d}.parquet"
+        temp = final.with_suffix(".tmp")
+        pq.write_table(table, temp)
+        os.replace(temp, final)
+        self._parts += 1
+
+    def close(self):
+        pass
+
+
+# ── Scan ──────────────────────────────────────────────────────────────────────
+
+def _decode(root: Path, relative: str, min_size: int):
+    """(image or None, error or None) - runs on the prefetch pool."""
+    from services.image_preprocessing import load_image
+
+    try:
+        with open(root / relative, "rb") as f:
+            img = load_image(f.read(), min_size)
+        img.load()
+        return img, None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _prefetched(executor, root: Path, paths, min_size: int, depth: int):
+    """Yield (path, image, error) in order while up to `depth` decodes run ahead."""
+    pending = deque()
+    items = iter(paths)
+    for relative in items:
+        pending.append((relative, executor.submit(_decode, root, relative, min_size)))
+        if len(pending) >= depth:
+            break
+    while pending:
+        relative, future = pending.popleft()
+        nxt = next(items, None)
+        if nxt is not None:
+            pending.append((nxt, executor.submit(_decode, root, nxt, min_size)))
+        yield (relative, *future.result())
+
+
+def _row(relative: str, detections, error: str = None) -> dict:
+    scanned_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    if error or not detections:
+        return {"path": relative, "status": "error", "crop": None, "disease": None, "confidence": None,
+                "severity": None, "is_healthy": None, "leaves": 0, "detections": "[]",
+                "error": error or "no prediction", "scanned_at": scanned_at}
+    top = detections[0]
+    return {"path": relative, "status": "ok", "crop": top["crop"], "disease": top["disease"],
+            "confidence": top["confidence"], "severity": top["severity"], "is_healthy": top["is_healthy"],
+            "leaves": len(detections), "detections": json.dumps(detections), "error": None,
+            "scanned_at": scanned_at}
+
+
+def _classify(keras_disease_service, images, batch_size: int):
+    """
+    Detections per image; if the batch raises, each image is retried alone
+    so one bad image only fails its own row ([] results, error messages).
+    """
+    try:
+        return keras_disease_service.predict_disease_batch(images, batch_size), [None] * len(images)
+    except Exception as e:
+        print(f"[WARN] Batch of {len(images)} failed ({type(e).__name__}: {e}); retrying per image")
+
+    results, errors = [], []
+    for img in images:
+        try:
+            results.append(keras_disease_service.predict_disease_batch([img], 1)[0])
+            errors.append(None)
+        except Exception as e:
+            results.append([])
+            errors.append(f"{type(e).__name__}: {e}")
+    return results, errors
+
+
+def scan(root: str, sink, batch_size: int = 16, workers: int = 4, limit: int = None) -> dict:
+    """Classify every not-yet-recorded image under root and append the rows to sink."""
+    from services import keras_disease_service
+
+    root = Path(root)
+    paths = collect_images(root)
+    finished = sink.done()
+    todo = [p for p in paths if p not in finished]
+    print(f"[INFO] {len(paths)} images under {root}, {len(paths) - len(todo)} already scanned, {len(todo)} to go")
+    if limit:
+        todo = todo[:limit]
+    if not todo:
+        return {"images": 0, "errors": 0, "seconds": 0.0, "images_per_second": 0.0}
+
+    if not keras_disease_service.load_keras_model():
+        print("[ERROR] Disease model could not be loaded")
+        sys.exit(1)
+    min_size = keras_disease_service.decode_size()
+
+    sink.open()
+    started = time.perf_counter()
+    infer_seconds, errors, done, batches = 0.0, 0, 0, 0
+    batch = []
+
+    def flush():
+        nonlocal infer_seconds, errors, done, batches
+        decoded = [(p, img) for p, img, err in batch if img is not None]
+        t0 = time.perf_counter()
+        results, failures = _classify(keras_disease_service, [img for _, img in decoded], batch_size)
+        infer_seconds += time.perf_counter() - t0
+        by_path = {p: (detections, failure) for (p, _), detections, failure in zip(decoded, results, failures)}
+
+        rows = []
+        for p, _, err in batch:
+            detections, failure = by_path.get(p, (None, None))
+            rows.append(_row(p, detections, err or failure))
+        sink.write(rows)
+        errors += sum(row["status"] == "error" for row in rows)
+        done += len(rows)
+        batches += 1
+        batch.clear()
+        if batches % PROGRESS_EVERY == 0:
+            elapsed = time.perf_counter() - started
+            print(f"[INFO] {done}/{len(todo)} images, {done / elapsed:.1f} img/s, {errors} errors")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="decode") as executor:
+            for item in _prefetched(executor, root, todo, min_size, depth=max(2 * batch_size, workers)):
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    flush()
+            if batch:
+                flush()
+    except KeyboardInterrupt:
+        print(f"\n[WARN] Interrupted after {done} images; re-run the same command to resume")
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "images": done,
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "images_per_second": round(done / elapsed, 2) if elapsed else 0.0,
+        "inference_seconds": round(infer_seconds, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk disease diagnosis over a directory of leaf photos")
+    parser.add_argument("directory",           type=str,                  help="Folder to scan (recursively)")
+    parser.add_argument("--output",  type=str, default=None,              help="CSV file / Parquet directory "
+                                                                               "(default: ./<folder>_disease_scan.csv)")
+    parser.add_argument("--format",  type=str, default="csv",             choices=["csv", "parquet"])
+    parser.add_argument("--batch",   type=int, default=16,                help="Images per inference batch")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Decode threads")
+    parser.add_argument("--limit",   type=int, default=None,              help="Scan at most this many new images")
+    args = parser.parse_args()
+
+    if not Path(args.directory).is_dir():
+        print(f"[ERROR] Not a directory: {args.directory}")
+        sys.exit(1)
+
+    # Default next to where the command runs: SD cards are often mounted read-only
+    folder = Path(args.directory).resolve().name
+    output = Path(args.output) if args.output else Path(f"{folder}_disease_scan" + (".csv" if args.format == "csv" else ""))
+    sink = CsvSink(output) if args.format == "csv" else ParquetSink(output)
+
+    summary = scan(args.directory, sink, batch_size=args.batch, workers=args.workers, limit=args.limit)
+    print(f"\n[OK] {summary['images']} images in {summary['seconds']}s "
+          f"({summary['images_per_second']} img/s, {summary['errors']} errors) -> {output}")
@@ -5,6 +5,7 @@ Transfer-learns YOLOv8n on the PlantDoc disease dataset.
 
 Usage:
     python train_yolo.py [--epochs 50] [--batch 16] [--imgsz 640]
+    python train_yolo.py --export        # ONNX export of an already trained model
 
 Requirements:
     pip install ultralytics
@@ -165,6 +166,9 @@ def train(epochs: int = 30, batch: int = 16, imgsz: int = 640, device: str = "au
         json.dump(cfg["names"], cf, indent=2)
     print(f"   Classes    : {class_names_dest}")
     
+    if best_dest.exists():
+        export_onnx(str(best_dest), imgsz)
+
     print("\n" + "=" * 60)
     print("  NEXT: Run the backend server to use the trained model!")
     print("=" * 60)
@@ -172,6 +176,25 @@ def train(epochs: int = 30, batch: int = 16, imgsz: int = 640, device: str = "au
     return results
 
 
+def export_onnx(model_path: str = None, imgsz: int = 640):
+    """
+    Export the trained model to ONNX for the CPU leaf-localization stage
+    (services/yolo_disease_service.py runs it with onnxruntime).
+    """
+    if model_path is None:
+        model_path = str(MODELS_DIR / "yolov8n_plant_disease.pt")
+
+    if not Path(model_path).exists():
+        print(f"[ERROR] Model not found: {model_path}")
+        print("  Train first: python src/train_yolo.py")
+        sys.exit(1)
+
+    print(f"\n[EXPORT] Exporting {model_path} to ONNX (imgsz {imgsz})...")
+    onnx_path = YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=False)
+    print(f"   Saved as   : {onnx_path}")
+    return onnx_path
+
+
 def evaluate(model_path: str = None):
     """Evaluate the trained model and print mAP metrics."""
     if model_path is None:
@@ -203,10 +226,13 @@ if __name__ == "__main__":
     parser.add_argument("--device",  type=str,   default="auto",help="Device: cpu, 0, auto")
     parser.add_argument("--resume",  action="store_true",       help="Resume training from previous checkpoint")
     parser.add_argument("--eval",    action="store_true",       help="Only run evaluation")
+    parser.add_argument("--export",  action="store_true",       help="Only export the trained model to ONNX")
     args = parser.parse_args()
 
     if args.eval:
         evaluate()
+    elif args.export:
+        export_onnx(imgsz=args.imgsz)
     else:
         train(
             epochs = args.epochs,
@@ -11,10 +11,10 @@ STRICT RULES:
 import os
 import json
 from typing import Optional, Dict, Any
-import io
 from . import gemini_service
 from . import ollama_service
-from .keras_disease_service import predict_disease as predict_keras
+from .keras_disease_service import predict_disease as predict_keras, decode_size as keras_decode_size
+from .image_preprocessing import load_image
 
 # Model settings
 # Gemini Service is handled via .gemini_service
@@ -80,13 +80,11 @@ def analyze_image_once(image_bytes: bytes, lang_hint: str = 'en') -> str:
     Analyze an image EXACTLY ONCE and return description with ML Vision diagnostics.
     """
     try:
-        # 1. Basic Metadata
-        from PIL import Image
-        img = Image.open(io.BytesIO(image_bytes))
-        width, height = img.size
+        # 1. Decode once (draft-scaled to what the disease pipeline needs, upright RGB)
+        img = load_image(image_bytes, keras_decode_size())
         
         # 2. Vision Analysis (Local Keras)
-        disease_res = predict_keras(image_bytes)
+        disease_res = predict_keras(img)
         
         # 3. Synthesize Context
         description = f"VISUAL DIAGNOSIS REPORT:\n"
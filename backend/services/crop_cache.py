@@ -0,0 +1,161 @@
+"""
+Crop Recommendation Result Cache
+================================
+LRU cache of crop-model probabilities keyed on quantized soil/climate
+features, so near-identical readings (N=90 vs 90.2) skip the ensemble.
+
+Only the probability vector is cached; the response (reasons, reasoning)
+is still built from the caller's exact values.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+
+# Default bucket width per feature (same units as the request)
+DEFAULT_BUCKETS = {
+    "N": 1.0,
+    "P": 1.0,
+    "K": 1.0,
+    "temperature": 0.5,
+    "humidity": 1.0,
+    "ph": 0.1,
+    "rainfall": 5.0,
+}
+
+
+def parse_buckets(spec: str) -> Dict[str, float]:
+    """Parse 'N=1,ph=0.05' into a bucket map layered over DEFAULT_BUCKETS."""
+    buckets = dict(DEFAULT_BUCKETS)
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        name, width = part.split("=", 1)
+        name = name.strip()
+        if name in buckets and float(width) > 0:
+            buckets[name] = float(width)
+    return buckets
+
+
+class QuantizedLRUCache:
+    """Thread-safe LRU keyed on per-feature quantization buckets."""
+
+    def __init__(self, features: Sequence[str], buckets: Optional[Dict[str, float]] = None,
+                 max_size: int = 4096, check_interval: float = 2.0):
+        self.features = list(features)
+        self.buckets = dict(buckets or DEFAULT_BUCKETS)
+        self._widths = [self.buckets[name] for name in self.features]
+        self.max_size = max_size
+        self.check_interval = check_interval
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        # Model file the cached results came from
+        self._model_path = None
+        self._model_signature = None
+        self._last_check = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def make_key(self, row, *extra):
+        """Bucket index per feature; None when any value is not finite."""
+        key = []
+        for value, width in zip(row, self._widths):
+            value = float(value)
+            if not math.isfinite(value):
+                return None
+            key.append(math.floor(value / width + 0.5))
+        return tuple(key) + extra
+
+    def get(self, key):
+        if key is None or not self.enabled:
+            return None
+        self._check_model_file()
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if key is None or not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def bind_model(self, model_path: Optional[str]):
+        """Tie cached results to a model file; clears on (re)bind."""
+        self._model_path = model_path
+        self._model_signature = _file_signature(model_path)
+        self._last_check = time.monotonic()
+        self.clear()
+
+    def _check_model_file(self):
+        # stat() at most once per check_interval
+        if self._model_path is None:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        signature = _file_signature(self._model_path)
+        if signature != self._model_signature:
+            self._model_signature = signature
+            self.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "buckets": self.buckets,
+            "model_path": self._model_path,
+        }
+
+
+def _file_signature(path: Optional[str]):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except (OSError, TypeError):
+        return None
+
+
+def create_from_env(features: Sequence[str]) -> QuantizedLRUCache:
+    """Build the cache from CROP_CACHE_SIZE / CROP_CACHE_BUCKETS / CROP_CACHE_CHECK_SECONDS."""
+    return QuantizedLRUCache(
+        features,
+        buckets=parse_buckets(os.getenv("CROP_CACHE_BUCKETS", "")),
+        max_size=int(os.getenv("CROP_CACHE_SIZE", "4096")),
+        check_interval=float(os.getenv("CROP_CACHE_CHECK_SECONDS", "2")),
+    )
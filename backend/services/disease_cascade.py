@@ -0,0 +1,216 @@
+"""
+Disease Model Cascade
+=====================
+Confidence-gated early exit for /api/v1/ml/detect:
+
+  1. mobilenet - MobileNetV3 distilled from the ViT on the same labels
+                 (ml_models/plant_disease/src/distill_mobilenet.py); answers
+                 when its top-1 confidence reaches CASCADE_FAST_THRESHOLD %
+  2. vit       - the ViT in keras_disease_service, for everything else
+  3. gemini    - Gemini vision, for images the ViT scores below
+                 CASCADE_VIT_THRESHOLD %
+
+CASCADE_MODE=auto (default) enables stage 1 when the distilled model has
+been written, off always starts at the ViT. DISEASE_MOBILENET_BACKEND=onnx
+serves models/onnx/disease_mobilenet.onnx instead of the torch weights.
+Per-stage exit rates and end-to-end latency percentiles come from stats();
+perceptual-cache hits are counted as their own "cache" exit.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional, Sequence
+
+from PIL import Image
+
+from .model_registry import registry as model_registry, load_policy
+from .onnx_backend import load_onnx_classifier, model_backend, model_files
+from .image_preprocessing import ImagePreprocessor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOBILENET_MODELS_DIR = os.path.join(BASE_DIR, "ml_models", "plant_disease", "models")
+MOBILENET_WEIGHTS_PATH = os.path.join(MOBILENET_MODELS_DIR, "disease_mobilenet.pt")
+MOBILENET_META_PATH = os.path.join(MOBILENET_MODELS_DIR, "disease_mobilenet.json")
+DISEASE_MOBILENET_ONNX = "disease_mobilenet"
+
+DISEASE_MOBILENET = "disease_mobilenet"
+
+# "auto" (default: on when the distilled model exists) or "off"
+CASCADE_MODE = os.getenv("CASCADE_MODE", "auto").lower()
+# Stage 1 answers at or above this top-1 confidence (%)
+CASCADE_FAST_THRESHOLD = float(os.getenv("CASCADE_FAST_THRESHOLD", "90"))
+# Below this ViT confidence (%) the request goes on to Gemini
+CASCADE_VIT_THRESHOLD = float(os.getenv("CASCADE_VIT_THRESHOLD", "10"))
+CASCADE_LATENCY_WINDOW = int(os.getenv("CASCADE_LATENCY_WINDOW", "1000"))
+
+# "cache": answered from the perceptual result cache, no model ran
+STAGES = ("cache", "mobilenet", "vit", "gemini", "none")
+
+_fast = None
+_fast_lock = threading.Lock()
+# Set when loading raised, so requests don't retry a broken model
+_load_failed = False
+
+
+def model_exists() -> bool:
+    """The distilled model is on disk for the configured backend (torch weights or ONNX graph)."""
+    if model_backend("DISEASE_MOBILENET_BACKEND") == "onnx":
+        if all(os.path.exists(path) for path in model_files(DISEASE_MOBILENET_ONNX)):
+            return True
+    return os.path.exists(MOBILENET_WEIGHTS_PATH) and os.path.exists(MOBILENET_META_PATH)
+
+
+def enabled() -> bool:
+    return CASCADE_MODE != "off" and model_exists()
+
+
+def _load_mobilenet() -> dict:
+    if model_backend("DISEASE_MOBILENET_BACKEND") == "onnx":
+        try:
+            return load_onnx_classifier(DISEASE_MOBILENET_ONNX)
+        except Exception as e:
+            print(f"[ML] ONNX {DISEASE_MOBILENET} unavailable ({e}); using torch")
+
+    import torch
+    from torchvision import models
+
+    with open(MOBILENET_META_PATH, "r") as f:
+        meta = json.load(f)
+    model = getattr(models, meta.get("arch", "mobilenet_v3_small"))(weights=None, num_classes=len(meta["labels"]))
+    model.load_state_dict(torch.load(MOBILENET_WEIGHTS_PATH, map_location="cpu", weights_only=True))
+    model.eval()
+    return {"model": model, "preprocessor": ImagePreprocessor(meta["preprocess"]), "labels": meta["labels"],
+            "name": DISEASE_MOBILENET, "precision": "fp32", "backend": "torch"}
+
+
+if enabled():
+    model_registry.register(DISEASE_MOBILENET, _load_mobilenet,
+                            policy=load_policy("DISEASE_MOBILENET_LOAD_POLICY"))
+
+
+def load_model() -> bool:
+    """Take this module's reference to the distilled model (loaded on first use)."""
+    global _fast, _load_failed
+    if _fast is not None:
+        return True
+    if not enabled() or _load_failed:
+        return False
+    with _fast_lock:
+        if _fast is None:
+            try:
+                _fast = model_registry.acquire(DISEASE_MOBILENET, on_idle=_release_idle)
+            except Exception as e:
+                _load_failed = True
+                print(f"[ML] Cascade stage 1 ({DISEASE_MOBILENET}) failed to load: {e}")
+                return False
+    return True
+
+
+def _release_idle() -> bool:
+    """Registry idle hook (lazy policy); the next cascade request reloads it."""
+    global _fast
+    with _fast_lock:
+        if _fast is None:
+            return False
+        _fast = None
+    model_registry.release(DISEASE_MOBILENET, on_idle=_release_idle)
+    return True
+
+
+def is_ready() -> bool:
+    return _fast is not None
+
+
+def fast_top1(images: Sequence[Image.Image]) -> Optional[List[tuple]]:
+    """
+    One MobileNet pass over several images -> [(label, confidence %), ...],
+    or None when stage 1 is not loaded (loads it on first use).
+    """
+    fast = _fast
+    if fast is None:
+        if not load_model():
+            return None
+        fast = _fast
+    start = time.perf_counter()
+    if fast["backend"] == "onnx":
+        results = fast["model"].top1(images)
+    else:
+        import torch
+
+        with torch.inference_mode():
+            logits = fast["model"](torch.from_numpy(fast["preprocessor"](images)))
+            confidences, indices = torch.softmax(logits, dim=-1).max(dim=-1)
+        results = list(zip(indices.tolist(), confidences.tolist()))
+    model_registry.record_latency(DISEASE_MOBILENET, time.perf_counter() - start)
+    return [(fast["labels"][idx], round(conf * 100, 2)) for idx, conf in results]
+
+
+def _percentiles(values) -> Dict[str, float]:
+    values = sorted(values)
+    if not values:
+        return {}
+
+    def at(q):
+        return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2)
+
+    return {"window": len(values), "mean": round(sum(values) / len(values) * 1000, 2),
+            "p50": at(0.50), "p90": at(0.90), "p95": at(0.95), "p99": at(0.99)}
+
+
+class CascadeStats:
+    """Where requests exit and how long they take end to end, overall and per exit stage."""
+
+    def __init__(self, window: int = CASCADE_LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self.exits = Counter()
+        self.latencies = deque(maxlen=window)
+        self.stage_latencies = {stage: deque(maxlen=window) for stage in STAGES}
+        # Per classified image / leaf crop, including offline scans
+        self.items = 0
+        self.fast_exits = 0
+
+    def record_items(self, items: int, fast_exits: int):
+        with self._lock:
+            self.items += items
+            self.fast_exits += fast_exits
+
+    def record_request(self, stage: str, seconds: float):
+        with self._lock:
+            self.exits[stage] += 1
+            self.latencies.append(seconds)
+            self.stage_latencies[stage].append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            exits = dict(self.exits)
+            latencies = list(self.latencies)
+            per_stage = {stage: list(values) for stage, values in self.stage_latencies.items()}
+            items, fast_exits = self.items, self.fast_exits
+        requests = sum(exits.values())
+        return {
+            "requests": requests,
+            "exits": {stage: exits.get(stage, 0) for stage in STAGES},
+            "exit_rates": {stage: round(exits.get(stage, 0) / requests, 4) if requests else 0.0
+                           for stage in STAGES},
+            "latency_ms": _percentiles(latencies),
+            "latency_ms_by_exit": {stage: _percentiles(values) for stage, values in per_stage.items() if values},
+            "items": items,
+            "item_fast_exit_rate": round(fast_exits / items, 4) if items else 0.0,
+        }
+
+
+stats = CascadeStats()
+
+
+def get_stats() -> Dict[str, Any]:
+    return {
+        "enabled": enabled(),
+        "stage1_loaded": is_ready(),
+        "stage1_model": DISEASE_MOBILENET,
+        "fast_threshold": CASCADE_FAST_THRESHOLD,
+        "vit_threshold": CASCADE_VIT_THRESHOLD,
+        **stats.snapshot(),
+    }
@@ -0,0 +1,193 @@
+"""
+Perceptual-Hash Result Cache
+============================
+Near-duplicate cache for image predictions. Uploads are keyed on a
+difference hash (dHash) of the decoded image, so a recompressed, resized
+or re-sent copy of the same leaf photo matches within a small Hamming
+distance and skips the model.
+
+Lookups go through a BK-tree over the hashes. Entries are evicted LRU;
+evicted hashes stay in the tree as tombstones until it is rebuilt.
+"""
+
+import copy
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+def dhash(img: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash: grayscale, shrink to (hash_size + 1) x hash_size and
+    set one bit per horizontally adjacent pixel pair that gets brighter.
+    """
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes under Hamming distance."""
+
+    def __init__(self):
+        self._root = None   # [hash, {distance: child node}]
+        self.size = 0
+
+    def add(self, value: int):
+        if self._root is None:
+            self._root = [value, {}]
+            self.size = 1
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [value, {}]
+                self.size += 1
+                return
+            node = child
+
+    def search(self, value: int, radius: int):
+        """[(distance, hash)] within radius, closest first."""
+        if self._root is None:
+            return []
+        found, stack = [], [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.append((distance, node[0]))
+            # Triangle inequality: only children in [d - r, d + r] can match
+            for edge, child in node[1].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        found.sort()
+        return found
+
+
+class PerceptualCache:
+    """Thread-safe LRU of results keyed on dHash, matched within max_distance bits."""
+
+    def __init__(self, max_size: int = 2048, max_distance: int = 4, hash_size: int = 8):
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+
+        self._entries = OrderedDict()
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rebuilds = 0
+        self.hit_distance_total = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def make_key(self, img: Image.Image) -> Optional[int]:
+        if not self.enabled:
+            return None
+        return dhash(img, self.hash_size)
+
+    def get(self, key: Optional[int]) -> Tuple[Any, Optional[int]]:
+        """(deep copy of the cached value, Hamming distance) or (None, None)."""
+        if key is None or not self.enabled:
+            return None, None
+        with self._lock:
+            match = None
+            if key in self._entries:
+                match = (0, key)
+            else:
+                for distance, value in self._tree.search(key, self.max_distance):
+                    if value in self._entries:
+                        match = (distance, value)
+                        break
+            if match is None:
+                self.misses += 1
+                return None, None
+
+            distance, value = match
+            self._entries.move_to_end(value)
+            self.hits += 1
+            self.hit_distance_total += distance
+            if distance == 0:
+                self.exact_hits += 1
+            else:
+                self.near_hits += 1
+            result = self._entries[value]
+        # Callers decorate the detections they get back
+        return copy.deepcopy(result), distance
+
+    def put(self, key: Optional[int], value):
+        if key is None or not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = copy.deepcopy(value)
+            self._entries.move_to_end(key)
+            self._tree.add(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            # Drop tombstones once they outnumber live entries
+            if self._tree.size > 2 * max(len(self._entries), 1):
+                self._rebuild()
+
+    def _rebuild(self):
+        self._tree = BKTree()
+        for key in self._entries:
+            self._tree.add(key)
+        self.rebuilds += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tree = BKTree()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            size, tree_size = len(self._entries), self._tree.size
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": size,
+            "max_size": self.max_size,
+            "tree_nodes": tree_size,
+            "hash_bits": self.hash_size * self.hash_size,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "mean_hit_distance": round(self.hit_distance_total / self.hits, 2) if self.hits else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "rebuilds": self.rebuilds,
+        }
+
+
+def create_from_env() -> PerceptualCache:
+    """Build the cache from DISEASE_CACHE_SIZE / DISEASE_CACHE_MAX_DISTANCE / DISEASE_CACHE_HASH_SIZE."""
+    return PerceptualCache(
+        max_size=int(os.getenv("DISEASE_CACHE_SIZE", "2048")),
+        max_distance=int(os.getenv("DISEASE_CACHE_MAX_DISTANCE", "4")),
+        hash_size=int(os.getenv("DISEASE_CACHE_HASH_SIZE", "8")),
+    )
@@ -0,0 +1,144 @@
+"""
+Shared Image Decode / Preprocessing
+===================================
+One path from uploaded bytes to classifier input for every image model
+(disease ViT and pest ResNet50, torch or ONNX):
+
+- JPEG draft mode: libjpeg decodes straight at 1/2, 1/4 or 1/8 scale, just
+  above the size the models need, instead of the full 12 MP frame.
+- EXIF orientation is applied, so phone photos are upright.
+- Resize/crop with PIL, then normalization in one vectorized NumPy pass
+  into a per-thread reusable (N, 3, H, W) float32 buffer.
+"""
+
+import io
+import os
+import threading
+from typing import Optional, Sequence, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Smallest side kept by draft decoding; the ResNet path resizes to 256
+DECODE_MIN_SIZE = int(os.getenv("IMAGE_DECODE_MIN_SIZE", "256"))
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+# torchvision Resize(256) + CenterCrop(224) + Normalize(ImageNet), as used by ResNet50
+RESNET_PREPROCESS = {
+    "mode": "resize_crop",
+    "resize": 256,
+    "crop": 224,
+    "resample": int(Image.BILINEAR),
+    "mean": IMAGENET_MEAN,
+    "std": IMAGENET_STD,
+}
+
+
+def load_image(image: Union[bytes, bytearray, Image.Image], min_size: int = DECODE_MIN_SIZE) -> Image.Image:
+    """
+    Decode uploaded bytes into an upright RGB image no larger than needed
+
+    JPEGs are draft-decoded so both sides stay >= min_size; other formats
+    decode normally. Already-decoded images pass through (orientation and
+    mode are still normalized). info["source_size"] keeps the upright
+    full-resolution size, for mapping boxes back to the uploaded photo.
+    """
+    if isinstance(image, Image.Image):
+        img = image
+    else:
+        img = Image.open(io.BytesIO(image))
+        img.info["source_size"] = img.size
+        if img.format == "JPEG" and min_size:
+            img.draft("RGB", (min_size, min_size))
+
+    source_size = img.info.get("source_size", img.size)
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    # Rotated by EXIF: swap the recorded size to match
+    if (img.width > img.height) != (source_size[0] > source_size[1]) and img.width != img.height:
+        source_size = (source_size[1], source_size[0])
+    img.info["source_size"] = source_size
+    return img
+
+
+def hf_processor_config(processor) -> dict:
+    """Resize / normalize settings of a Hugging Face ViT image processor."""
+    size = processor.size
+    height, width = (size["height"], size["width"]) if "height" in size else (size["shortest_edge"],) * 2
+    return {
+        "mode": "resize",
+        "size": [int(height), int(width)],
+        "resample": int(getattr(processor, "resample", Image.BILINEAR)),
+        "mean": [float(v) for v in processor.image_mean],
+        "std": [float(v) for v in processor.image_std],
+    }
+
+
+class ImagePreprocessor:
+    """
+    Geometry + normalization for one model's input spec
+
+    config is the dict stored next to exported ONNX graphs:
+        {"mode": "resize", "size": [H, W], ...} or
+        {"mode": "resize_crop", "resize": 256, "crop": 224, ...}
+    plus "mean", "std" (0-1 scale) and an optional PIL "resample" filter.
+    """
+
+    def __init__(self, config: dict):
+        self.config = dict(config)
+        self.resample = int(self.config.get("resample", Image.BILINEAR))
+        if self.config["mode"] == "resize":
+            self.height, self.width = (int(v) for v in self.config["size"])
+        else:
+            self.height = self.width = int(self.config["crop"])
+
+        # (x / 255 - mean) / std folded into one subtract and one multiply
+        mean = np.asarray(self.config["mean"], dtype=np.float32).reshape(3, 1, 1)
+        std = np.asarray(self.config["std"], dtype=np.float32).reshape(3, 1, 1)
+        self._offset = mean * 255.0
+        self._scale = 1.0 / (std * 255.0)
+        self._local = threading.local()
+
+    def resize(self, img: Image.Image) -> Image.Image:
+        """Model geometry: plain resize, or shorter-side resize + center crop (torchvision semantics)."""
+        if self.config["mode"] == "resize":
+            return img.resize((self.width, self.height), self.resample)
+
+        width, height = img.size
+        target = int(self.config["resize"])
+        short, long = (width, height) if width <= height else (height, width)
+        new_long = int(target * long / short)
+        new_size = (target, new_long) if width <= height else (new_long, target)
+        img = img.resize(new_size, self.resample)
+
+        left = int(round((new_size[0] - self.width) / 2.0))
+        top = int(round((new_size[1] - self.height) / 2.0))
+        return img.crop((left, top, left + self.width, top + self.height))
+
+    def _buffer(self, n: int) -> np.ndarray:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or len(buffer) < n:
+            buffer = np.empty((n, 3, self.height, self.width), dtype=np.float32)
+            self._local.buffer = buffer
+        return buffer[:n]
+
+    def __call__(self, images: Sequence[Image.Image], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Normalized (N, 3, H, W) float32 batch from images decoded by load_image
+
+        Written into `out` when given (e.g. a shared-memory slab), otherwise
+        into this thread's reusable buffer: consume that view (run the
+        model / copy it) before the next call on the same thread.
+        """
+        if out is None:
+            out = self._buffer(len(images))
+        for i, img in enumerate(images):
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            pixels = np.asarray(self.resize(img), dtype=np.uint8).transpose(2, 0, 1)
+            np.subtract(pixels, self._offset, out=out[i])
+            out[i] *= self._scale
+        return out
@@ -0,0 +1,526 @@
+"""
+Process-Pool Image Inference
+============================
+Optional pool of worker processes that each hold the image models (disease
+ViT, pest ResNet50) so forward passes run outside the API process and scale
+across cores instead of sharing its GIL and torch threads.
+
+- The API process only decodes and preprocesses: batches are written by
+  ImagePreprocessor straight into a per-worker multiprocessing.shared_memory
+  slab, and the worker wraps the same memory as its input tensor (no
+  pickling of images or tensors). Only (class index, probability) pairs
+  come back over the pipe.
+- A monitor thread checks each idle worker every INFERENCE_POOL_HEALTH_SECONDS
+  (process alive + ping); dead or hung workers are restarted, and a request
+  that hits a crashed worker is retried once on the restarted one.
+
+Enabled with INFERENCE_POOL_WORKERS=N (0 = off, models run in-process).
+INFERENCE_POOL_TORCH_THREADS sets intra-op threads per worker (default:
+cores / workers), INFERENCE_POOL_MODELS which models move to the pool
+(disease_vit, pest_resnet). Workers run INFERENCE_POOL_WARMUP_RUNS synthetic
+batches per model before reporting ready.
+
+The startup loader starts the pool. Requests never wait for it: while it
+is down pool_for() returns None at once (services run the models
+in-process) and restarts it on a background thread, at most once per
+INFERENCE_POOL_RETRY_SECONDS after a failed start.
+"""
+
+import os
+import queue
+import threading
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .image_preprocessing import ImagePreprocessor
+
+INFERENCE_POOL_WORKERS = int(os.getenv("INFERENCE_POOL_WORKERS", "0"))
+INFERENCE_POOL_TORCH_THREADS = int(os.getenv("INFERENCE_POOL_TORCH_THREADS", "0"))
+INFERENCE_POOL_MODELS = [m.strip() for m in os.getenv("INFERENCE_POOL_MODELS", "disease_vit,pest_resnet").split(",")
+                         if m.strip()]
+INFERENCE_POOL_MAX_BATCH = int(os.getenv("INFERENCE_POOL_MAX_BATCH", "8"))
+INFERENCE_POOL_TIMEOUT = float(os.getenv("INFERENCE_POOL_TIMEOUT", "60"))
+INFERENCE_POOL_START_TIMEOUT = float(os.getenv("INFERENCE_POOL_START_TIMEOUT", "600"))
+INFERENCE_POOL_HEALTH_SECONDS = float(os.getenv("INFERENCE_POOL_HEALTH_SECONDS", "10"))
+# Synthetic passes per model at batch 1 and max batch before a worker reports ready
+INFERENCE_POOL_WARMUP_RUNS = int(os.getenv("INFERENCE_POOL_WARMUP_RUNS", "2"))
+# Backoff after a failed start before the pool is started again
+INFERENCE_POOL_RETRY_SECONDS = float(os.getenv("INFERENCE_POOL_RETRY_SECONDS", "300"))
+
+# Set inside worker processes, so their services run the models in-process
+_CHILD_ENV = "INFERENCE_POOL_CHILD"
+
+_pool = None
+_pool_lock = threading.Lock()
+# Last failed start: (time.monotonic(), error message)
+_start_failure = None
+# A background start (pool_for) is in progress
+_starting = False
+_starting_lock = threading.Lock()
+
+
+class PoolUnavailable(RuntimeError):
+    """The pool failed to start and is backing off before the next attempt."""
+
+
+def enabled() -> bool:
+    """True in the API process when INFERENCE_POOL_WORKERS > 0."""
+    return INFERENCE_POOL_WORKERS > 0 and os.getenv(_CHILD_ENV) != "1"
+
+
+def serves(model: str) -> bool:
+    """Whether `model` (disease_vit / pest_resnet) runs in the pool instead of in-process."""
+    return enabled() and model in INFERENCE_POOL_MODELS
+
+
+def default_torch_threads(workers: int) -> int:
+    return INFERENCE_POOL_TORCH_THREADS or max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+# ── Worker process ────────────────────────────────────────────────────────────
+
+def _load_runner(model: str):
+    """(batch -> probabilities, {'preprocess', 'labels'}) for one model, built in the worker."""
+    if model == "disease_vit":
+        from .model_registry import registry, DISEASE_VIT
+        bundle = registry.acquire(DISEASE_VIT)
+    elif model == "pest_resnet":
+        from .ml_integration import model_registry as registry, PEST_RESNET
+        bundle = registry.acquire(PEST_RESNET)
+    else:
+        raise ValueError(f"unknown pool model: {model}")
+
+    if bundle.get("backend") == "onnx":
+        classifier = bundle["model"]
+        return classifier.proba_from_batch, {"preprocess": classifier.config, "labels": list(classifier.labels)}
+
+    import torch
+
+    net = bundle["model"]
+    if "processor" in bundle:
+        # Hugging Face classifier
+        labels = [net.config.id2label[i] for i in range(len(net.config.id2label))]
+        forward = bundle["forward"]
+    else:
+        labels = list(bundle["categories"])
+        forward = net
+
+    def run(batch: np.ndarray) -> np.ndarray:
+        with torch.inference_mode():
+            return torch.softmax(forward(torch.from_numpy(batch)), dim=-1).numpy()
+
+    return run, {"preprocess": bundle["preprocessor"].config, "labels": labels}
+
+
+def _warm_runner(run, preprocess: dict, batch_sizes: Sequence[int], runs: int):
+    preprocessor = ImagePreprocessor(preprocess)
+    for size in sorted(set(batch_sizes)):
+        batch = np.zeros((size, 3, preprocessor.height, preprocessor.width), dtype=np.float32)
+        for _ in range(runs):
+            run(batch)
+
+
+def _worker_main(conn, models: Sequence[str], torch_threads: int, max_batch: int = INFERENCE_POOL_MAX_BATCH):
+    """Worker loop: load and warm models, then answer ('run', model, shape, slab) / ('ping',) / ('stop',)."""
+    os.environ[_CHILD_ENV] = "1"
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+    except ImportError:
+        pass
+
+    try:
+        runners, meta = {}, {}
+        for model in models:
+            runners[model], meta[model] = _load_runner(model)
+            if INFERENCE_POOL_WARMUP_RUNS > 0:
+                _warm_runner(runners[model], meta[model]["preprocess"], (1, max_batch), INFERENCE_POOL_WARMUP_RUNS)
+        conn.send(("ready", meta))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+
+    shm = None
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message[0] == "stop":
+            break
+        if message[0] == "ping":
+            conn.send(("pong", os.getpid()))
+            continue
+        _, model, shape, slab = message
+        try:
+            if shm is None or shm.name != slab:
+                if shm is not None:
+                    shm.close()
+                shm = shared_memory.SharedMemory(name=slab)
+            batch = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            probabilities = runners[model](batch)
+            del batch
+            best = probabilities.argmax(axis=1)
+            conn.send(("ok", [(int(i), float(probabilities[row, i])) for row, i in enumerate(best)]))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+    if shm is not None:
+        shm.close()
+
+
+# ── API process side ──────────────────────────────────────────────────────────
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+class _Worker:
+    """One worker process, its pipe and its shared-memory input slab."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.shm = None
+        self.lock = threading.Lock()
+        self.process = None
+        self.conn = None
+        self.meta = {}
+        self.jobs = 0
+        self.errors = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+        self.last_ping_ms = None
+        self.started_at = None
+        self.last_error = None
+
+    def allocate(self, slab_bytes: int):
+        self.shm = shared_memory.SharedMemory(create=True, size=slab_bytes)
+
+    def release(self):
+        if self.shm is not None:
+            self.shm.close()
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = None
+
+    def input_view(self, shape) -> np.ndarray:
+        return np.ndarray(shape, dtype=np.float32, buffer=self.shm.buf)
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def launch(self, ctx, models, torch_threads, max_batch):
+        parent, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child, list(models), torch_threads, max_batch),
+                                   name=f"inference-worker-{self.index}", daemon=True)
+        self.process.start()
+        child.close()
+        self.conn = parent
+
+    def wait_ready(self, timeout):
+        parent = self.conn
+        if not parent.poll(timeout):
+            self.stop()
+            raise TimeoutError(f"inference worker {self.index} did not load its models in {timeout:.0f}s")
+        try:
+            status, payload = parent.recv()
+        except EOFError:
+            self.stop()
+            raise WorkerCrashed(f"inference worker {self.index} exited while loading")
+        if status != "ready":
+            self.stop()
+            raise RuntimeError(f"inference worker {self.index} failed to load: {payload}")
+        self.meta = payload
+        self.started_at = time.time()
+
+    def start(self, ctx, models, torch_threads, max_batch, timeout):
+        self.launch(ctx, models, torch_threads, max_batch)
+        self.wait_ready(timeout)
+
+    def stop(self, grace: float = 5.0):
+        if self.conn is not None:
+            try:
+                self.conn.send(("stop",))
+            except (OSError, ValueError):
+                pass
+        if self.process is not None:
+            self.process.join(grace)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        if self.conn is not None:
+            self.conn.close()
+        self.process, self.conn = None, None
+
+    def request(self, message, timeout: float):
+        """Send one message and wait for the reply; WorkerCrashed when the process is gone or hung."""
+        try:
+            self.conn.send(message)
+            if not self.conn.poll(timeout):
+                raise WorkerCrashed(f"inference worker {self.index} timed out after {timeout:.0f}s")
+            return self.conn.recv()
+        except (EOFError, OSError, BrokenPipeError) as e:
+            raise WorkerCrashed(f"inference worker {self.index} died: {e}")
+
+
+class InferencePool:
+    """Fixed set of model-holding worker processes fed through shared memory."""
+
+    def __init__(self, models: Sequence[str] = None, workers: int = None, torch_threads: int = None,
+                 max_batch: int = INFERENCE_POOL_MAX_BATCH, timeout: float = INFERENCE_POOL_TIMEOUT,
+                 health_interval: float = INFERENCE_POOL_HEALTH_SECONDS):
+        self.models = list(models or INFERENCE_POOL_MODELS)
+        self.size = max(1, workers or INFERENCE_POOL_WORKERS)
+        self.torch_threads = torch_threads or default_torch_threads(self.size)
+        self.max_batch = max(1, max_batch)
+        self.timeout = timeout
+        self.health_interval = health_interval
+
+        self._ctx = mp.get_context("spawn")
+        self._workers: List[_Worker] = []
+        self._idle = queue.Queue()
+        self._preprocessors: Dict[str, ImagePreprocessor] = {}
+        self.labels: Dict[str, List[str]] = {}
+        self._stop = threading.Event()
+        self._monitor = None
+        self._stats_lock = threading.Lock()
+        self.retries = 0
+
+    def start(self, start_timeout: float = INFERENCE_POOL_START_TIMEOUT):
+        """Spawn the workers and wait until each has loaded its models."""
+        started = time.perf_counter()
+        try:
+            # Launch all workers first so they load their models in parallel
+            for index in range(self.size):
+                worker = _Worker(index)
+                self._workers.append(worker)
+                worker.launch(self._ctx, self.models, self.torch_threads, self.max_batch)
+            deadline = time.monotonic() + start_timeout
+            for worker in self._workers:
+                worker.wait_ready(max(0.0, deadline - time.monotonic()))
+        except Exception:
+            self.shutdown()
+            raise
+
+        meta = self._workers[0].meta
+        for model in self.models:
+            self._preprocessors[model] = ImagePreprocessor(meta[model]["preprocess"])
+            self.labels[model] = meta[model]["labels"]
+
+        # Input slab per worker, sized for the largest model input at max_batch
+        slab_bytes = max(self.max_batch * 3 * p.height * p.width * 4 for p in self._preprocessors.values())
+        for worker in self._workers:
+            worker.allocate(slab_bytes)
+            self._idle.put(worker)
+
+        self._monitor = threading.Thread(target=self._monitor_loop, name="inference-pool-monitor", daemon=True)
+        self._monitor.start()
+        print(f"[ML] Inference pool: {self.size} workers x {self.torch_threads} torch threads "
+              f"({', '.join(self.models)}) ready in {time.perf_counter() - started:.2f}s")
+        return self
+
+    def _restart(self, worker: _Worker, reason: str):
+        print(f"[ML] Restarting inference worker {worker.index}: {reason}")
+        worker.last_error = reason
+        worker.stop(grace=1.0)
+        worker.start(self._ctx, self.models, self.torch_threads, self.max_batch, INFERENCE_POOL_START_TIMEOUT)
+        worker.restarts += 1
+
+    def _run_on(self, worker: _Worker, model: str, images) -> List[Tuple[int, float]]:
+        preprocessor = self._preprocessors[model]
+        results = []
+        for offset in range(0, len(images), self.max_batch):
+            chunk = images[offset:offset + self.max_batch]
+            shape = (len(chunk), 3, preprocessor.height, preprocessor.width)
+            # Preprocess directly into the worker's shared input slab
+            preprocessor(chunk, out=worker.input_view(shape))
+            status, payload = worker.request(("run", model, shape, worker.shm.name), self.timeout)
+            if status != "ok":
+                raise RuntimeError(f"inference worker {worker.index}: {payload}")
+            results.extend(payload)
+        return results
+
+    def top1(self, model: str, images: Sequence) -> List[Tuple[int, float]]:
+        """[(class index, probability)] per decoded image, run on the next idle worker."""
+        if model not in self._preprocessors:
+            raise KeyError(f"{model} is not served by the inference pool")
+        worker = self._idle.get(timeout=self.timeout)
+        try:
+            with worker.lock:
+                started = time.perf_counter()
+                try:
+                    if not worker.alive():
+                        self._restart(worker, "not running")
+                    results = self._run_on(worker, model, list(images))
+                except WorkerCrashed as e:
+                    # Crashed or hung mid-request: restart and retry once
+                    with self._stats_lock:
+                        self.retries += 1
+                    worker.errors += 1
+                    self._restart(worker, str(e))
+                    results = self._run_on(worker, model, list(images))
+                except Exception:
+                    worker.errors += 1
+                    raise
+                worker.jobs += 1
+                worker.busy_seconds += time.perf_counter() - started
+                return results
+        finally:
+            self._idle.put(worker)
+
+    def _monitor_loop(self):
+        while not self._stop.wait(self.health_interval):
+            for worker in self._workers:
+                # Only idle workers; busy ones report problems through their request
+                if not worker.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if not worker.alive():
+                        self._restart(worker, "process exited")
+                        continue
+                    start = time.perf_counter()
+                    status, _ = worker.request(("ping",), timeout=min(self.timeout, 10.0))
+                    if status == "pong":
+                        worker.last_ping_ms = round((time.perf_counter() - start) * 1000, 2)
+                except WorkerCrashed as e:
+                    try:
+                        self._restart(worker, str(e))
+                    except Exception as restart_error:
+                        worker.last_error = str(restart_error)
+                except Exception as e:
+                    worker.last_error = str(e)
+                finally:
+                    worker.lock.release()
+
+    def shutdown(self):
+        self._stop.set()
+        for worker in self._workers:
+            with worker.lock:
+                worker.stop()
+            worker.release()
+        self._workers = []
+
+    def stats(self) -> dict:
+        workers = []
+        for worker in self._workers:
+            workers.append({
+                "index": worker.index,
+                "pid": worker.process.pid if worker.process is not None else None,
+                "alive": worker.alive(),
+                "jobs": worker.jobs,
+                "errors": worker.errors,
+                "restarts": worker.restarts,
+                "mean_job_ms": round(worker.busy_seconds / worker.jobs * 1000, 2) if worker.jobs else 0.0,
+                "last_ping_ms": worker.last_ping_ms,
+                "last_error": worker.last_error,
+            })
+        return {
+            "enabled": True,
+            "workers": self.size,
+            "torch_threads": self.torch_threads,
+            "models": self.models,
+            "max_batch": self.max_batch,
+            "idle": self._idle.qsize(),
+            "retries": self.retries,
+            "per_worker": workers,
+        }
+
+
+def _backing_off() -> bool:
+    return _start_failure is not None and time.monotonic() - _start_failure[0] < INFERENCE_POOL_RETRY_SECONDS
+
+
+def get_pool() -> Optional[InferencePool]:
+    """
+    The process-wide pool, started here if it is not up (None when disabled).
+    Blocks for up to INFERENCE_POOL_START_TIMEOUT, so only the startup loader
+    and background threads call it; request paths use pool_for().
+    Raises the start error, or PoolUnavailable while backing off after one.
+    """
+    global _pool, _start_failure
+    if not enabled():
+        return None
+    if _pool is None:
+        if _backing_off():
+            raise PoolUnavailable(f"Inference pool failed to start: {_start_failure[1]}")
+        with _pool_lock:
+            if _pool is None:
+                if _backing_off():
+                    raise PoolUnavailable(f"Inference pool failed to start: {_start_failure[1]}")
+                try:
+                    _pool = InferencePool().start()
+                except Exception as e:
+                    _start_failure = (time.monotonic(), str(e))
+                    print(f"[ML] Inference pool failed to start ({e}); running models in-process, "
+                          f"retry in {INFERENCE_POOL_RETRY_SECONDS:.0f}s")
+                    raise
+                _start_failure = None
+    return _pool
+
+
+def _start_in_background():
+    """Start (or retry) the pool on a daemon thread, at most one attempt at a time."""
+    global _starting
+    with _starting_lock:
+        if _starting or _pool is not None or _backing_off():
+            return
+        _starting = True
+
+    def run():
+        global _starting
+        try:
+            get_pool()
+        except Exception:
+            pass  # recorded in _start_failure; services stay in-process
+        finally:
+            with _starting_lock:
+                _starting = False
+
+    threading.Thread(target=run, name="inference-pool-start", daemon=True).start()
+
+
+def pool_for(model: str) -> Optional[InferencePool]:
+    """
+    The pool when it serves `model` and is up; None means run the model
+    in-process. Never blocks: while the pool is down a start is kicked off
+    in the background (once the retry backoff has passed).
+    """
+    if not serves(model):
+        return None
+    pool = _pool
+    if pool is None:
+        _start_in_background()
+    return pool
+
+
+def is_up() -> bool:
+    return _pool is not None
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def get_stats() -> dict:
+    if _pool is None:
+        stats = {"enabled": enabled(), "workers": INFERENCE_POOL_WORKERS, "started": False}
+        if _start_failure is not None:
+            stats["last_error"] = _start_failure[1]
+            stats["retry_in_seconds"] = round(max(0.0, INFERENCE_POOL_RETRY_SECONDS
+                                                  - (time.monotonic() - _start_failure[0])), 1)
+        return stats
+    return _pool.stats()
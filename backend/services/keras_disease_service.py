@@ -5,42 +5,135 @@ Downloads and runs a Vision Transformer plant disease classifier locally via the
 Hugging Face `transformers` library, completely bypassing local TensorFlow files.
 """
 
-import io
+import os
+import threading
+import time
+from contextlib import contextmanager
 from PIL import Image
 from typing import List, Dict, Any
 
+from .model_registry import registry as model_registry, DISEASE_VIT
+from .micro_batcher import MicroBatcher
+from .image_preprocessing import load_image, DECODE_MIN_SIZE
+from . import image_cache
+from . import inference_pool
+from . import yolo_disease_service
+from . import disease_cascade
+
 # Globals to heavily cache the AI models in memory
 _processor = None
 _model = None
+_preprocessor = None
+_forward = None
+
+hf_model_id = DISEASE_VIT
+
+# Concurrent ViT requests are grouped into one forward pass of up to
+# DISEASE_BATCH_MAX_SIZE images, waiting at most DISEASE_BATCH_MAX_WAIT_MS
+# for the batch to fill (max size 1 disables batching)
+DISEASE_BATCH_MAX_SIZE = int(os.getenv("DISEASE_BATCH_MAX_SIZE", "8"))
+DISEASE_BATCH_MAX_WAIT_MS = float(os.getenv("DISEASE_BATCH_MAX_WAIT_MS", "10"))
+_batcher = None
+
+# Near-duplicate uploads (re-sent / recompressed / resized copies) reuse the
+# earlier result, matched on dHash within DISEASE_CACHE_MAX_DISTANCE bits
+# (see image_cache.py; DISEASE_CACHE_SIZE=0 disables)
+result_cache = image_cache.create_from_env()
+
+# Margin added around each YOLO leaf box before it is classified
+LEAF_CROP_MARGIN = 0.05
+
+# Startup warm-up: DISEASE_WARMUP_RUNS synthetic passes (0 disables) at each
+# batch size in DISEASE_WARMUP_BATCHES, so first requests do not pay for
+# allocator growth, kernel selection or (DISEASE_VIT_GRAPH=compile) compilation
+DISEASE_WARMUP_RUNS = int(os.getenv("DISEASE_WARMUP_RUNS", "3"))
+DISEASE_WARMUP_BATCHES = [int(b) for b in os.getenv("DISEASE_WARMUP_BATCHES", f"1,{DISEASE_BATCH_MAX_SIZE}").split(",")
+                          if b.strip() and int(b) > 0]
+warmup_info: Dict[str, Any] = {"done": False}
 
-hf_model_id = "wambugu71/crop_leaf_diseases_vit"
+# Requests currently using the ViT globals; a lazy ViT (DISEASE_VIT_LOAD_POLICY=lazy)
+# is only handed back to the registry when idle and none are in flight
+_inflight = 0
+_inflight_lock = threading.Lock()
+_idle_released = False
+_load_lock = threading.Lock()
 
 def is_ready() -> bool:
     """Check if the model is downloaded and loaded into memory."""
     global _processor, _model
     return _processor is not None and _model is not None
 
+def is_available() -> bool:
+    """Loaded, or released while idle and reloaded by the next request."""
+    return is_ready() or _idle_released
+
+@contextmanager
+def _in_use():
+    global _inflight
+    with _inflight_lock:
+        _inflight += 1
+    try:
+        yield
+    finally:
+        with _inflight_lock:
+            _inflight -= 1
+
+def _release_idle() -> bool:
+    """Registry idle hook: drop this service's ViT reference unless a request is using it."""
+    global _processor, _model, _preprocessor, _forward, _idle_released
+    with _inflight_lock:
+        if _inflight:
+            return False
+        _processor = _model = _preprocessor = _forward = None
+        _idle_released = True
+    model_registry.release(hf_model_id, on_idle=_release_idle)
+    print(f"[ML] Released idle {hf_model_id}; the next request reloads it")
+    return True
+
 def load_keras_model() -> bool:
     """
     Downloads the model from the HF Cloud if not locally cached, 
     or loads the local plant_disease_model.h5 as a fallback.
     """
-    global _processor, _model
     if is_ready():
         return True
+    # Concurrent first requests (e.g. after an idle release) load it once
+    with _load_lock:
+        return _load_keras_model()
 
-    # 1. Try Cloud ViT Model (High Accuracy)
+def _load_keras_model() -> bool:
+    global _processor, _model, _preprocessor, _forward, _idle_released
+    if is_ready():
+        return True
+
+    # 1. Try Cloud ViT Model (High Accuracy), shared with ml_integration via the registry
     try:
-        from transformers import AutoImageProcessor, AutoModelForImageClassification
-        import torch
-        
-        model_name = hf_model_id
-        print(f"[ML] Attempting to load {model_name} from Hugging Face Cloud...")
-        _processor = AutoImageProcessor.from_pretrained(model_name, local_files_only=False)
-        _model = AutoModelForImageClassification.from_pretrained(model_name, local_files_only=False)
-        _model.eval()
+        print(f"[ML] Attempting to load {hf_model_id} from Hugging Face Cloud...")
+        pool = inference_pool.pool_for("disease_vit")
+        if pool is not None:
+            # Worker processes hold the ViT; this process only preprocesses
+            _model = pool
+            _processor = "pool"
+        else:
+            # In-process, including when the pool is configured but down
+            detector = model_registry.acquire(hf_model_id, on_idle=_release_idle)
+            if detector.get('backend') == 'onnx':
+                # onnxruntime session; preprocessing lives in the classifier
+                _processor = "onnx"
+            else:
+                _processor = detector['processor']
+                _preprocessor = detector['preprocessor']
+                _forward = detector['forward']
+            _model = detector['model']
+        if not _idle_released:
+            # Same weights after an idle reload, so cached results stay valid
+            result_cache.clear()
+        _idle_released = False
         
         print(f"[ML] Tier 1 ViT-v2 Cloud Model LOADED SUCCESSFULLY.")
+        # Cascade stage 1 (distilled MobileNet) in front of the ViT, when it was trained
+        if disease_cascade.load_model():
+            print(f"[ML] Cascade stage 1 ({disease_cascade.DISEASE_MOBILENET}) LOADED.")
         return True
     except Exception as e:
         print(f"[ML] Cloud model load failed: {e}. Checking for local Keras model...")
@@ -58,6 +151,7 @@ def load_keras_model() -> bool:
             _model = tf.keras.models.load_model(local_path)
             # Use a dummy processor for Keras since it's manual
             _processor = "keras_local" 
+            result_cache.clear()
             print(f"[ML] Local Keras Model (.h5) LOADED SUCCESSFULLY.")
             return True
         else:
@@ -68,21 +162,332 @@ def load_keras_model() -> bool:
     return False
 
 
-def predict_disease(image_bytes: bytes) -> List[Dict[str, Any]]:
+def _classify_batch(images: List[Image.Image], record: bool = True) -> List[tuple]:
+    """One ViT forward pass over several images -> [(label, confidence %), ...]"""
+    if _processor == "pool":
+        start = time.perf_counter()
+        results = _model.top1("disease_vit", images)
+        if record:
+            model_registry.record_latency(hf_model_id, time.perf_counter() - start)
+        labels = _model.labels["disease_vit"]
+        return [(labels[idx], round(conf * 100, 2)) for idx, conf in results]
+
+    if _processor == "onnx":
+        start = time.perf_counter()
+        results = _model.top1(images)
+        if record:
+            model_registry.record_latency(hf_model_id, time.perf_counter() - start)
+        return [(_model.labels[idx], round(conf * 100, 2)) for idx, conf in results]
+
+    import torch
+
+    pixel_values = torch.from_numpy(_preprocessor(images))
+    start = time.perf_counter()
+    with torch.no_grad():
+        logits = _forward(pixel_values)
+        probabilities = torch.nn.functional.softmax(logits, dim=-1)
+        confidences, indices = probabilities.max(dim=-1)
+    if record:
+        model_registry.record_latency(hf_model_id, time.perf_counter() - start)
+
+    return [
+        (_model.config.id2label[int(idx)], round(float(conf) * 100, 2))
+        for conf, idx in zip(confidences.tolist(), indices.tolist())
+    ]
+
+
+def _classify_cascade(images: List[Image.Image]) -> List[tuple]:
+    """
+    [(label, confidence %, stage), ...]: the distilled MobileNet answers the
+    images it is confident about, the rest go through the ViT together.
+    """
+    fast = disease_cascade.fast_top1(images) if disease_cascade.enabled() else None
+    if fast is None:
+        results = [_classify(images[0])] if len(images) == 1 else _classify_batch(images)
+        return [(label, confidence_pct, "vit") for label, confidence_pct in results]
+
+    results = [(label, confidence_pct, "mobilenet") for label, confidence_pct in fast]
+    escalate = [i for i, (_, confidence_pct, _) in enumerate(results)
+                if confidence_pct < disease_cascade.CASCADE_FAST_THRESHOLD]
+    if escalate:
+        # A lone uncertain image still shares a micro-batch with concurrent requests
+        vit = [_classify(images[escalate[0]])] if len(escalate) == 1 else _classify_batch([images[i] for i in escalate])
+        for i, (label, confidence_pct) in zip(escalate, vit):
+            results[i] = (label, confidence_pct, "vit")
+    disease_cascade.stats.record_items(len(images), len(images) - len(escalate))
+    return results
+
+
+def _classify(img: Image.Image) -> tuple:
+    global _batcher
+    if DISEASE_BATCH_MAX_SIZE <= 1:
+        return _classify_batch([img])[0]
+    if _batcher is None:
+        # One batch in flight per pool worker, so batches spread across processes
+        _batcher = MicroBatcher(_classify_batch, DISEASE_BATCH_MAX_SIZE, DISEASE_BATCH_MAX_WAIT_MS,
+                                name="vit-disease-batcher",
+                                workers=inference_pool.INFERENCE_POOL_WORKERS if _processor == "pool" else 1)
+    return _batcher(img)
+
+
+def warmup(runs: int = None, batch_sizes: List[int] = None) -> Dict[str, Any]:
+    """
+    Run synthetic batches through the loaded ViT at the batch sizes serving
+    will see (single requests and full micro-batches) and record cold
+    (first call) vs warm (last call) latency per size. Not counted in the
+    serving latency window.
+    """
+    global warmup_info
+    runs = DISEASE_WARMUP_RUNS if runs is None else runs
+    batch_sizes = batch_sizes or DISEASE_WARMUP_BATCHES
+    if runs <= 0 or not is_ready() or _processor == "keras_local":
+        return warmup_info
+
+    # Mid-gray photo at the draft-decode size, so preprocessing does real resizing work
+    side = decode_size()
+    blank = Image.new("RGB", (side, side), (128, 128, 128))
+    start = time.perf_counter()
+    per_batch = {}
+    for size in sorted(set(batch_sizes)):
+        timings = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            _classify_batch([blank] * size, record=False)
+            timings.append((time.perf_counter() - t0) * 1000)
+        per_batch[str(size)] = {"cold_ms": round(timings[0], 2), "warm_ms": round(timings[-1], 2)}
+
+    # Pool workers warm themselves at start; here that covers the shared-memory round trip
+    bundle = model_registry.get(hf_model_id)
+    graph = bundle.get("graph") if isinstance(bundle, dict) else None
+    warmup_info = {
+        "done": True,
+        "backend": _processor if _processor in ("pool", "onnx") else "torch",
+        "graph": graph,
+        "runs": runs,
+        "seconds": round(time.perf_counter() - start, 2),
+        "batches": per_batch,
+    }
+    summary = ", ".join(f"b{size} {t['cold_ms']:.0f}->{t['warm_ms']:.0f} ms" for size, t in per_batch.items())
+    print(f"[ML] ViT warm-up ({warmup_info['backend']}{', ' + graph if graph else ''}) "
+          f"in {warmup_info['seconds']:.2f}s: {summary}")
+    return warmup_info
+
+
+def get_warmup_info() -> Dict[str, Any]:
+    return dict(warmup_info)
+
+
+def get_batching_stats() -> Dict[str, Any]:
+    """Per-batch occupancy and timing of the ViT micro-batcher."""
+    if _batcher is None:
+        return {
+            "enabled": DISEASE_BATCH_MAX_SIZE > 1,
+            "max_batch_size": DISEASE_BATCH_MAX_SIZE,
+            "max_wait_ms": DISEASE_BATCH_MAX_WAIT_MS,
+            "batches": 0,
+        }
+    return {"enabled": True, **_batcher.stats()}
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Hit rate and size of the perceptual-hash result cache."""
+    return result_cache.stats()
+
+
+def get_cascade_stats() -> Dict[str, Any]:
+    """Per-stage exit rates and end-to-end latency percentiles of the detect cascade."""
+    return disease_cascade.get_stats()
+
+
+def record_cascade_exit(stage: str, seconds: float):
+    """One /detect request answered at `stage` (cache / mobilenet / vit / gemini / none)."""
+    disease_cascade.stats.record_request(stage, seconds)
+
+
+def exit_stage(detections: List[Dict[str, Any]]) -> str:
+    """cache or mobilenet only when every leaf was answered there, else vit."""
+    for stage in ("cache", "mobilenet"):
+        if detections and all(d.get("stage") == stage for d in detections):
+            return stage
+    return "vit"
+
+
+def _detection(label: str, confidence_pct: float, bbox=None, bbox_norm=None, stage: str = None) -> Dict[str, Any]:
+    """One classifier result in the Farmi UI detection format."""
+    # Typical format: "Crop___Disease"
+    if "___" in label:
+        crop, disease = label.split("___", 1)
+        crop = crop.replace("_", " ").title()
+        disease = disease.replace("_", " ")
+    else:
+        crop = "Plant"
+        disease = label.replace("_", " ")
+
+    is_healthy = "healthy" in disease.lower() or "background" in disease.lower()
+    if is_healthy:
+        disease = "Healthy (Good Plant)"
+
+    # Determine Severity based on confidence rules
+    if is_healthy:
+        severity = "low"
+    elif confidence_pct >= 75:
+        severity = "high"
+    elif confidence_pct >= 50:
+        severity = "medium"
+    else:
+        severity = "low"
+
+    detection = {
+        "disease"    : disease,
+        "crop"       : crop,
+        "confidence" : confidence_pct,
+        "bbox"       : bbox or [0, 0, 0, 0], 
+        "bbox_norm"  : bbox_norm or [0.0, 0.0, 1.0, 1.0],
+        "is_healthy" : is_healthy,
+        "severity"   : severity,
+        "label"      : f"{crop} - {disease}",
+    }
+    if stage:
+        # Cascade stage that produced it (mobilenet / vit; cache on a result-cache hit)
+        detection["stage"] = stage
+    return detection
+
+
+def _leaf_boxes(box, img: Image.Image):
+    """Leaf box in decoded-image pixels -> (bbox in uploaded-photo pixels, normalized bbox)."""
+    source_w, source_h = img.info.get("source_size", img.size)
+    x1, y1, x2, y2 = box
+    norm = [x1 / img.width, y1 / img.height, x2 / img.width, y2 / img.height]
+    bbox = [int(round(v * size)) for v, size in zip(norm, (source_w, source_h, source_w, source_h))]
+    return bbox, [round(v, 4) for v in norm]
+
+
+def _cacheable(detections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Cache copies without pixel boxes: a near-duplicate upload can have a
+    different resolution, so only bbox_norm is reusable.
+    """
+    # Whole-frame detections keep their [0, 0, 0, 0] placeholder
+    return [{k: v for k, v in d.items() if k != "bbox" or v == [0, 0, 0, 0]} for d in detections]
+
+
+def _from_cache(cached: List[Dict[str, Any]], img: Image.Image) -> List[Dict[str, Any]]:
+    """
+    Fresh copies of cached detections with bbox rebuilt for this upload's
+    size, and stage "cache" so the hit isn't counted as a model exit.
+    """
+    source_w, source_h = img.info.get("source_size", img.size)
+    detections = []
+    for d in cached:
+        d = dict(d, stage="cache")
+        if "bbox" not in d:
+            d["bbox"] = [int(round(v * size)) for v, size in
+                         zip(d["bbox_norm"], (source_w, source_h, source_w, source_h))]
+        detections.append(d)
+    return detections
+
+
+def _leaf_crop(img: Image.Image, box) -> Image.Image:
+    x1, y1, x2, y2 = box
+    pad_x, pad_y = (x2 - x1) * LEAF_CROP_MARGIN, (y2 - y1) * LEAF_CROP_MARGIN
+    return img.crop((int(max(0, x1 - pad_x)), int(max(0, y1 - pad_y)),
+                     int(min(img.width, x2 + pad_x)), int(min(img.height, y2 + pad_y))))
+
+
+def _classify_leaves(img: Image.Image) -> List[Dict[str, Any]]:
+    """
+    YOLO finds the leaves; with two or more, every crop goes through one
+    batched cascade pass. One leaf (or none) classifies the whole frame as
+    before, with the leaf's box when there is one.
+    """
+    leaves = yolo_disease_service.detect_leaves(img) if yolo_disease_service.enabled() else []
+    if len(leaves) <= 1:
+        label, confidence_pct, stage = _classify_cascade([img])[0]
+        boxes = _leaf_boxes(leaves[0]["bbox"], img) if leaves else (None, None)
+        return [_detection(label, confidence_pct, *boxes, stage=stage)]
+
+    results = _classify_cascade([_leaf_crop(img, leaf["bbox"]) for leaf in leaves])
+    detections = [_detection(label, confidence_pct, *_leaf_boxes(leaf["bbox"], img), stage=stage)
+                  for leaf, (label, confidence_pct, stage) in zip(leaves, results)]
+    detections.sort(key=lambda d: d["confidence"], reverse=True)
+    return detections
+
+
+def decode_size() -> int:
+    """Draft-decode target: larger when leaves are cropped out of the frame."""
+    if _processor != "keras_local" and yolo_disease_service.enabled():
+        return max(DECODE_MIN_SIZE, yolo_disease_service.YOLO_IMGSZ)
+    return DECODE_MIN_SIZE
+
+
+def predict_disease_batch(images: List[Image.Image], batch_size: int = None) -> List[List[Dict[str, Any]]]:
+    """
+    Same pipeline as predict_disease over images decoded by load_image
+    (offline scans): leaf localization per image, then every frame / leaf
+    crop of the whole list classified in cascade batches of `batch_size`.
+    The result cache is bypassed.
+    """
+    with _in_use():
+        return _predict_disease_batch(images, batch_size)
+
+
+def _predict_disease_batch(images: List[Image.Image], batch_size: int = None) -> List[List[Dict[str, Any]]]:
+    if not is_ready():
+        if not load_keras_model():
+            return [[] for _ in images]
+    if _processor == "keras_local":
+        return [predict_disease(img) for img in images]
+
+    # (image index, classifier input, (bbox, bbox_norm))
+    jobs = []
+    for index, img in enumerate(images):
+        leaves = yolo_disease_service.detect_leaves(img) if yolo_disease_service.enabled() else []
+        if len(leaves) <= 1:
+            jobs.append((index, img, _leaf_boxes(leaves[0]["bbox"], img) if leaves else (None, None)))
+        else:
+            jobs.extend((index, _leaf_crop(img, leaf["bbox"]), _leaf_boxes(leaf["bbox"], img)) for leaf in leaves)
+
+    batch_size = max(1, batch_size or DISEASE_BATCH_MAX_SIZE)
+    results = []
+    for start in range(0, len(jobs), batch_size):
+        chunk = [job[1] for job in jobs[start:start + batch_size]]
+        if disease_cascade.enabled():
+            results.extend(_classify_cascade(chunk))
+        else:
+            # Full batches straight to the ViT, not through the single-request micro-batcher
+            results.extend((label, confidence_pct, "vit") for label, confidence_pct in _classify_batch(chunk))
+
+    detections = [[] for _ in images]
+    for (index, _, boxes), (label, confidence_pct, stage) in zip(jobs, results):
+        detections[index].append(_detection(label, confidence_pct, *boxes, stage=stage))
+    for found in detections:
+        found.sort(key=lambda d: d["confidence"], reverse=True)
+    return detections
+
+
+def predict_disease(image_bytes) -> List[Dict[str, Any]]:
     """
     Run inference on an image using the loaded HF Transformers model.
+    Accepts raw upload bytes or an image already decoded by load_image.
+    With the YOLO leaf detector available, returns one detection per leaf.
     """
-    import torch
-    
+    with _in_use():
+        return _predict_disease(image_bytes)
+
+
+def _predict_disease(image_bytes) -> List[Dict[str, Any]]:
     if not is_ready():
         if not load_keras_model():
             return []
 
     try:
-        # 1. Parse Image
-        img = Image.open(io.BytesIO(image_bytes))
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        # 1. Parse Image (kept larger when leaves are cropped out of it)
+        img = load_image(image_bytes, decode_size())
+        
+        cache_key = result_cache.make_key(img)
+        cached, _ = result_cache.get(cache_key)
+        if cached is not None:
+            return _from_cache(cached, img)
         
         # 2. Preprocess & 3. Inference
         if _processor == "keras_local":
@@ -102,53 +507,14 @@ def predict_disease(image_bytes: bytes) -> List[Dict[str, Any]]:
             # Since we only have 3 classes and don't have labels, we use generic ones
             # User can provide labels later
             labels = ["Condition A", "Condition B", "Condition C"]
-            label = labels[top_class_idx]
-        else:
-            # Cloud ViT branch
-            inputs = _processor(img, return_tensors="pt")
-            with torch.no_grad():
-                outputs = _model(**inputs)
-                logits = outputs.logits
-                probabilities = torch.nn.functional.softmax(logits, dim=-1)[0]
-                top_class_idx = logits.argmax(-1).item()
-                confidence_pct = round(probabilities[top_class_idx].item() * 100, 2)
-                label = _model.config.id2label[top_class_idx]
-
-
-        # 4. Standardize output for Farmi UI
-        # Typical format: "Crop___Disease"
-        if "___" in label:
-            crop, disease = label.split("___", 1)
-            crop = crop.replace("_", " ").title()
-            disease = disease.replace("_", " ")
+            detections = [_detection(labels[top_class_idx], confidence_pct)]
         else:
-            crop = "Plant"
-            disease = label.replace("_", " ")
-
-        is_healthy = "healthy" in disease.lower() or "background" in disease.lower()
-        if is_healthy:
-            disease = "Healthy (Good Plant)"
-
-        # Determine Severity based on confidence rules
-        if is_healthy:
-            severity = "low"
-        elif confidence_pct >= 75:
-            severity = "high"
-        elif confidence_pct >= 50:
-            severity = "medium"
-        else:
-            severity = "low"
-
-        return [{
-            "disease"    : disease,
-            "crop"       : crop,
-            "confidence" : confidence_pct,
-            "bbox"       : [0, 0, 0, 0], 
-            "bbox_norm"  : [0.0, 0.0, 1.0, 1.0],
-            "is_healthy" : is_healthy,
-            "severity"   : severity,
-            "label"      : f"{crop} - {disease}",
-        }]
+            # Cloud ViT branch: per-leaf crops when YOLO finds several leaves,
+            # otherwise the whole frame (micro-batched with concurrent requests)
+            detections = _classify_leaves(img)
+
+        result_cache.put(cache_key, _cacheable(detections))
+        return detections
 
     except Exception as e:
         print(f"[ML] Hugging Face Transformers Inference Error: {e}")
@@ -0,0 +1,123 @@
+"""
+Dynamic Micro-Batching
+======================
+Collects concurrent single-item requests for up to `max_wait_ms` or
+`max_batch_size` items, runs them through one batched call on a worker
+thread, and hands each caller its own result through a Future.
+
+Callers block on the Future from their own thread (FastAPI runs the model
+endpoints in its executor), so the event loop is never held. With
+`workers` > 1, that many threads collect and run batches concurrently
+(for backends that can run several batches at once, e.g. a process pool).
+"""
+
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, List, Sequence
+
+
+class MicroBatcher:
+    """Worker thread(s) that turn concurrent submits into batches."""
+
+    def __init__(self, process_batch: Callable[[List[Any]], Sequence[Any]],
+                 max_batch_size: int = 8, max_wait_ms: float = 10.0, name: str = "batcher",
+                 workers: int = 1):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self.workers = max(1, int(workers))
+
+        self._queue = queue.Queue()
+        self._threads = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.batch_sizes = Counter()
+        self.queue_wait_seconds = 0.0
+        self.process_seconds = 0.0
+
+    def _ensure_started(self):
+        if self._threads is not None:
+            return
+        with self._start_lock:
+            if self._threads is None:
+                threads = [threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                           for i in range(self.workers)]
+                for thread in threads:
+                    thread.start()
+                self._threads = threads
+
+    def submit(self, item) -> Future:
+        """Queue one item; the Future resolves to its entry of the batch result."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _, _ in batch]
+            started = time.perf_counter()
+            try:
+                results = list(self.process_batch(items))
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: got {len(results)} results for {len(items)} items")
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.batch_sizes[len(batch)] += 1
+                self.queue_wait_seconds += sum(started - queued for _, _, queued in batch)
+                self.process_seconds += finished - started
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches, items = self.batches, self.items
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "workers": self.workers,
+                "batches": batches,
+                "items": items,
+                "errors": self.errors,
+                "mean_batch_size": round(items / batches, 2) if batches else 0.0,
+                "mean_occupancy": round(items / (batches * self.max_batch_size), 4) if batches else 0.0,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                "mean_queue_wait_ms": round(self.queue_wait_seconds / items * 1000, 2) if items else 0.0,
+                "mean_batch_ms": round(self.process_seconds / batches * 1000, 2) if batches else 0.0,
+                "queued": self._queue.qsize(),
+            }
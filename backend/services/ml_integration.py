@@ -1,5 +1,6 @@
 # Robust imports
 import os  # Standard library should be top level
+import threading
 try:
     import joblib
     import numpy as np
@@ -11,12 +12,75 @@ except ImportError:
 
 # Paths to ML models
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-CROP_MODEL_PATH = os.path.join(BASE_DIR, "ml_models", "crop_recommendation", "models", "crop_model_best.joblib")
-LABEL_ENCODER_PATH = os.path.join(BASE_DIR, "ml_models", "crop_recommendation", "models", "label_encoder.joblib")
+CROP_MODELS_DIR = os.path.join(BASE_DIR, "ml_models", "crop_recommendation", "models")
+CROP_SRC_DIR = os.path.join(BASE_DIR, "ml_models", "crop_recommendation", "src")
+
+# "best" is the full model, "compact" the pruned/distilled one from train.py --compress
+CROP_MODEL_VARIANT = os.getenv("CROP_MODEL_VARIANT", "best")
+
+# "compiled" serves the NumPy tree evaluator when exported, "joblib" forces the XGBoost model
+CROP_MODEL_BACKEND = os.getenv("CROP_MODEL_BACKEND", "compiled")
+
+# "lookup" answers in-grid requests from the precomputed table published with
+# the model version (train.py --lookup, or crop_lookup.py for the current one);
+# it is ignored unless it was computed from the served variant's model file
+CROP_SERVING_MODE = os.getenv("CROP_SERVING_MODE", "model")
+
+# How often the watcher checks models/CURRENT for a new version (0 disables)
+CROP_MODEL_WATCH_SECONDS = float(os.getenv("CROP_MODEL_WATCH_SECONDS", "5"))
+
+CROP_DATA_PATH = os.path.join(BASE_DIR, "ml_models", "crop_recommendation", "data", "crop_data.csv")
+
+# Feature order expected by the crop model (matches crop_data.csv columns)
+CROP_FEATURES = ["N", "P", "K", "temperature", "humidity", "ph", "rainfall"]
 
 # Load crop recommendation model
+# The active version is one immutable bundle; predictions read `_crop_bundle`
+# once, so swapping it in is a single reference assignment
 crop_model = None
 label_encoder = None
+crop_classes = None
+crop_model_backend = None
+crop_engine = None
+crop_lookup = None
+crop_model_info = {"version": None, "loaded": False}
+_crop_bundle = {"engine": None, "lookup": None, "generation": 0}
+# Bumped per loaded bundle; part of every result-cache key
+_crop_generation = 0
+
+# Quantized result cache for crop predictions (see crop_cache.py)
+from . import crop_cache
+crop_result_cache = crop_cache.create_from_env(CROP_FEATURES)
+
+_crop_watcher = None
+_crop_watcher_stop = None
+
+# Nearest-neighbour index published with the model version (see similar_farms.py);
+# loaded (or built once and saved, if missing) on the first /similar request
+_similar_farms_lock = threading.Lock()
+
+# Image models are shared process-wide through the registry
+from .model_registry import registry as model_registry, DISEASE_VIT, model_precision, load_policy
+# Shared decode (JPEG draft, EXIF orientation) and NumPy preprocessing for every image model
+from .image_preprocessing import load_image, ImagePreprocessor, RESNET_PREPROCESS
+# Optional worker processes holding the image models (INFERENCE_POOL_WORKERS)
+from . import inference_pool
+
+# ResNet50 pest classifier, built once and reused per request
+PEST_RESNET = "resnet50_pest"
+# "int8" serves torchvision's pre-quantized ResNet50 (PEST_RESNET_PRECISION or MODEL_PRECISION)
+PEST_RESNET_PRECISION = model_precision("PEST_RESNET_PRECISION")
+# "onnx" serves the exported graph through onnxruntime (PEST_RESNET_BACKEND or IMAGE_MODEL_BACKEND)
+from .onnx_backend import model_backend
+PEST_RESNET_BACKEND = model_backend("PEST_RESNET_BACKEND")
+PEST_WARMUP_RUNS = int(os.getenv("PEST_WARMUP_RUNS", "3"))
+pest_resnet = None
+pest_model_info = {"loaded": False}
+
+# Dedicated pool for image-model inference, so the pest and disease models
+# can run side by side without competing with FastAPI's default executor
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+_inference_executor = None
 
 # ViT pest detection model
 vit_pest_detector = None
@@ -24,15 +88,47 @@ vit_pest_detector = None
 # Plant disease detection model
 disease_detector = None
 
+# Guard this module's long-lived registry references (taken once, released when idle)
+_pest_hold_lock = threading.Lock()
+_disease_hold_lock = threading.Lock()
+
 def load_models():
     """Load ML models explicitly"""
-    global crop_model, label_encoder, vit_pest_detector, disease_detector
+    load_crop_models()
+    load_pest_models()
+    load_disease_model()
+
+
+def load_crop_models():
+    """Crop model (active version); True when the model loaded."""
+    # Load Crop Model (active version from models/CURRENT, else flat models/)
+    try:
+        _activate_crop_bundle(_load_crop_bundle())
+    except:
+        pass
+    return get_crop_model_status()
+
+
+def _startup_state(model, held, policy):
+    """
+    Startup readiness of an image model: True when it is resident here or
+    the running inference pool serves it, "lazy" when it loads on first use
+    """
+    if held is not None or inference_pool.pool_for(model) is not None:
+        return True
+    return "lazy" if policy == "lazy" and not inference_pool.serves(model) else False
+
+
+def load_pest_models():
+    """ResNet50 and the trained ViT pest model; startup state of the ResNet50 (see _startup_state)."""
+    global vit_pest_detector
     
-    # Load Crop Model
+    # Load ResNet50 Pest Model (kept resident, warmed up; "lazy" waits for the first request).
+    # Configured for the pool but the pool is down: load it here instead
     try:
-        if joblib is not None and os.path.exists(CROP_MODEL_PATH):
-            crop_model = joblib.load(CROP_MODEL_PATH)
-            label_encoder = joblib.load(LABEL_ENCODER_PATH)
+        policy = model_registry.policy(PEST_RESNET)
+        if inference_pool.pool_for("pest_resnet") is None and (policy == "eager" or inference_pool.serves("pest_resnet")):
+            _load_pest_resnet()
     except:
         pass
     
@@ -52,31 +148,239 @@ def load_models():
             vit_pest_detector = ViTPestDetector(vit_model_path, vit_metadata_path)
     except:
         pass
+    return _startup_state("pest_resnet", pest_resnet, model_registry.policy(PEST_RESNET))
+
+
+def load_disease_model():
+    """This module's reference to the plant disease ViT (same instance keras_disease_service uses)."""
+    try:
+        policy = model_registry.policy(DISEASE_VIT)
+        if inference_pool.pool_for("disease_vit") is None and (policy == "eager" or inference_pool.serves("disease_vit")):
+            _load_disease_detector()
+    except:
+        pass
+    return _startup_state("disease_vit", disease_detector, model_registry.policy(DISEASE_VIT))
+
+def _load_crop_bundle():
+    """Load the current crop model version into a bundle (off the hot path)"""
+    import sys
+    import time
+    from datetime import datetime
+    if CROP_SRC_DIR not in sys.path:
+        sys.path.insert(0, CROP_SRC_DIR)
+    from crop_versions import resolve_model
+    from crop_engine import CropInferenceEngine
+    
+    global _crop_generation
+    started = time.perf_counter()
+    version, model_dir, files = resolve_model(CROP_MODELS_DIR, CROP_MODEL_VARIANT)
+    if files["variant"] != CROP_MODEL_VARIANT:
+        # e.g. CROP_MODEL_VARIANT=compact but train.py ran without --compress
+        print(f"[ML] WARNING: no '{CROP_MODEL_VARIANT}' crop model in {model_dir}; serving '{files['variant']}'")
+    bundle = {"model": None, "label_encoder": None, "classes": None, "backend": None,
+              "engine": None, "lookup": None, "model_path": None,
+              "similar_farms_path": files["similar_farms"], "similar_farms": None}
     
-    # Load Plant Disease Detection Model
+    # Compiled NumPy trees first: no xgboost/sklearn import
     try:
-        global disease_detector
-        from transformers import AutoImageProcessor, AutoModelForImageClassification
-        import torch
-        
-        model_name = "wambugu71/crop_leaf_diseases_vit"
-        disease_processor = AutoImageProcessor.from_pretrained(model_name)
-        disease_model = AutoModelForImageClassification.from_pretrained(model_name)
-        disease_model.eval()
-        
-        disease_detector = {
-            'processor': disease_processor,
-            'model': disease_model,
-            'name': model_name
-        }
+        if CROP_MODEL_BACKEND == "compiled" and os.path.exists(files["compiled"]):
+            from tree_ensemble import CompiledTreeEnsemble
+            model = CompiledTreeEnsemble.load(files["compiled"])
+            bundle.update(model=model, classes=model.classes_, backend="compiled", model_path=files["compiled"])
     except:
         pass
+    
+    if bundle["model"] is None and joblib is not None and os.path.exists(files["joblib"]):
+        encoder = joblib.load(files["label_encoder"])
+        bundle.update(model=joblib.load(files["joblib"]), label_encoder=encoder,
+                      classes=encoder.classes_, backend="joblib", model_path=files["joblib"])
+    
+    if bundle["model"] is None:
+        raise FileNotFoundError(f"No crop model found in {model_dir}")
+    
+    # Shared top-k engine (same one CropRecommender uses)
+    bundle["engine"] = CropInferenceEngine(bundle["model"], bundle["classes"], CROP_FEATURES)
+    
+    # Memory-mapped lookup table, only if computed from the variant being served
+    # (compiled trees are exported from that same joblib file)
+    try:
+        if CROP_SERVING_MODE == "lookup" and os.path.exists(files["lookup_meta"]):
+            from crop_lookup import CropLookupTable
+            table = CropLookupTable(files["lookup_meta"])
+            if list(table.classes) == bundle["engine"].crops and table.matches(files["joblib"]):
+                bundle["lookup"] = table
+            else:
+                print(f"[ML] WARNING: lookup table in {model_dir} was built from "
+                      f"{table.meta.get('source_model')}, not the served "
+                      f"{os.path.basename(files['joblib'])}; answering from the model")
+    except:
+        pass
+    
+    _crop_generation += 1
+    bundle["generation"] = _crop_generation
+    bundle["info"] = {
+        "version": version or "unversioned",
+        "model_dir": model_dir,
+        "variant": files["variant"],
+        "backend": bundle["backend"],
+        "serving_mode": "lookup" if bundle["lookup"] is not None else "model",
+        "loaded": True,
+        "loaded_at": datetime.now().isoformat(timespec="seconds"),
+        "load_seconds": round(time.perf_counter() - started, 4),
+    }
+    return bundle
+
+
+def _activate_crop_bundle(bundle):
+    """Swap a loaded bundle in; in-flight requests finish on the old one"""
+    global crop_model, label_encoder, crop_classes, crop_model_backend, crop_engine, crop_lookup, crop_model_info
+    global _crop_bundle
+    
+    _crop_bundle = bundle
+    crop_lookup = bundle["lookup"]
+    crop_model = bundle["model"]
+    label_encoder = bundle["label_encoder"]
+    crop_classes = bundle["classes"]
+    crop_model_backend = bundle["backend"]
+    crop_engine = bundle["engine"]
+    crop_model_info = bundle["info"]
+    
+    # Cached probabilities belong to the model file just loaded
+    crop_result_cache.bind_model(bundle["model_path"])
+
+
+def _watch_crop_model(stop_event):
+    from crop_versions import read_current
+    while not stop_event.wait(CROP_MODEL_WATCH_SECONDS):
+        try:
+            version, _ = read_current(CROP_MODELS_DIR)
+            if version is None or version == crop_model_info.get("version"):
+                continue
+            bundle = _load_crop_bundle()
+            _activate_crop_bundle(bundle)
+            print(f"[ML] Crop model swapped to version {version} "
+                  f"({bundle['info']['load_seconds']}s load)")
+        except Exception as e:
+            print(f"[ML] Crop model reload failed, keeping current version: {e}")
+
+
+def start_crop_model_watcher():
+    """Poll models/CURRENT in a background thread and hot-swap new versions"""
+    global _crop_watcher, _crop_watcher_stop
+    import threading
+    if CROP_MODEL_WATCH_SECONDS <= 0 or (_crop_watcher is not None and _crop_watcher.is_alive()):
+        return
+    _crop_watcher_stop = threading.Event()
+    _crop_watcher = threading.Thread(target=_watch_crop_model, args=(_crop_watcher_stop,),
+                                     name="crop-model-watcher", daemon=True)
+    _crop_watcher.start()
+
+
+def stop_crop_model_watcher():
+    if _crop_watcher_stop is not None:
+        _crop_watcher_stop.set()
+
 
 def get_crop_model_status():
     return crop_model is not None
 
 
-def predict_crop(N, P, K, temperature, humidity, ph, rainfall):
+def get_crop_model_info():
+    return crop_model_info
+
+
+def get_crop_class_count():
+    """Number of crops the active model ranks (None until it is loaded)"""
+    classes = _crop_bundle.get("classes")
+    return len(classes) if classes is not None else None
+
+
+def get_crop_cache_stats():
+    return crop_result_cache.stats()
+
+
+def _similar_farms_index(bundle):
+    """
+    The bundle's similar-farms index, loaded on first use. A version
+    published without one gets it built once from crop_data.csv and saved
+    into its directory, so later starts just load it. None if that fails.
+    """
+    index = bundle.get("similar_farms")
+    if index is not None or not bundle.get("similar_farms_path"):
+        return index
+    with _similar_farms_lock:
+        if bundle["similar_farms"] is None and bundle["similar_farms_path"]:
+            import sys
+            import time
+            if CROP_SRC_DIR not in sys.path:
+                sys.path.insert(0, CROP_SRC_DIR)
+            import similar_farms
+            
+            path = bundle["similar_farms_path"]
+            start = time.perf_counter()
+            try:
+                if os.path.exists(path):
+                    bundle["similar_farms"] = similar_farms.SimilarFarmsIndex.load(path)
+                    action = "loaded"
+                else:
+                    bundle["similar_farms"] = similar_farms.build_for_model_dir(os.path.dirname(path), [CROP_DATA_PATH])
+                    action = "built"
+            except Exception as e:
+                # Not retried per request; the next model version tries again
+                bundle["similar_farms_path"] = None
+                bundle["similar_farms_error"] = str(e)
+                print(f"[ML] Similar-farms index unavailable: {e}")
+                return None
+            bundle["similar_farms_seconds"] = round(time.perf_counter() - start, 3)
+            print(f"[ML] Similar-farms index: {len(bundle['similar_farms'])} records ({action})")
+    return bundle["similar_farms"]
+
+
+def find_similar_farms(N, P, K, temperature, humidity, ph, rainfall, k=5):
+    """
+    Find the k historical records closest to the given conditions
+    
+    Returns:
+        list: Records with features, crop label and standardized distance,
+              or None when the index is unavailable
+    """
+    index = _similar_farms_index(_crop_bundle)
+    if index is None:
+        return None
+    return index.query([N, P, K, temperature, humidity, ph, rainfall], k=k)
+
+
+def get_similar_farms_info():
+    bundle = _crop_bundle
+    index = bundle.get("similar_farms")
+    if index is None:
+        return {"loaded": False, "error": bundle.get("similar_farms_error")}
+    return {
+        "loaded": True,
+        "records": len(index),
+        "version": bundle["info"]["version"],
+        "load_seconds": bundle.get("similar_farms_seconds"),
+    }
+
+
+def _lookup_probabilities(bundle, features):
+    """
+    Answer rows from the bundle's lookup table
+    
+    Returns:
+        tuple: (probabilities with only the table's top class set, in-grid mask),
+               or (None, None) when lookup serving is off
+    """
+    lookup = bundle["lookup"]
+    if lookup is None:
+        return None, None
+    crop_idx, confidence, in_grid = lookup.lookup(features)
+    probabilities = np.zeros((len(features), len(bundle["engine"].crops)))
+    probabilities[np.arange(len(features)), crop_idx] = confidence
+    return probabilities, in_grid
+
+
+def predict_crop(N, P, K, temperature, humidity, ph, rainfall, top_k=3):
     """
     Predict best crop based on soil and climate conditions
     
@@ -88,37 +392,155 @@ def predict_crop(N, P, K, temperature, humidity, ph, rainfall):
         humidity: Humidity percentage
         ph: Soil pH value
         rainfall: Rainfall in mm
+        top_k: Number of ranked alternatives to include
     
     Returns:
-        dict: Predicted crop and confidence score
+        dict: Predicted crop and confidence score, plus top-k
+              recommendations with yield info and reasons
     """
-    if crop_model is None or label_encoder is None:
+    # Read the active version once so a hot swap can't mix two models
+    bundle = _crop_bundle
+    engine = bundle["engine"]
+    if engine is None:
         # Fallback to rule-based recommendation
         return fallback_crop_recommendation(temperature, rainfall)
     
     try:
-        # Prepare input features
-        features = np.array([[N, P, K, temperature, humidity, ph, rainfall]])
+        row = np.array([N, P, K, temperature, humidity, ph, rainfall], dtype=np.float64)
         
-        # Get prediction
-        prediction = crop_model.predict(features)[0]
-        crop_name = label_encoder.inverse_transform([prediction])[0]
+        # Lookup table carries only the top class, so it answers top_k=1
+        # requests inside the grid; everything else goes to the model
+        table_probs, in_grid = _lookup_probabilities(bundle, row.reshape(1, -1)) if top_k == 1 else (None, None)
+        if table_probs is not None and in_grid[0]:
+            result = engine.recommend_from_proba(row, table_probs[0], top_k=1)
+            best = result['recommended_crops'][0]
+            return {
+                "crop": best['crop_name'],
+                "confidence": round(best['confidence'] * 100, 2),
+                "method": "lookup_table",
+                "recommended_crops": result['recommended_crops'],
+                "reasoning": result['reasoning']
+            }
         
-        # Get probability scores if available
-        if hasattr(crop_model, 'predict_proba'):
-            probabilities = crop_model.predict_proba(features)[0]
-            confidence = float(max(probabilities) * 100)
-        else:
-            confidence = 85.0  # Default confidence
+        # One predict_proba pass drives both the label and the ranking;
+        # nearby readings reuse it from the quantized cache. The key carries
+        # the bundle generation, so a request that started before a hot swap
+        # can't leave old-model probabilities behind after the cache is cleared
+        cache_key = crop_result_cache.make_key(row, bundle["generation"])
+        probabilities = crop_result_cache.get(cache_key)
+        if probabilities is None:
+            probabilities = engine.predict_proba(row)[0]
+            crop_result_cache.put(cache_key, probabilities)
+        result = engine.recommend_from_proba(row, probabilities, top_k=top_k)
+        best = result['recommended_crops'][0]
         
         return {
-            "crop": crop_name,
-            "confidence": round(confidence, 2),
-            "method": "ml_model"
+            "crop": best['crop_name'],
+            "confidence": round(best['confidence'] * 100, 2),
+            "method": "ml_model",
+            "recommended_crops": result['recommended_crops'],
+            "reasoning": result['reasoning']
         }
     except:
         return fallback_crop_recommendation(temperature, rainfall)
 
+
+def predict_crop_batch(rows):
+    """
+    Predict best crops for many soil/climate rows in one model pass
+    
+    Args:
+        rows: Sequence of feature rows ordered as CROP_FEATURES
+              (list of lists or an (n, 7) array)
+    
+    Returns:
+        list: One result dict per input row, in input order
+    """
+    features = np.asarray(rows, dtype=np.float64).reshape(-1, len(CROP_FEATURES))
+    if len(features) == 0:
+        return []
+    
+    temp_idx = CROP_FEATURES.index("temperature")
+    rain_idx = CROP_FEATURES.index("rainfall")
+    
+    def _fallback_all():
+        return [fallback_crop_recommendation(row[temp_idx], row[rain_idx]) for row in features]
+    
+    bundle = _crop_bundle
+    engine = bundle["engine"]
+    if engine is None:
+        return _fallback_all()
+    
+    try:
+        # In-grid rows come from the lookup table, the rest go through
+        # the model at once as one matrix
+        probabilities, in_grid = _lookup_probabilities(bundle, features)
+        if probabilities is None:
+            probabilities = engine.predict_proba(features)
+            in_grid = np.zeros(len(features), dtype=bool)
+        elif not in_grid.all():
+            probabilities[~in_grid] = engine.predict_proba(features[~in_grid])
+        
+        best = probabilities.argmax(axis=1)
+        crop_names = np.asarray(engine.crops)[best]
+        confidences = probabilities[np.arange(len(best)), best] * 100
+        
+        return [
+            {
+                "crop": str(crop_name),
+                "confidence": round(float(confidence), 2),
+                "method": "lookup_table" if looked_up else "ml_model"
+            }
+            for crop_name, confidence, looked_up in zip(crop_names, confidences, in_grid)
+        ]
+    except:
+        return _fallback_all()
+
+def predict_crop_sweep(base, axes, crops=None):
+    """
+    What-if sweep: vary one or two features over ranges around a base reading
+    
+    The whole grid is built as one matrix and scored in a single
+    predict_proba pass (the lookup table only keeps the top class, so it
+    is not used here).
+    
+    Args:
+        base: Dict of CROP_FEATURES values
+        axes: List of (feature, values) pairs, one or two entries
+        crops: Optional subset of crop names to return surfaces for
+    
+    Returns:
+        dict: Axis values, per-crop probability surfaces (%, shaped like the
+              grid) and the top crop at each grid point; None without a model
+    """
+    engine = _crop_bundle["engine"]
+    if engine is None:
+        return None
+    
+    values = [np.asarray(v, dtype=np.float64) for _, v in axes]
+    shape = tuple(len(v) for v in values)
+    features = np.tile(np.array([base[name] for name in CROP_FEATURES], dtype=np.float64),
+                       (int(np.prod(shape)), 1))
+    for (name, _), grid in zip(axes, np.meshgrid(*values, indexing="ij")):
+        features[:, CROP_FEATURES.index(name)] = grid.ravel()
+    
+    probabilities = np.asarray(engine.predict_proba(features), dtype=np.float64).reshape(shape + (-1,))
+    crop_names = [str(c) for c in engine.crops]
+    wanted = set(crops) if crops else None
+    
+    return {
+        "axes": [{"feature": name, "values": v.tolist()} for (name, _), v in zip(axes, values)],
+        "surfaces": {
+            crop: np.round(probabilities[..., i] * 100, 2).tolist()
+            for i, crop in enumerate(crop_names)
+            if wanted is None or crop in wanted
+        },
+        "top_crop": np.asarray(crop_names, dtype=object)[probabilities.argmax(axis=-1)].tolist(),
+        "points": int(np.prod(shape)),
+        "method": "ml_model"
+    }
+
+
 def fallback_crop_recommendation(temperature, rainfall):
     """Fallback rule-based recommendation if ML model fails"""
     if rainfall > 200:
@@ -144,6 +566,193 @@ def fallback_crop_recommendation(temperature, rainfall):
     }
 
 
+def _resnet50_weights_and_model(precision):
+    """
+    ResNet50 at the requested precision
+    
+    Dynamic quantization only covers Linear layers, which in ResNet50 is
+    just the classifier head; "int8" therefore uses torchvision's statically
+    quantized ResNet50 (conv layers included) with the same ImageNet classes.
+    
+    Returns:
+        tuple: (weights, model in eval mode, precision actually served)
+    """
+    from torchvision import models
+    
+    if precision == "int8":
+        try:
+            from torchvision.models import quantization as quantized_models
+            weights = quantized_models.ResNet50_QuantizedWeights.DEFAULT
+            model = quantized_models.resnet50(weights=weights, quantize=True)
+            model.eval()
+            return weights, model, "int8"
+        except Exception as e:
+            print(f"[ML] INT8 ResNet50 unavailable ({e}); serving fp32")
+    
+    weights = models.ResNet50_Weights.DEFAULT
+    model = models.resnet50(weights=weights)
+    model.eval()
+    return weights, model, "fp32"
+
+
+def _torch_pest_bundle(precision):
+    import torch
+    
+    weights, model, precision = _resnet50_weights_and_model(precision)
+    dummy = torch.zeros(1, 3, 224, 224)
+    
+    def warmup():
+        with torch.inference_mode():
+            model(dummy)
+    
+    return {
+        'model': model,
+        'preprocessor': ImagePreprocessor(RESNET_PREPROCESS),
+        'categories': weights.meta["categories"],
+        'precision': precision,
+        'backend': "torch",
+        'threads': torch.get_num_threads(),
+        'warmup': warmup
+    }
+
+
+def _onnx_pest_bundle(precision):
+    from .onnx_backend import load_onnx_classifier, PEST_RESNET_ONNX, ONNX_THREADS
+    
+    bundle = load_onnx_classifier(PEST_RESNET_ONNX, precision)
+    blank = Image.new('RGB', (224, 224))
+    bundle.update({
+        'categories': bundle['labels'],
+        'threads': ONNX_THREADS or None,
+        'warmup': lambda: bundle['model'].top1([blank])
+    })
+    return bundle
+
+
+def _build_pest_resnet(precision=None, backend=None):
+    """
+    Build the ResNet50 pest classifier: weights, eval mode, the
+    preprocessing pipeline and a few warm-up passes (first calls allocate
+    buffers and pick kernels, so they are slower than steady state)
+    
+    Args:
+        precision: "fp32" or "int8" (default: PEST_RESNET_PRECISION)
+        backend: "torch" or "onnx" (default: PEST_RESNET_BACKEND)
+    
+    Returns:
+        dict: Model bundle with model, preprocessor (torch only), categories,
+              precision and backend
+    """
+    global pest_model_info
+    import time
+    
+    start = time.perf_counter()
+    bundle = None
+    if (backend or PEST_RESNET_BACKEND) == "onnx":
+        try:
+            bundle = _onnx_pest_bundle(precision or PEST_RESNET_PRECISION)
+        except Exception as e:
+            print(f"[ML] ONNX ResNet50 unavailable ({e}); using torch")
+    if bundle is None:
+        bundle = _torch_pest_bundle(precision or PEST_RESNET_PRECISION)
+    load_seconds = time.perf_counter() - start
+    
+    warmup = bundle.pop('warmup')
+    warmup_ms = []
+    for _ in range(max(1, PEST_WARMUP_RUNS)):
+        t0 = time.perf_counter()
+        warmup()
+        warmup_ms.append((time.perf_counter() - t0) * 1000)
+    
+    bundle['name'] = "resnet50_imagenet_v2"
+    pest_model_info = {
+        "loaded": True,
+        "model": bundle['name'],
+        "backend": bundle['backend'],
+        "precision": bundle['precision'],
+        "load_seconds": round(load_seconds, 3),
+        "cold_latency_ms": round(warmup_ms[0], 2),
+        "warm_latency_ms": round(warmup_ms[-1], 2),
+        "threads": bundle.pop('threads')
+    }
+    print(f"[ML] ResNet50 pest model ({bundle['backend']}) ready in {load_seconds:.2f}s "
+          f"(cold {warmup_ms[0]:.0f} ms, warm {warmup_ms[-1]:.0f} ms)")
+    return bundle
+
+
+model_registry.register(PEST_RESNET, _build_pest_resnet,
+                        policy="lazy" if inference_pool.serves("pest_resnet") else load_policy("PEST_RESNET_LOAD_POLICY"),
+                        precision=PEST_RESNET_PRECISION)
+
+
+def _load_pest_resnet():
+    """Take this module's reference to the shared ResNet50 (loaded on first use)"""
+    global pest_resnet
+    with _pest_hold_lock:
+        if pest_resnet is None:
+            pest_resnet = model_registry.acquire(PEST_RESNET, on_idle=_release_pest_resnet)
+        return pest_resnet
+
+
+def _release_pest_resnet():
+    """Registry idle hook (lazy policy); requests in flight keep their own reference"""
+    global pest_resnet
+    with _pest_hold_lock:
+        if pest_resnet is None:
+            return False
+        pest_resnet = None
+    model_registry.release(PEST_RESNET, on_idle=_release_pest_resnet)
+    return True
+
+
+def _load_disease_detector():
+    """Take this module's reference to the shared disease ViT (loaded on first use)"""
+    global disease_detector
+    with _disease_hold_lock:
+        if disease_detector is None:
+            disease_detector = model_registry.acquire(DISEASE_VIT, on_idle=_release_disease_detector)
+        return disease_detector
+
+
+def _release_disease_detector():
+    """Registry idle hook, as for the ResNet50"""
+    global disease_detector
+    with _disease_hold_lock:
+        if disease_detector is None:
+            return False
+        disease_detector = None
+    model_registry.release(DISEASE_VIT, on_idle=_release_disease_detector)
+    return True
+
+
+def get_pest_model_info():
+    """Load time plus steady-state latency over the recent request window"""
+    info = dict(pest_model_info)
+    latency = model_registry.latency_stats(PEST_RESNET)
+    if latency:
+        info["latency_ms"] = latency
+    return info
+
+
+def get_inference_executor():
+    """Thread pool (INFERENCE_WORKERS threads) used for concurrent image-model inference"""
+    global _inference_executor
+    if _inference_executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _inference_executor = ThreadPoolExecutor(max_workers=max(1, INFERENCE_WORKERS),
+                                                 thread_name_prefix="inference")
+    return _inference_executor
+
+
+def timed_call(fn, *args, **kwargs):
+    """(fn result, wall time in ms) - for per-model timings of executor jobs"""
+    import time
+    
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, round((time.perf_counter() - start) * 1000, 2)
+
+
 def predict_pest_vit(image_bytes):
     """
     Predict pest using ViT model (google/vit-base-patch16-224)
@@ -184,7 +793,8 @@ def predict_pest(image_bytes, model='resnet50'):
     Predict pest from image using ML model
     
     Args:
-        image_bytes: Raw image bytes
+        image_bytes: Raw image bytes, or an image decoded by load_image
+                     (ResNet50 only; the ViT predictor takes bytes)
         model: Model to use ('resnet50' or 'vit')
         
     Returns:
@@ -194,50 +804,44 @@ def predict_pest(image_bytes, model='resnet50'):
     if model == 'vit':
         return predict_pest_vit(image_bytes)
     
-    # Default: ResNet50
+    # Default: ResNet50 (resident model from load_models)
     try:
-        # Import PyTorch and Torchvision
-        import torch
-        from torchvision import models, transforms
-        import json
+        import time
         
-        # Open and validate image
-        img = Image.open(io.BytesIO(image_bytes))
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-            
-        # Define preprocessing transform
-        preprocess = transforms.Compose([
-            transforms.Resize(256),
-            transforms.CenterCrop(224),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-        ])
-        
-        # Preprocess image
-        input_tensor = preprocess(img)
-        input_batch = input_tensor.unsqueeze(0)  # Add batch dimension
+        # In-process when the pool is off, doesn't serve it, or failed to start
+        pool = inference_pool.pool_for("pest_resnet")
+        resnet = None if pool else (pest_resnet or _load_pest_resnet())
         
-        # Load pre-trained ResNet50 model
-        weights = models.ResNet50_Weights.DEFAULT
-        model = models.resnet50(weights=weights)
-        model.eval()
+        # Decode (JPEG draft scale, EXIF orientation, RGB)
+        img = load_image(image_bytes)
         
-        # Run inference
-        with torch.no_grad():
-            output = model(input_batch)
+        start = time.perf_counter()
+        if pool:
+            class_id, confidence = pool.top1("pest_resnet", [img])[0]
+            categories = pool.labels["pest_resnet"]
+        elif resnet['backend'] == 'onnx':
+            class_id, confidence = resnet['model'].top1([img])[0]
+        else:
+            import torch
+            input_batch = torch.from_numpy(resnet['preprocessor']([img]))
             
-        # Get probabilities
-        probabilities = torch.nn.functional.softmax(output[0], dim=0)
-        
-        # Get top prediction
-        confidence, class_idx = torch.max(probabilities, 0)
-        confidence_pct = float(confidence.item()) * 100
+            # Run inference
+            with torch.inference_mode():
+                output = resnet['model'](input_batch)
+            
+            # Get probabilities
+            probabilities = torch.nn.functional.softmax(output[0], dim=0)
+            
+            # Get top prediction
+            confidence, class_idx = torch.max(probabilities, 0)
+            class_id, confidence = class_idx.item(), confidence.item()
+        model_registry.record_latency(PEST_RESNET, time.perf_counter() - start)
+        confidence_pct = float(confidence) * 100
         
         # Get specific class name
-        class_name = weights.meta["categories"][class_idx.item()]
-        
-        class_id = class_idx.item()
+        if resnet is not None:
+            categories = resnet['categories']
+        class_name = categories[class_id]
         
         is_insect = 300 <= class_id <= 399
         is_fungus_or_plant = 980 <= class_id <= 999
@@ -301,7 +905,7 @@ def predict_pest(image_bytes, model='resnet50'):
             "treatment": "torchvision not installed",
             "method": "error"
         }
-    except:
+    except Exception as e:
         return {
             "pest": "Processing Error",
             "confidence": 0,
@@ -430,7 +1034,7 @@ def predict_disease(image_bytes):
     Detect plant diseases from leaf images using Hugging Face model
     
     Args:
-        image_bytes: Raw image bytes
+        image_bytes: Raw image bytes, or an image decoded by load_image
         
     Returns:
         dict: {
@@ -442,9 +1046,19 @@ def predict_disease(image_bytes):
             'method': str
         }
     """
-    global disease_detector
+    # In-process when the pool is off, doesn't serve it, or failed to start
+    pool = inference_pool.pool_for("disease_vit")
+    
+    # Local reference: an idle release can't pull the model out mid-request
+    detector = disease_detector
+    if detector is None and pool is None:
+        # Lazy policy: first request takes the shared instance
+        try:
+            detector = _load_disease_detector()
+        except:
+            pass
     
-    if disease_detector is None:
+    if detector is None and pool is None:
         return {
             "disease": "Model Not Available",
             "crop": "Unknown",
@@ -455,28 +1069,36 @@ def predict_disease(image_bytes):
         }
     
     try:
-        from PIL import Image
-        import io
-        import torch
+        import time
         
         # Load and prepare image
-        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        
-        # Preprocess image
-        inputs = disease_detector['processor'](images=image, return_tensors="pt")
+        image = load_image(image_bytes)
         
-        # Predict
-        with torch.no_grad():
-            outputs = disease_detector['model'](**inputs)
-            logits = outputs.logits
-            predicted_class = logits.argmax(-1).item()
+        start = time.perf_counter()
+        if pool:
+            predicted_class, confidence = pool.top1("disease_vit", [image])[0]
+            disease_key = pool.labels["disease_vit"][predicted_class]
+        elif detector.get('backend') == 'onnx':
+            predicted_class, confidence = detector['model'].top1([image])[0]
+            disease_key = detector['labels'][predicted_class]
+        else:
+            import torch
             
-            # Get confidence score
-            probabilities = torch.nn.functional.softmax(logits, dim=-1)
-            confidence = probabilities[0][predicted_class].item()
-        
-        # Get disease name from model
-        disease_key = disease_detector['model'].config.id2label[predicted_class]
+            # Preprocess image
+            pixel_values = torch.from_numpy(detector['preprocessor']([image]))
+            
+            # Predict
+            with torch.no_grad():
+                logits = detector['forward'](pixel_values)
+                predicted_class = logits.argmax(-1).item()
+                
+                # Get confidence score
+                probabilities = torch.nn.functional.softmax(logits, dim=-1)
+                confidence = probabilities[0][predicted_class].item()
+            
+            # Get disease name from model
+            disease_key = detector['model'].config.id2label[predicted_class]
+        model_registry.record_latency(DISEASE_VIT, time.perf_counter() - start)
         
         # Parse disease name (format: "Crop___Disease_Name")
         parts = disease_key.split('___')
@@ -511,7 +1133,7 @@ def predict_disease(image_bytes):
             "is_healthy": False
         }
         
-    except:
+    except Exception as e:
         return {
             "disease": "Processing Error",
             "crop": "Unknown",
@@ -0,0 +1,411 @@
+"""
+In-process Model Registry
+=========================
+Single place that owns the heavy image models. Services resolve a model by
+name and get the one shared instance, so the disease ViT is loaded once no
+matter how many services use it.
+
+- acquire(name) loads on first use and bumps a reference count;
+  release(name) drops it. Per-request users wrap both in use(name).
+- A "lazy" model with no holders is unloaded once it has been idle for
+  MODEL_IDLE_UNLOAD_SECONDS (0 = as soon as the last holder releases).
+  Services that keep a long-lived reference pass on_idle to acquire(); the
+  registry calls it when the model goes idle so the service can release.
+- "eager" models are loaded at startup (by the services' background startup
+  tasks, or load_eager()) and stay resident.
+- stats() reports per-model load time, memory, precision and latency.
+
+MODEL_PRECISION=int8 (or per model, e.g. DISEASE_VIT_PRECISION=int8) serves
+dynamically quantized weights; check accuracy first with
+ml_models/plant_disease/src/quantization_check.py.
+
+DISEASE_VIT_GRAPH=trace serves a frozen TorchScript trace of the ViT,
+compile a torch.compile'd one (slow first call per shape - pair it with the
+startup warm-up); eager (default) runs the transformers module as is.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .onnx_backend import load_onnx_classifier, model_backend, DISEASE_VIT_ONNX
+from .image_preprocessing import ImagePreprocessor, hf_processor_config
+from . import inference_pool
+
+# Hugging Face plant disease classifier shared by ml_integration and keras_disease_service
+DISEASE_VIT = "wambugu71/crop_leaf_diseases_vit"
+
+LATENCY_WINDOW = int(os.getenv("MODEL_LATENCY_WINDOW", "200"))
+
+# Lazy models unused for this long are unloaded (0 = on last release)
+MODEL_IDLE_UNLOAD_SECONDS = float(os.getenv("MODEL_IDLE_UNLOAD_SECONDS", "300"))
+
+# "fp32" (default) or "int8"
+MODEL_PRECISION = os.getenv("MODEL_PRECISION", "fp32")
+PRECISIONS = ("fp32", "int8")
+
+# "eager" (default), "trace" (TorchScript) or "compile" (torch.compile)
+DISEASE_VIT_GRAPH = os.getenv("DISEASE_VIT_GRAPH", "eager").lower()
+GRAPH_MODES = ("eager", "trace", "compile")
+
+
+def model_precision(env_var: str) -> str:
+    """Precision for one model: its own env var, else MODEL_PRECISION."""
+    precision = os.getenv(env_var, MODEL_PRECISION).lower()
+    return precision if precision in PRECISIONS else "fp32"
+
+
+LOAD_POLICIES = ("lazy", "eager")
+
+
+def load_policy(env_var: str, default: str = "eager") -> str:
+    """Load policy for one model from its env var; a bad value warns and keeps the default."""
+    policy = os.getenv(env_var, default).strip().lower()
+    if policy not in LOAD_POLICIES:
+        print(f"[ML] WARNING: {env_var}={policy!r} is not one of {', '.join(LOAD_POLICIES)}; using {default}")
+        return default
+    return policy
+
+
+def _rss_bytes() -> Optional[int]:
+    """Current resident set size of this process, if it can be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+
+def _param_bytes(model: Any) -> Optional[int]:
+    """Bytes held by a torch module's parameters and buffers."""
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return int(sum(t.numel() * t.element_size() for t in tensors))
+    except Exception:
+        return None
+
+
+def quantize_dynamic_int8(model: Any) -> Any:
+    """Dynamic INT8 quantization of a torch module's Linear layers (weights
+    stored as int8, activations quantized on the fly; CPU only)."""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def logits_module(hf_model):
+    """Wrap a transformers classifier as a module that takes pixel_values and returns logits."""
+    import torch
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model(pixel_values=pixel_values).logits
+
+    return LogitsOnly(hf_model)
+
+
+def build_forward(hf_model, mode: str, input_size) -> Tuple[Callable, str]:
+    """
+    (pixel_values -> logits callable, mode actually used). trace freezes a
+    TorchScript trace (batch axis stays dynamic), compile wraps it in
+    torch.compile; either falls back to eager if the model will not convert.
+    """
+    import warnings
+    import torch
+
+    module = logits_module(hf_model).eval()
+    if mode == "trace":
+        try:
+            # Shape checks in the HF forward become constants; the batch axis is unaffected
+            with torch.inference_mode(), warnings.catch_warnings():
+                warnings.simplefilter("ignore", torch.jit.TracerWarning)
+                example = torch.zeros(1, 3, *input_size)
+                traced = torch.jit.freeze(torch.jit.trace(module, example, check_trace=False))
+            return traced, "trace"
+        except Exception as e:
+            print(f"[ML] TorchScript trace failed ({e}); running eager")
+    elif mode == "compile":
+        try:
+            return torch.compile(module, dynamic=True), "compile"
+        except Exception as e:
+            print(f"[ML] torch.compile failed ({e}); running eager")
+    return module, "eager"
+
+
+class _Entry:
+    def __init__(self, name, loader, policy, unloader, precision):
+        self.name = name
+        self.loader = loader
+        self.policy = policy
+        self.unloader = unloader
+        self.precision = precision
+        self.backend = None
+        self.graph = None
+        self.instance = None
+        self.refcount = 0
+        self.lock = threading.Lock()
+        self.load_seconds = None
+        self.rss_delta_bytes = None
+        self.param_bytes = None
+        self.loads = 0
+        self.last_error = None
+        self.calls = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.last_used = time.monotonic()
+        self.unloads = 0
+        # on_idle callbacks of long-lived holders
+        self.holders = []
+
+
+class ModelRegistry:
+    """Named, reference-counted single instances of loaded models."""
+
+    POLICIES = LOAD_POLICIES
+
+    def __init__(self, idle_unload_seconds: float = MODEL_IDLE_UNLOAD_SECONDS):
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self.idle_unload_seconds = idle_unload_seconds
+        self._reaper = None
+
+    def register(self, name: str, loader: Callable[[], Any], policy: str = "lazy",
+                 unloader: Optional[Callable[[Any], None]] = None, precision: str = "fp32"):
+        """Declare how to build a model; the first registration of a name wins."""
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown load policy: {policy}")
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(name, loader, policy, unloader, precision)
+            return self._entries[name]
+
+    def _entry(self, name: str) -> _Entry:
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Model not registered: {name}")
+        return entry
+
+    def _ensure_loaded(self, entry: _Entry):
+        if entry.instance is not None:
+            return entry.instance
+        with entry.lock:
+            if entry.instance is None:
+                rss_before = _rss_bytes()
+                start = time.perf_counter()
+                try:
+                    instance = entry.loader()
+                except Exception as e:
+                    entry.last_error = str(e)
+                    raise
+                entry.load_seconds = round(time.perf_counter() - start, 3)
+                rss_after = _rss_bytes()
+                if rss_before is not None and rss_after is not None:
+                    entry.rss_delta_bytes = rss_after - rss_before
+                model = instance.get("model") if isinstance(instance, dict) else instance
+                entry.param_bytes = _param_bytes(model)
+                if isinstance(instance, dict) and instance.get("precision"):
+                    # Loaders report what they actually serve (int8 may fall back to fp32)
+                    entry.precision = instance["precision"]
+                if isinstance(instance, dict):
+                    entry.backend = instance.get("backend", "torch")
+                    entry.graph = instance.get("graph")
+                entry.loads += 1
+                entry.last_error = None
+                entry.instance = instance
+                print(f"[ML] Registry loaded {entry.name} in {entry.load_seconds:.2f}s")
+        return entry.instance
+
+    def acquire(self, name: str, on_idle: Optional[Callable[[], bool]] = None):
+        """
+        Shared instance of a model (loaded on first use); pair with release().
+
+        on_idle, for holders that keep the instance, is called when a lazy
+        model has gone idle; it should release() and return True, or return
+        False to keep holding (e.g. a request is in flight).
+        """
+        entry = self._entry(name)
+        instance = self._ensure_loaded(entry)
+        with entry.lock:
+            entry.refcount += 1
+            entry.last_used = time.monotonic()
+            if on_idle is not None:
+                entry.holders.append(on_idle)
+        if entry.policy == "lazy":
+            self._start_reaper()
+        return instance
+
+    def release(self, name: str, on_idle: Optional[Callable[[], bool]] = None):
+        """Drop one reference (and the holder's on_idle hook)."""
+        entry = self._entry(name)
+        with entry.lock:
+            entry.refcount = max(0, entry.refcount - 1)
+            entry.last_used = time.monotonic()
+            if on_idle is not None and on_idle in entry.holders:
+                entry.holders.remove(on_idle)
+        if self.idle_unload_seconds <= 0:
+            self._unload_if_idle(entry)
+
+    @contextmanager
+    def use(self, name: str):
+        """Per-request reference: acquire for the duration of the block."""
+        instance = self.acquire(name)
+        try:
+            yield instance
+        finally:
+            self.release(name)
+
+    def _unload_if_idle(self, entry: _Entry) -> bool:
+        with entry.lock:
+            if entry.refcount > 0 or entry.policy != "lazy" or entry.instance is None:
+                return False
+            instance, entry.instance = entry.instance, None
+            entry.unloads += 1
+        if entry.unloader is not None:
+            entry.unloader(instance)
+        print(f"[ML] Registry unloaded idle model {entry.name}")
+        return True
+
+    def _start_reaper(self):
+        if self.idle_unload_seconds <= 0 or self._reaper is not None:
+            return
+        with self._lock:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap, name="model-registry-reaper", daemon=True)
+                self._reaper.start()
+
+    def _reap(self):
+        """Ask the holders of idle lazy models to let go, then unload them."""
+        interval = min(30.0, max(1.0, self.idle_unload_seconds / 4))
+        while True:
+            time.sleep(interval)
+            now = time.monotonic()
+            for entry in list(self._entries.values()):
+                if (entry.policy != "lazy" or entry.instance is None
+                        or now - entry.last_used < self.idle_unload_seconds):
+                    continue
+                for on_idle in list(entry.holders):
+                    try:
+                        on_idle()
+                    except Exception as e:
+                        print(f"[ML] Idle hook for {entry.name} failed: {e}")
+                self._unload_if_idle(entry)
+
+    def policy(self, name: str) -> str:
+        return self._entry(name).policy
+
+    def precision(self, name: str) -> str:
+        return self._entry(name).precision
+
+    def get(self, name: str):
+        """Loaded instance without taking a reference (None if not loaded)."""
+        entry = self._entries.get(name)
+        return entry.instance if entry is not None else None
+
+    def load_eager(self):
+        """Load every eager model; failures are recorded and skipped."""
+        for entry in list(self._entries.values()):
+            if entry.policy == "eager":
+                try:
+                    self._ensure_loaded(entry)
+                except Exception as e:
+                    print(f"[ML] Registry failed to load {entry.name}: {e}")
+
+    def record_latency(self, name: str, seconds: float):
+        entry = self._entries.get(name)
+        if entry is not None:
+            entry.calls += 1
+            entry.latencies.append(seconds)
+            entry.last_used = time.monotonic()
+
+    def latency_stats(self, name: str) -> Optional[dict]:
+        entry = self._entries.get(name)
+        latencies = sorted(entry.latencies.copy()) if entry is not None else []
+        if not latencies:
+            return None
+        return {
+            "window": len(latencies),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+            "p50": round(latencies[len(latencies) // 2] * 1000, 2),
+            "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "rss_bytes": _rss_bytes(),
+            "models": {
+                name: {
+                    "loaded": entry.instance is not None,
+                    "policy": entry.policy,
+                    "precision": entry.precision,
+                    "backend": entry.backend,
+                    "graph": entry.graph,
+                    "refcount": entry.refcount,
+                    "loads": entry.loads,
+                    "unloads": entry.unloads,
+                    "load_seconds": entry.load_seconds,
+                    "param_bytes": entry.param_bytes,
+                    "rss_delta_bytes": entry.rss_delta_bytes,
+                    "calls": entry.calls,
+                    "latency_ms": self.latency_stats(name),
+                    "last_error": entry.last_error,
+                }
+                for name, entry in list(self._entries.items())
+            },
+        }
+
+
+def load_hf_image_classifier(model_name: str, precision: str = "fp32", graph: str = "eager") -> dict:
+    """
+    Hugging Face image classifier in eval mode, as {'processor', 'preprocessor',
+    'model', 'forward', 'graph', 'name', 'precision'}; 'preprocessor' is the
+    shared NumPy pipeline configured from the HF processor and 'forward'
+    (pixel_values -> logits, built per `graph`) is what the serving path calls.
+    """
+    from transformers import AutoImageProcessor, AutoModelForImageClassification
+
+    processor = AutoImageProcessor.from_pretrained(model_name)
+    model = AutoModelForImageClassification.from_pretrained(model_name)
+    model.eval()
+    if precision == "int8":
+        try:
+            model = quantize_dynamic_int8(model)
+        except Exception as e:
+            print(f"[ML] INT8 quantization of {model_name} failed ({e}); serving fp32")
+            precision = "fp32"
+    preprocessor = ImagePreprocessor(hf_processor_config(processor))
+    forward, graph = build_forward(model, graph if graph in GRAPH_MODES else "eager",
+                                   (preprocessor.height, preprocessor.width))
+    return {"processor": processor, "preprocessor": preprocessor, "model": model, "forward": forward,
+            "graph": graph, "name": model_name, "precision": precision, "backend": "torch"}
+
+
+registry = ModelRegistry()
+
+_disease_vit_precision = model_precision("DISEASE_VIT_PRECISION")
+
+
+def _load_disease_vit() -> dict:
+    # ONNX graph when configured and exported, else transformers/torch
+    if model_backend("DISEASE_VIT_BACKEND") == "onnx":
+        try:
+            return load_onnx_classifier(DISEASE_VIT_ONNX, _disease_vit_precision)
+        except Exception as e:
+            print(f"[ML] ONNX {DISEASE_VIT} unavailable ({e}); using torch")
+    return load_hf_image_classifier(DISEASE_VIT, _disease_vit_precision, DISEASE_VIT_GRAPH)
+
+
+# Policy per model via env, e.g. DISEASE_VIT_LOAD_POLICY=lazy; with the
+# inference pool the workers hold the ViT, so this process never loads it
+registry.register(DISEASE_VIT, _load_disease_vit,
+                  policy="lazy" if inference_pool.serves("disease_vit") else load_policy("DISEASE_VIT_LOAD_POLICY"),
+                  precision=_disease_vit_precision)
@@ -0,0 +1,112 @@
+"""
+ONNX Runtime Image Classifiers
+==============================
+Serves the disease ViT and pest ResNet50 from the ONNX graphs written by
+ml_models/plant_disease/src/export_onnx.py, with onnxruntime and NumPy/PIL
+preprocessing only - no torch or transformers at runtime.
+
+Chosen with IMAGE_MODEL_BACKEND=onnx (or per model: DISEASE_VIT_BACKEND,
+PEST_RESNET_BACKEND). ONNX_THREADS sets intra-op threads (0 = onnxruntime
+default), ONNX_GRAPH_OPT the graph optimization level
+(disable / basic / extended / all).
+"""
+
+import json
+import os
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .image_preprocessing import ImagePreprocessor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ONNX_MODELS_DIR = os.path.join(BASE_DIR, "ml_models", "plant_disease", "models", "onnx")
+
+# "torch" (default) or "onnx"
+IMAGE_MODEL_BACKEND = os.getenv("IMAGE_MODEL_BACKEND", "torch")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+ONNX_GRAPH_OPT = os.getenv("ONNX_GRAPH_OPT", "all")
+
+GRAPH_OPT_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+# Exported graph names (<name>.onnx, <name>_int8.onnx, <name>.json)
+DISEASE_VIT_ONNX = "disease_vit"
+PEST_RESNET_ONNX = "pest_resnet50"
+
+
+def model_backend(env_var: str) -> str:
+    """Backend for one model: its own env var, else IMAGE_MODEL_BACKEND."""
+    backend = os.getenv(env_var, IMAGE_MODEL_BACKEND).lower()
+    return backend if backend in ("torch", "onnx") else "torch"
+
+
+def model_files(name: str, precision: str = "fp32") -> Tuple[str, str]:
+    """(graph path, metadata path); int8 uses the quantized graph when it was exported."""
+    meta_path = os.path.join(ONNX_MODELS_DIR, f"{name}.json")
+    if precision == "int8":
+        int8_path = os.path.join(ONNX_MODELS_DIR, f"{name}_int8.onnx")
+        if os.path.exists(int8_path):
+            return int8_path, meta_path
+    return os.path.join(ONNX_MODELS_DIR, f"{name}.onnx"), meta_path
+
+
+class OnnxImageClassifier:
+    """onnxruntime session plus the preprocessing recorded at export time."""
+
+    def __init__(self, model_path: str, meta_path: str, threads: int = ONNX_THREADS,
+                 graph_opt: str = ONNX_GRAPH_OPT):
+        import onnxruntime as ort
+
+        with open(meta_path, "r") as f:
+            self.meta = json.load(f)
+        self.labels: List[str] = self.meta["labels"]
+        self.config = self.meta["preprocess"]
+        self.model_path = model_path
+        self.precision = "int8" if model_path.endswith("_int8.onnx") else "fp32"
+
+        options = ort.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = getattr(
+            ort.GraphOptimizationLevel, GRAPH_OPT_LEVELS.get(graph_opt, "ORT_ENABLE_ALL"))
+        self.session = ort.InferenceSession(model_path, sess_options=options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+        self.preprocess = ImagePreprocessor(self.config)
+
+    def predict_proba(self, images: Sequence[Image.Image]) -> np.ndarray:
+        return self.proba_from_batch(self.preprocess(images))
+
+    def proba_from_batch(self, batch: np.ndarray) -> np.ndarray:
+        """Softmax probabilities for an already preprocessed (N, 3, H, W) batch."""
+        logits = self.session.run(None, {self.input_name: batch})[0]
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def top1(self, images: Sequence[Image.Image]) -> List[Tuple[int, float]]:
+        """[(class index, probability)] per image from one batched run."""
+        probabilities = self.predict_proba(images)
+        best = probabilities.argmax(axis=1)
+        return [(int(i), float(probabilities[row, i])) for row, i in enumerate(best)]
+
+
+def load_onnx_classifier(name: str, precision: str = "fp32") -> dict:
+    """Registry-style bundle for an exported graph: {'model', 'labels', 'name', 'precision', 'backend'}."""
+    model_path, meta_path = model_files(name, precision)
+    classifier = OnnxImageClassifier(model_path, meta_path)
+    return {
+        "model": classifier,
+        "labels": classifier.labels,
+        "name": name,
+        "precision": classifier.precision,
+        "backend": "onnx",
+    }
@@ -0,0 +1,151 @@
+"""
+Background Startup Loader
+=========================
+Loads the models in parallel worker threads after the server has started
+accepting traffic, and tracks per-model readiness for /api/v1/ready.
+
+Each task moves pending -> loading -> ready, or to "unavailable" (it ran
+but the model is not there, so the endpoint serves its fallback tier),
+"lazy" (it loads on first request) or "failed" (it raised). A task can
+wait for others (after=...), e.g. models the inference pool may serve.
+Endpoints check loading(...) and answer 503 with Retry-After, or fall
+back, while their model is still coming up.
+
+STARTUP_MODEL_LOADING=blocking waits for every task before serving, as the
+server did before; STARTUP_LOAD_WORKERS caps the loader threads (0 = one
+per task). STARTUP_RETRY_AFTER_SECONDS is the Retry-After hint.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# "background" (default) or "blocking"
+STARTUP_MODEL_LOADING = os.getenv("STARTUP_MODEL_LOADING", "background").lower()
+STARTUP_LOAD_WORKERS = int(os.getenv("STARTUP_LOAD_WORKERS", "0"))
+STARTUP_RETRY_AFTER_SECONDS = int(os.getenv("STARTUP_RETRY_AFTER_SECONDS", "10"))
+
+PENDING, LOADING, READY, UNAVAILABLE, LAZY, FAILED = "pending", "loading", "ready", "unavailable", "lazy", "failed"
+
+
+class _Task:
+    def __init__(self, name: str, loader: Callable[[], Any], after: Sequence[str]):
+        self.name = name
+        self.loader = loader
+        self.after = list(after)
+        self.finished = threading.Event()
+        self.state = PENDING
+        self.error = None
+        self.started = None
+        self.seconds = None
+
+
+class StartupLoader:
+    """Named load tasks run concurrently on a thread pool."""
+
+    def __init__(self):
+        self._tasks: Dict[str, _Task] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._done = threading.Event()
+        self._on_complete: List[Callable[[], None]] = []
+        self.started_at = None
+
+    def add(self, name: str, loader: Callable[[], Any], after: Sequence[str] = ()):
+        """
+        Declare a task; loader returns truthy when its model is ready, or
+        LAZY. It starts once the tasks named in `after` have finished, so
+        add those first.
+        """
+        with self._lock:
+            self._tasks[name] = _Task(name, loader, after)
+
+    def on_complete(self, callback: Callable[[], None]):
+        """Run callback (on a loader thread) once every task has finished."""
+        self._on_complete.append(callback)
+
+    def start(self):
+        """Submit every task and return immediately."""
+        self.started_at = time.perf_counter()
+        tasks = list(self._tasks.values())
+        if not tasks:
+            self._finish()
+            return
+        workers = STARTUP_LOAD_WORKERS if STARTUP_LOAD_WORKERS > 0 else len(tasks)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="startup-load")
+        for task in tasks:
+            self._executor.submit(self._run, task)
+        if STARTUP_MODEL_LOADING == "blocking":
+            self.wait()
+
+    def _run(self, task: _Task):
+        for name in task.after:
+            if name in self._tasks:
+                self._tasks[name].finished.wait()
+        task.state, task.started = LOADING, time.perf_counter()
+        try:
+            ok = task.loader()
+            task.state = LAZY if ok == LAZY else (READY if ok else UNAVAILABLE)
+        except Exception as e:
+            task.state, task.error = FAILED, str(e)
+            print(f"[ERROR] Startup load of {task.name} failed: {e}")
+        task.seconds = round(time.perf_counter() - task.started, 3)
+        task.finished.set()
+        print(f"[ML] Startup: {task.name} {task.state} in {task.seconds:.2f}s")
+
+        with self._lock:
+            finished = all(t.state not in (PENDING, LOADING) for t in self._tasks.values())
+        if finished and not self._done.is_set():
+            self._finish()
+
+    def _finish(self):
+        with self._lock:
+            if self._done.is_set():
+                return
+            self._done.set()
+        for callback in self._on_complete:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[WARN] Startup completion callback failed: {e}")
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def state(self, name: str) -> Optional[str]:
+        task = self._tasks.get(name)
+        return task.state if task is not None else None
+
+    def loading(self, *names: str) -> bool:
+        """True while any of the named tasks has not finished (unknown names count as done)."""
+        return any(self.state(name) in (PENDING, LOADING) for name in names)
+
+    def retry_after(self) -> int:
+        return STARTUP_RETRY_AFTER_SECONDS
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.perf_counter()
+        models = {}
+        for name, task in list(self._tasks.items()):
+            elapsed = task.seconds
+            if elapsed is None and task.started is not None:
+                elapsed = round(now - task.started, 3)
+            models[name] = {"state": task.state, "seconds": elapsed, "error": task.error}
+        return {
+            "ready": self.done(),
+            "mode": STARTUP_MODEL_LOADING,
+            "uptime_seconds": round(now - self.started_at, 3) if self.started_at is not None else None,
+            "models": models,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+loader = StartupLoader()
@@ -0,0 +1,216 @@
+"""
+YOLO Leaf Localization (Tier 0)
+===============================
+Finds individual leaves in a field photo with the YOLOv8n model trained by
+ml_models/plant_disease/src/train_yolo.py, so each leaf can be classified
+by the ViT on its own crop instead of the whole frame.
+
+Runs the ONNX export (yolov8n_plant_disease.onnx) through onnxruntime with
+NumPy letterboxing and NMS - CPU only, no torch on this path. Without the
+ONNX file it falls back to the .pt weights through ultralytics.
+
+LEAF_LOCALIZATION=auto (default) enables it when a model file exists, off
+disables it. YOLO_IMGSZ / YOLO_CONF / YOLO_IOU / YOLO_MAX_LEAVES tune the
+detector, YOLO_THREADS the onnxruntime intra-op threads (0 = default).
+"""
+
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from PIL import Image
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+YOLO_MODELS_DIR = os.path.join(BASE_DIR, "ml_models", "plant_disease", "models")
+YOLO_ONNX_PATH = os.path.join(YOLO_MODELS_DIR, "yolov8n_plant_disease.onnx")
+YOLO_PT_PATH = os.path.join(YOLO_MODELS_DIR, "yolov8n_plant_disease.pt")
+YOLO_CLASS_NAMES_PATH = os.path.join(YOLO_MODELS_DIR, "class_names.json")
+
+LEAF_LOCALIZATION = os.getenv("LEAF_LOCALIZATION", "auto").lower()
+YOLO_IMGSZ = int(os.getenv("YOLO_IMGSZ", "640"))
+YOLO_CONF = float(os.getenv("YOLO_CONF", "0.25"))
+YOLO_IOU = float(os.getenv("YOLO_IOU", "0.45"))
+YOLO_MAX_LEAVES = int(os.getenv("YOLO_MAX_LEAVES", "8"))
+YOLO_THREADS = int(os.getenv("YOLO_THREADS", "0"))
+
+_detector = None
+_status = {"yolo_loaded": False, "backend": None, "load_seconds": None, "error": None}
+
+
+def model_exists() -> bool:
+    return os.path.exists(YOLO_ONNX_PATH) or os.path.exists(YOLO_PT_PATH)
+
+
+def enabled() -> bool:
+    return LEAF_LOCALIZATION != "off" and model_exists()
+
+
+def _class_names(count: int) -> List[str]:
+    try:
+        with open(YOLO_CLASS_NAMES_PATH, "r") as f:
+            names = json.load(f)
+        if len(names) == count:
+            return list(names)
+    except Exception:
+        pass
+    return [f"leaf_{i}" for i in range(count)]
+
+
+def letterbox(img: Image.Image, size: int):
+    """Resize keeping aspect ratio and pad to size x size (YOLO gray 114); returns (array, scale, pad)."""
+    width, height = img.size
+    scale = min(size / width, size / height)
+    new_w, new_h = max(1, round(width * scale)), max(1, round(height * scale))
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+
+    canvas = Image.new("RGB", (size, size), (114, 114, 114))
+    canvas.paste(img.resize((new_w, new_h), Image.BILINEAR), (pad_x, pad_y))
+    return np.asarray(canvas), scale, (pad_x, pad_y)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou: float, limit: int) -> List[int]:
+    """Greedy class-agnostic non-maximum suppression over xyxy boxes."""
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size and len(keep) < limit:
+        best = order[0]
+        keep.append(int(best))
+        rest = order[1:]
+        x1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+        overlap = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        ratio = overlap / (areas[best] + areas[rest] - overlap + 1e-9)
+        order = rest[ratio <= iou]
+    return keep
+
+
+class OnnxLeafDetector:
+    """YOLOv8 ONNX graph: (1, 3, S, S) in 0-1 -> (1, 4 + classes, anchors) of cx, cy, w, h, class scores."""
+
+    backend = "onnx"
+
+    def __init__(self, path: str, threads: int = YOLO_THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        shape = self.session.get_inputs()[0].shape
+        # Static exports carry their input size; dynamic ones use YOLO_IMGSZ
+        self.imgsz = shape[2] if isinstance(shape[2], int) else YOLO_IMGSZ
+        classes = self.session.get_outputs()[0].shape[1]
+        self.names = _class_names(classes - 4 if isinstance(classes, int) else 0)
+
+    def __call__(self, img: Image.Image, conf: float, iou: float, limit: int) -> List[Dict[str, Any]]:
+        pixels, scale, (pad_x, pad_y) = letterbox(img, self.imgsz)
+        batch = np.ascontiguousarray(pixels.transpose(2, 0, 1)[None], dtype=np.float32)
+        batch *= 1.0 / 255.0
+        output = self.session.run(None, {self.input_name: batch})[0][0].T   # (anchors, 4 + classes)
+
+        class_scores = output[:, 4:]
+        classes = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(classes)), classes]
+        mask = scores >= conf
+        if not mask.any():
+            return []
+        xywh, scores, classes = output[mask, :4], scores[mask], classes[mask]
+
+        boxes = np.empty_like(xywh)
+        boxes[:, 0] = (xywh[:, 0] - xywh[:, 2] / 2 - pad_x) / scale
+        boxes[:, 1] = (xywh[:, 1] - xywh[:, 3] / 2 - pad_y) / scale
+        boxes[:, 2] = (xywh[:, 0] + xywh[:, 2] / 2 - pad_x) / scale
+        boxes[:, 3] = (xywh[:, 1] + xywh[:, 3] / 2 - pad_y) / scale
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, img.width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, img.height)
+
+        return [
+            {"bbox": boxes[i].tolist(), "confidence": float(scores[i]),
+             "label": self.names[int(classes[i])] if int(classes[i]) < len(self.names) else str(int(classes[i]))}
+            for i in nms(boxes, scores, iou, limit)
+        ]
+
+
+class UltralyticsLeafDetector:
+    """Fallback for the .pt weights when no ONNX export exists."""
+
+    backend = "ultralytics"
+
+    def __init__(self, path: str):
+        from ultralytics import YOLO
+
+        self.model = YOLO(path)
+        self.imgsz = YOLO_IMGSZ
+
+    def __call__(self, img: Image.Image, conf: float, iou: float, limit: int) -> List[Dict[str, Any]]:
+        result = self.model.predict(img, imgsz=self.imgsz, conf=conf, iou=iou, max_det=limit,
+                                    agnostic_nms=True, device="cpu", verbose=False)[0]
+        names = result.names
+        return [
+            {"bbox": box.tolist(), "confidence": float(score), "label": names[int(cls)]}
+            for box, score, cls in zip(result.boxes.xyxy.numpy(), result.boxes.conf.numpy(),
+                                       result.boxes.cls.numpy())
+        ]
+
+
+def load_model() -> bool:
+    """Load the leaf detector once (ONNX preferred)."""
+    global _detector
+    if _detector is not None:
+        return True
+    if not enabled():
+        return False
+
+    start = time.perf_counter()
+    try:
+        if os.path.exists(YOLO_ONNX_PATH):
+            _detector = OnnxLeafDetector(YOLO_ONNX_PATH)
+        else:
+            _detector = UltralyticsLeafDetector(YOLO_PT_PATH)
+    except Exception as e:
+        _status["error"] = str(e)
+        print(f"[ML] YOLO leaf detector load failed: {e}")
+        return False
+
+    _status.update({"yolo_loaded": True, "backend": _detector.backend,
+                    "load_seconds": round(time.perf_counter() - start, 3), "error": None})
+    print(f"[ML] YOLO leaf detector ({_detector.backend}) ready in {_status['load_seconds']:.2f}s")
+    return True
+
+
+def is_ready() -> bool:
+    return _detector is not None
+
+
+def detect_leaves(img: Image.Image, conf: float = None, iou: float = None,
+                  limit: int = None) -> List[Dict[str, Any]]:
+    """
+    Leaf boxes in `img`, highest confidence first
+
+    Returns:
+        list: [{'bbox': [x1, y1, x2, y2] in img pixels, 'confidence', 'label'}]
+    """
+    if _detector is None and not load_model():
+        return []
+    return _detector(img, YOLO_CONF if conf is None else conf, YOLO_IOU if iou is None else iou,
+                     YOLO_MAX_LEAVES if limit is None else limit)
+
+
+def get_model_status() -> Dict[str, Any]:
+    return {
+        **_status,
+        "model_exists": model_exists(),
+        "enabled": enabled(),
+        "model_path": YOLO_ONNX_PATH if os.path.exists(YOLO_ONNX_PATH) else YOLO_PT_PATH,
+        "imgsz": _detector.imgsz if _detector is not None else YOLO_IMGSZ,
+        "conf": YOLO_CONF,
+        "iou": YOLO_IOU,
+        "max_leaves": YOLO_MAX_LEAVES,
+    }
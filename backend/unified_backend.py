@@ -13,9 +13,9 @@ os.environ["PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION"] = "python"
 from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, EmailStr, validator
-from typing import Optional, List, Dict
+from fastapi.responses import FileResponse, JSONResponse
+from pydantic import BaseModel, EmailStr, validator, ValidationError
+from typing import Optional, List, Dict, Any
 import uuid
 import re
 import sqlite3
@@ -27,6 +27,9 @@ import time
 
 # ML Integration
 from services import ml_integration
+from services.model_registry import registry as model_registry
+from services import inference_pool
+from services.startup_loader import loader as startup_loader
 ML_ENABLED = True
 
 # Translation Service
@@ -44,8 +47,13 @@ try:
 except Exception as e:
     AGRI_CHAT_ENABLED = False
 
-# YOLO Service (Removed as per user request)
-YOLO_ENABLED = False
+# YOLO leaf localization (per-leaf ViT crops; needs the model from train_yolo.py)
+try:
+    from services import yolo_disease_service
+    YOLO_ENABLED = True
+except Exception as e:
+    print(f"[WARN] Failed to import yolo_disease_service: {e}")
+    YOLO_ENABLED = False
 
 # Keras Plant Disease Service (EfficientNetB4)
 try:
@@ -155,33 +163,37 @@ def init_database():
 # ============ FASTAPI APP ============
 from contextlib import asynccontextmanager
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Initialization status tracking
-    db_ok = True
-    try:
-        init_database()
-    except Exception as e:
-        db_ok = False
-        print(f"[ERROR] Database connection failed: {e}")
+def _load_llm() -> bool:
+    # Checks Gemini API Key / Ollama
+    return AGRI_CHAT_ENABLED and agri_chat_service.load_agri_chat_model()
 
-    llm_ok = False
-    if AGRI_CHAT_ENABLED:
-        llm_ok = agri_chat_service.load_agri_chat_model()  # Checks Gemini API Key
+def _load_inference_pool() -> bool:
+    # Optional worker processes for the image models (INFERENCE_POOL_WORKERS)
+    return inference_pool.get_pool() is not None
 
-    # Verify local Keras models
+def _load_disease_models() -> bool:
+    # Verify local Keras models (ViT + cascade stage 1), then warm it up
     keras_ok = False
     if KERAS_ENABLED:
-        try:
-            keras_disease_service.load_keras_model()
-            keras_ok = keras_disease_service.is_ready()
-        except Exception as e:
-            print(f"[ERROR] Keras/ViT Model Loading Exception: {e}")
-            keras_ok = False
-
-
-    # Load Crop Recommendation Models
-    ml_integration.load_models()
+        keras_ok = keras_disease_service.load_keras_model()
+        if keras_ok:
+            try:
+                keras_disease_service.warmup()
+            except Exception as e:
+                print(f"[WARN] ViT warm-up failed: {e}")
+    # ml_integration's reference to the same shared instance (or the pool)
+    state = ml_integration.load_disease_model()
+    return True if keras_ok else state
+
+def _load_crop_models() -> bool:
+    crop_ok = ml_integration.load_crop_models()
+    ml_integration.start_crop_model_watcher()
+    return crop_ok
+
+def _print_startup_summary(db_ok: bool):
+    models = startup_loader.stats()["models"]
+    llm_ok = models.get("llm", {}).get("state") == "ready"
+    keras_ok = KERAS_ENABLED and keras_disease_service.is_ready()
     crop_ok = ml_integration.get_crop_model_status()
 
     # Final Consolidated Status
@@ -190,8 +202,10 @@ async def lifespan(app: FastAPI):
         print(" [OK] AGROMIND-AI CONNECTED SUCCESSFULLY")
         print(f" - LLM: Gemini 3 Flash Preview (Cloud)")
         print(f" - Disease Models: {int(keras_ok)}/1 Ready")
+        warmup = keras_disease_service.get_warmup_info() if KERAS_ENABLED else {}
+        for size, timing in warmup.get("batches", {}).items():
+            print(f"   ViT batch {size}: cold {timing['cold_ms']:.0f} ms -> warm {timing['warm_ms']:.0f} ms")
         print(f" - Crop Model: {'Ready' if crop_ok else 'Fallback Mode'}")
-        print("="*40 + "\n")
     else:
         print("\n" + "!"*40)
         print(" [WARN] AGROMIND-AI PARTIALLY CONNECTED")
@@ -199,11 +213,46 @@ async def lifespan(app: FastAPI):
         if not llm_ok: print(" - LLM (Gemini API): NOT CONNECTED")
         if not keras_ok: print(" - Disease Analysis (ViT/Local): FAILED TO LOAD")
         if not crop_ok: print(" - Crop Model: LOADED FALLBACK ONLY")
+    for name, model in models.items():
+        print(f" - {name}: {model['state']} ({model['seconds']:.1f}s)")
+    print(("="*40 if db_ok and llm_ok and keras_ok and crop_ok else "!"*40) + "\n")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Initialization status tracking
+    db_ok = True
+    try:
+        init_database()
+    except Exception as e:
+        db_ok = False
+        print(f"[ERROR] Database connection failed: {e}")
 
-        print("!"*40 + "\n")
+    # Models load concurrently in the background; the server accepts traffic
+    # right away and /api/v1/ready reports each one (STARTUP_MODEL_LOADING)
+    startup_loader.add("llm", _load_llm)
+    if inference_pool.enabled():
+        startup_loader.add("inference_pool", _load_inference_pool)
+    # Image models wait for the pool: they run there when it is up, here when not
+    startup_loader.add("disease_vit", _load_disease_models, after=("inference_pool",))
+    startup_loader.add("pest_resnet", ml_integration.load_pest_models, after=("inference_pool",))
+    startup_loader.add("crop_model", _load_crop_models)
+    # Leaf detector for multi-leaf photos (skipped when no YOLO model is present)
+    if YOLO_ENABLED and yolo_disease_service.enabled():
+        startup_loader.add("yolo", yolo_disease_service.load_model)
+    startup_loader.on_complete(lambda: _print_startup_summary(db_ok))
+    startup_loader.start()
 
     yield
     # Shutting down Agromind AI Backend...
+    startup_loader.shutdown()
+    ml_integration.stop_crop_model_watcher()
+    inference_pool.shutdown()
+
+def _require_loaded(*names: str):
+    """503 + Retry-After while any of these startup tasks is still loading."""
+    if startup_loader.loading(*names):
+        raise HTTPException(status_code=503, detail=f"Model still loading: {', '.join(names)}",
+                            headers={"Retry-After": str(startup_loader.retry_after())})
 
 app = FastAPI(title="Agromind AI Backend", lifespan=lifespan)
 
@@ -249,6 +298,27 @@ class AnswerCreate(BaseModel):
 class CropRecommendationRequest(BaseModel):
     N: float; P: float; K: float
     temperature: float; humidity: float; ph: float; rainfall: float
+    top_k: int = 3
+
+class SimilarFarmsRequest(CropRecommendationRequest):
+    k: int = 5
+
+class SweepAxis(BaseModel):
+    feature: str
+    start: float
+    stop: float
+    steps: int = 20
+
+class CropSweepRequest(BaseModel):
+    base: CropRecommendationRequest
+    vary: List[SweepAxis]
+    crops: Optional[List[str]] = None
+
+# Upper bound on grid points per what-if sweep (product of axis steps)
+MAX_CROP_SWEEP_POINTS = int(os.getenv("MAX_CROP_SWEEP_POINTS", "10000"))
+
+# Upper bound on rows per batch request (soil-test sheets from co-ops)
+MAX_CROP_BATCH_ROWS = int(os.getenv("MAX_CROP_BATCH_ROWS", "100000"))
 
 class TranslateRequest(BaseModel):
     text: str
@@ -305,23 +375,185 @@ async def get_current_user(current_user_id: str = Depends(get_current_user_id)):
         return dict(user)
 
 # ============ ML ENDPOINTS ============
+def _validate_top_k(top_k: int):
+    """422 unless 1 <= top_k <= number of crops the active model ranks."""
+    n_classes = ml_integration.get_crop_class_count()
+    if top_k < 1 or (n_classes is not None and top_k > n_classes):
+        raise HTTPException(status_code=422, detail=f"top_k must be between 1 and {n_classes or 'the number of crops'}")
+
 @app.post("/api/v1/ml/crop-recommendation")
 async def get_crop_recommendation(request: CropRecommendationRequest):
     if not ML_ENABLED: raise HTTPException(status_code=503, detail="ML disabled")
+    _validate_top_k(request.top_k)
     try:
         return ml_integration.predict_crop(N=request.N, P=request.P, K=request.K, 
                                         temperature=request.temperature, humidity=request.humidity, 
-                                        ph=request.ph, rainfall=request.rainfall)
+                                        ph=request.ph, rainfall=request.rainfall, top_k=request.top_k)
     except Exception as e: raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/v1/ml/crop-recommendation/model")
+async def crop_recommendation_model_info():
+    return ml_integration.get_crop_model_info()
+
+@app.get("/api/v1/ml/crop-recommendation/cache")
+async def crop_recommendation_cache_stats():
+    return ml_integration.get_crop_cache_stats()
+
+@app.post("/api/v1/ml/crop-recommendation/similar")
+async def similar_farms(request: SimilarFarmsRequest):
+    if not ML_ENABLED: raise HTTPException(status_code=503, detail="ML disabled")
+    if not 1 <= request.k <= 100: raise HTTPException(status_code=422, detail="k must be between 1 and 100")
+    _require_loaded("crop_model")
+    _validate_top_k(request.top_k)
+    features = dict(N=request.N, P=request.P, K=request.K, temperature=request.temperature,
+                    humidity=request.humidity, ph=request.ph, rainfall=request.rainfall)
+    try:
+        similar = ml_integration.find_similar_farms(**features, k=request.k)
+    except Exception as e: raise HTTPException(status_code=500, detail=str(e))
+    if similar is None:
+        info = ml_integration.get_similar_farms_info()
+        raise HTTPException(status_code=503, detail=f"Similar-farms index unavailable: {info.get('error') or 'not built'}")
+    try:
+        return {
+            "prediction": ml_integration.predict_crop(**features, top_k=request.top_k),
+            "similar_farms": similar,
+            "index": ml_integration.get_similar_farms_info()
+        }
+    except Exception as e: raise HTTPException(status_code=500, detail=str(e))
+
+def _validate_crop_rows(rows: List[Any]):
+    """Split raw rows into valid feature vectors and per-row validation errors."""
+    import math
+    valid_idx, features, errors = [], [], []
+    for i, row in enumerate(rows):
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("Row must be an object with N, P, K, temperature, humidity, ph, rainfall")
+            req = CropRecommendationRequest(**row)
+            values = [getattr(req, name) for name in ml_integration.CROP_FEATURES]
+            if not all(math.isfinite(v) for v in values):
+                raise ValueError("All features must be finite numbers")
+        except ValidationError as e:
+            detail = "; ".join(f"{'.'.join(str(l) for l in err['loc'])}: {err['msg']}" for err in e.errors())
+            errors.append({"row": i, "error": detail})
+            continue
+        except (ValueError, TypeError) as e:
+            errors.append({"row": i, "error": str(e)})
+            continue
+        valid_idx.append(i)
+        features.append(values)
+    return valid_idx, features, errors
+
+async def _score_crop_rows(rows: List[Any]):
+    if not ML_ENABLED: raise HTTPException(status_code=503, detail="ML disabled")
+    if len(rows) > MAX_CROP_BATCH_ROWS:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_CROP_BATCH_ROWS} rows)")
+
+    valid_idx, features, errors = _validate_crop_rows(rows)
+
+    import asyncio
+    loop = asyncio.get_event_loop()
+    predictions = await loop.run_in_executor(None, ml_integration.predict_crop_batch, features)
+
+    results = [None] * len(rows)
+    for i, pred in zip(valid_idx, predictions):
+        results[i] = {"row": i, **pred}
+    for err in errors:
+        results[err["row"]] = err
+
+    return {
+        "results": results,
+        "total": len(rows),
+        "succeeded": len(valid_idx),
+        "failed": len(errors)
+    }
+
+@app.post("/api/v1/ml/crop-recommendation/sweep")
+async def get_crop_recommendation_sweep(request: CropSweepRequest):
+    if not ML_ENABLED: raise HTTPException(status_code=503, detail="ML disabled")
+    if not 1 <= len(request.vary) <= 2:
+        raise HTTPException(status_code=422, detail="vary must list one or two features")
+    names = [axis.feature for axis in request.vary]
+    unknown = [n for n in names if n not in ml_integration.CROP_FEATURES]
+    if unknown or len(set(names)) != len(names):
+        raise HTTPException(status_code=422, detail=f"vary features must be distinct and one of {', '.join(ml_integration.CROP_FEATURES)}")
+    if any(axis.steps < 2 for axis in request.vary):
+        raise HTTPException(status_code=422, detail="steps must be at least 2")
+    points = 1
+    for axis in request.vary: points *= axis.steps
+    if points > MAX_CROP_SWEEP_POINTS:
+        raise HTTPException(status_code=413, detail=f"Sweep too large: {points} points (max {MAX_CROP_SWEEP_POINTS})")
+    _require_loaded("crop_model")
+
+    import asyncio
+    import numpy as np
+    axes = [(axis.feature, np.linspace(axis.start, axis.stop, axis.steps)) for axis in request.vary]
+    base = request.base.model_dump()
+    loop = asyncio.get_event_loop()
+    try:
+        result = await loop.run_in_executor(None, ml_integration.predict_crop_sweep, base, axes, request.crops)
+    except Exception as e: raise HTTPException(status_code=500, detail=str(e))
+    if result is None: raise HTTPException(status_code=503, detail="Crop model not loaded")
+    return result
+
+@app.post("/api/v1/ml/crop-recommendation/batch")
+async def get_crop_recommendation_batch(rows: List[Any]):
+    try:
+        return await _score_crop_rows(rows)
+    except HTTPException: raise
+    except Exception as e: raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/v1/ml/crop-recommendation/batch-csv")
+async def get_crop_recommendation_batch_csv(file: UploadFile = File(...)):
+    import csv
+    try:
+        text = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV must be UTF-8 encoded")
+
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames:
+        raise HTTPException(status_code=400, detail="CSV has no header row")
+    missing = [c for c in ml_integration.CROP_FEATURES if c not in [f.strip() for f in reader.fieldnames]]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"CSV missing columns: {', '.join(missing)}")
+
+    # Empty cells become missing fields so they are reported per row
+    rows = [{k.strip(): v for k, v in r.items() if k and v not in (None, "")} for r in reader]
+    try:
+        return await _score_crop_rows(rows)
+    except HTTPException: raise
+    except Exception as e: raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/v1/ml/models")
+async def loaded_models_stats():
+    return model_registry.stats()
+
+@app.get("/api/v1/ml/pest-detection/model")
+async def pest_detection_model_info():
+    return ml_integration.get_pest_model_info()
+
 @app.post("/api/v1/ml/pest-detection")
 async def detect_pest_and_disease(image: UploadFile = File(...), model: str = Form('resnet50')):
     if not ML_ENABLED: raise HTTPException(status_code=503, detail="ML disabled")
     if not image.content_type.startswith("image/"): raise HTTPException(status_code=400, detail="Not an image")
+    _require_loaded("pest_resnet", "disease_vit")
     try:
         img_bytes = await image.read()
-        pest_res = ml_integration.predict_pest(img_bytes, model=model)
-        disease_res = ml_integration.predict_disease(img_bytes)
+        
+        # Decode once, then run both classifiers side by side on the inference pool
+        import asyncio
+        from services.image_preprocessing import load_image
+        loop = asyncio.get_event_loop()
+        executor = ml_integration.get_inference_executor()
+        start = time.perf_counter()
+        img, decode_ms = await loop.run_in_executor(executor, ml_integration.timed_call, load_image, img_bytes)
+        (pest_res, pest_ms), (disease_res, disease_ms) = await asyncio.gather(
+            loop.run_in_executor(executor, ml_integration.timed_call, ml_integration.predict_pest,
+                                 img_bytes if model == 'vit' else img, model),
+            loop.run_in_executor(executor, ml_integration.timed_call, ml_integration.predict_disease, img),
+        )
+        total_ms = round((time.perf_counter() - start) * 1000, 2)
         
         pest_conf = pest_res.get("confidence", 0)
         disease_conf = disease_res.get("confidence", 0)
@@ -340,7 +572,8 @@ async def detect_pest_and_disease(image: UploadFile = File(...), model: str = Fo
             "disease_detection": disease_res,
             "primary_issue": primary,
             "recommendation": recommendation,
-            "combined_confidence": max(pest_conf, disease_conf)
+            "combined_confidence": max(pest_conf, disease_conf),
+            "timings_ms": {"decode": decode_ms, "pest": pest_ms, "disease": disease_ms, "total": total_ms}
         }
     except Exception as e: raise HTTPException(status_code=500, detail=str(e))
 
@@ -357,24 +590,34 @@ async def detect_plant_diseases(
 ):
     if not image.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
+    # While the ViT loads the Gemini tier answers; without Gemini either, 503
+    if startup_loader.state("llm") != "ready":
+        _require_loaded("disease_vit")
 
     try:
         img_bytes = await image.read()
+        started = time.perf_counter()
         detections = None
         model_used = "None"
+        exit_stage = "none"
 
         # Tier 1: Keras (Primary leaf model)
-        if KERAS_ENABLED and keras_disease_service.is_ready():
+        # Runs off the event loop so concurrent requests can share a ViT batch
+        if KERAS_ENABLED and keras_disease_service.is_available():
             try:
-                detections = keras_disease_service.predict_disease(img_bytes)
+                import asyncio
+                loop = asyncio.get_event_loop()
+                detections = await loop.run_in_executor(None, keras_disease_service.predict_disease, img_bytes)
                 if detections:
                     # Implement Confidence Threshold for Tier 1 Fallback
+                    # (MobileNet cascade answers are already above CASCADE_FAST_THRESHOLD)
                     keras_conf = detections[0].get("confidence", 0.0)
-                    if keras_conf < 10.0:
-                        # Only fallback if ViT is extremely unsure (Threshold lowered from 15 -> 10)
+                    if keras_conf < keras_disease_service.disease_cascade.CASCADE_VIT_THRESHOLD:
+                        # Only fallback if ViT is extremely unsure (CASCADE_VIT_THRESHOLD, default 10)
                         detections = None
                     else:
                         model_used = "Keras (pwp)"
+                        exit_stage = keras_disease_service.exit_stage(detections)
             except:
                 pass
 
@@ -436,6 +679,7 @@ async def detect_plant_diseases(
                     "severity_percentage": severity_val
                 }]
                 model_used = "Gemini Expert Vision"
+                exit_stage = "gemini"
 
         # Step 2: Ensure AI Recommendations are populated if Keras was used
         if model_used == "Keras (pwp)":
@@ -450,6 +694,9 @@ async def detect_plant_diseases(
             for det in detections:
                 det["severity_percentage"] = det.get("confidence", 85.0)
 
+        if KERAS_ENABLED:
+            keras_disease_service.record_cascade_exit(exit_stage, time.perf_counter() - started)
+
         # Step 3: Return final result (Gemini results already have recommendations)
         return {
             "success": True,
@@ -468,9 +715,25 @@ async def detect_plant_diseases(
 
 @app.get("/api/v1/ml/detect/status")
 async def yolo_model_status():
+    # Precision actually served by each image model (fp32 / int8)
+    precision = {
+        "disease_vit": model_registry.precision(ml_integration.DISEASE_VIT),
+        "pest_resnet": model_registry.precision(ml_integration.PEST_RESNET),
+    }
+    warmup = keras_disease_service.get_warmup_info() if KERAS_ENABLED else {"done": False}
+    # Serving stats of the detect pipeline, one sub-object each
+    disabled = {"enabled": False}
+    stats = {
+        "precision": precision,
+        "vit_warmup": warmup,
+        "batching": keras_disease_service.get_batching_stats() if KERAS_ENABLED else disabled,
+        "cache": keras_disease_service.get_cache_stats() if KERAS_ENABLED else disabled,
+        "cascade": keras_disease_service.get_cascade_stats() if KERAS_ENABLED else disabled,
+        "inference_pool": inference_pool.get_stats(),
+    }
     if YOLO_ENABLED:
-        return yolo_disease_service.get_model_status()
-    return {"yolo_loaded": False, "model_exists": False}
+        return {**yolo_disease_service.get_model_status(), **stats}
+    return {"yolo_loaded": False, "model_exists": False, **stats}
 
 # ============ TRANSLATION & CHATBOT ENDPOINTS ============
 @app.post("/api/v1/translate")
@@ -617,6 +880,14 @@ async def react_to_answer(answer_id: int, action: str, current_user_id: str = De
     return {column: count}
 
 # ============ ROOT & MAIN ============
+@app.get("/api/v1/ready")
+async def readiness():
+    # Per-model startup state; 503 until every background load has finished
+    stats = startup_loader.stats()
+    if stats["ready"]:
+        return stats
+    return JSONResponse(stats, status_code=503, headers={"Retry-After": str(startup_loader.retry_after())})
+
 # Root API status moved to /api/v1/status to avoid conflict with frontend
 @app.get("/api/v1/status")
 async def api_status(): 